@@ -0,0 +1,377 @@
+"""
+Helpers for Alembic migrations that change large tables without
+blocking writes to them.
+
+Plain op.create_index() and op.add_column() hold a lock on the table
+for the whole statement, the helpers split such changes into steps that
+only take short locks:
+
+- create_index_concurrently() builds an index while the table stays
+  writable
+- backfill() updates the rows in small committed batches and records
+  a checkpoint after every batch, so an interrupted migration continues
+  where it stopped
+- expand_column() and contract_column() swap a column in two releases:
+  the new column is added and kept in sync by a trigger, the code moves
+  to it, and a later migration drops the old one
+
+The helpers commit on their own and are meant for PostgreSQL. Every step
+can be repeated, so a failed migration is simply run again.
+"""
+
+import logging
+import time
+from typing import Optional, Sequence
+
+import sqlalchemy as sa
+
+from alembic import op
+
+logger = logging.getLogger("alembic.online_migrations")
+
+CHECKPOINTS_TABLE = "online_migration_checkpoints"
+LOCK_TIMEOUT = "2s"
+LOCK_ATTEMPTS = 10
+
+
+def _is_postgresql() -> bool:
+    return op.get_bind().dialect.name == "postgresql"
+
+
+def _is_offline() -> bool:
+    return op.get_context().as_sql
+
+
+def run_with_lock_timeout(
+    statement: str, lock_timeout: str = LOCK_TIMEOUT, attempts: int = LOCK_ATTEMPTS
+) -> None:
+    """
+    Runs a DDL statement that needs a short exclusive lock.
+
+    A statement waiting for its lock blocks every query queued behind it,
+    so it gives up after lock_timeout and is retried after a pause
+    instead of stalling the table behind a long transaction.
+
+    args:
+    statement: DDL to run, must be safe to repeat
+    lock_timeout: Longest wait for the lock per attempt
+    attempts: Number of attempts before the error is raised
+    """
+    if _is_offline() or not _is_postgresql():
+        op.execute(statement)
+        return
+
+    with op.get_context().autocommit_block():
+        for attempt in range(1, attempts + 1):
+            op.execute(f"SET lock_timeout = '{lock_timeout}'")
+            try:
+                op.execute(statement)
+                return
+            except sa.exc.OperationalError as exc:
+                if "lock timeout" not in str(exc) or attempt == attempts:
+                    raise
+                logger.info("Lock not acquired, retrying (%s/%s)", attempt, attempts)
+                time.sleep(attempt)
+            finally:
+                op.execute("RESET lock_timeout")
+
+
+def create_index_concurrently(
+    index_name: str, table_name: str, columns: Sequence[str], **kw
+) -> None:
+    """
+    Creates an index without blocking writes to the table.
+
+    An interrupted CREATE INDEX CONCURRENTLY leaves an invalid index
+    behind, such an index is dropped and built again.
+
+    args:
+    index_name: Name of the index
+    table_name: Indexed table
+    columns: Indexed columns or expressions
+    kw: Arguments of op.create_index(), e.g. unique or postgresql_where
+    """
+    if _is_offline() or not _is_postgresql():
+        op.create_index(index_name, table_name, columns, **kw)
+        return
+
+    with op.get_context().autocommit_block():
+        valid = op.get_bind().scalar(
+            sa.text(
+                "SELECT i.indisvalid FROM pg_index i "
+                "JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name"
+            ),
+            {"name": index_name},
+        )
+        if valid:
+            return
+        if valid is not None:
+            logger.info("Rebuilding invalid index %s", index_name)
+            op.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}")
+        op.create_index(
+            index_name, table_name, columns, postgresql_concurrently=True, **kw
+        )
+
+
+def drop_index_concurrently(index_name: str, table_name: str) -> None:
+    """Drops an index without blocking writes to the table"""
+    if _is_offline() or not _is_postgresql():
+        op.drop_index(index_name, table_name=table_name)
+        return
+
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            index_name,
+            table_name=table_name,
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def _ensure_checkpoints_table() -> None:
+    op.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {CHECKPOINTS_TABLE} (
+            name VARCHAR(100) PRIMARY KEY,
+            last_key BIGINT NOT NULL DEFAULT 0,
+            max_key BIGINT NOT NULL DEFAULT 0,
+            rows_done BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP NOT NULL DEFAULT now(),
+            finished_at TIMESTAMP
+        )
+        """
+    )
+
+
+def backfill(
+    name: str,
+    table_name: str,
+    assignments: str,
+    where: str = "TRUE",
+    batch_size: int = 1000,
+    pause: float = 0.1,
+    key: str = "id",
+) -> int:
+    """
+    Updates the rows of a table in batches ordered by an integer key.
+
+    Only the rows existing when the backfill starts are updated, rows
+    inserted later must already be written correctly, e.g. by the
+    trigger of expand_column(). Every batch is committed together with
+    its checkpoint, an interrupted backfill resumes after the last
+    committed batch. Between the batches
+    the backfill sleeps, so the updates leave room for the application's
+    queries and replication.
+
+    args:
+    name: Unique name of the backfill, identifies its checkpoint
+    table_name: Updated table
+    assignments: SET clause, e.g. "status_code = 1"
+    where: Condition of the rows to update
+    batch_size: Rows per batch and transaction
+    pause: Seconds to sleep between the batches
+    key: Unique integer column the batches are ordered by
+
+    returns:
+    int: Number of rows updated by this run
+    """
+    if _is_offline() or not _is_postgresql():
+        op.execute(f"UPDATE {table_name} SET {assignments} WHERE {where}")
+        return 0
+
+    batch = sa.text(
+        f"""
+        WITH batch AS (
+            SELECT {key} FROM {table_name}
+            WHERE {key} > :last_key AND {key} <= :max_key AND ({where})
+            ORDER BY {key}
+            LIMIT :batch_size
+        ), updated AS (
+            UPDATE {table_name} SET {assignments}
+            WHERE {key} IN (SELECT {key} FROM batch)
+            RETURNING {key}
+        )
+        UPDATE {CHECKPOINTS_TABLE}
+        SET last_key = coalesce((SELECT max({key}) FROM batch), last_key),
+            rows_done = rows_done + (SELECT count(*) FROM updated),
+            updated_at = now(),
+            finished_at = CASE
+                WHEN NOT EXISTS (SELECT 1 FROM batch) THEN now()
+            END
+        WHERE name = :name
+        RETURNING last_key, (SELECT count(*) FROM batch),
+            (SELECT count(*) FROM updated)
+        """
+    )
+
+    with op.get_context().autocommit_block():
+        bind = op.get_bind()
+        _ensure_checkpoints_table()
+        bind.execute(
+            sa.text(
+                f"INSERT INTO {CHECKPOINTS_TABLE} (name, max_key) "
+                f"SELECT :name, coalesce(max({key}), 0) FROM {table_name} "
+                "ON CONFLICT (name) DO NOTHING"
+            ),
+            {"name": name},
+        )
+        last_key, max_key, finished_at = bind.execute(
+            sa.text(
+                f"SELECT last_key, max_key, finished_at FROM {CHECKPOINTS_TABLE} "
+                "WHERE name = :name"
+            ),
+            {"name": name},
+        ).one()
+        if finished_at is not None:
+            return 0
+        if last_key:
+            logger.info("Backfill %s resumes after %s %s", name, key, last_key)
+
+        total = 0
+        while True:
+            last_key, selected, updated = bind.execute(
+                batch,
+                {
+                    "name": name,
+                    "last_key": last_key,
+                    "max_key": max_key,
+                    "batch_size": batch_size,
+                },
+            ).one()
+            if not selected:
+                break
+            total += updated
+            logger.info("Backfill %s: %s rows, %s %s", name, total, key, last_key)
+            time.sleep(pause)
+        return total
+
+
+def _sync_function(table_name: str, column_name: str) -> str:
+    return f"{table_name}_{column_name}_sync"
+
+
+def expand_column(
+    table_name: str,
+    column: sa.Column,
+    expression: str,
+    batch_size: int = 1000,
+    pause: float = 0.1,
+) -> None:
+    """
+    First half of a column swap: adds the new column, keeps it in sync
+    with the old ones through a trigger and backfills the existing rows.
+
+    The column is added as nullable, so only the table's catalog entry
+    changes. Make it NOT NULL with set_not_null() once it is filled.
+
+    The trigger only fills the new column when a write leaves it alone:
+    an insert without it or an update that does not change it. Code that
+    already writes the new column keeps its value, and the backfill skips
+    the rows that are filled.
+
+    args:
+    table_name: Changed table
+    column: New column
+    expression: SQL computing the new column from the other columns of
+    the row, e.g. "CASE status WHEN 'выполнена' THEN 2 ELSE 0 END"
+    batch_size: Rows per backfill batch
+    pause: Seconds to sleep between the backfill batches
+    """
+    column_type = column.type.compile(dialect=op.get_bind().dialect)
+    function = _sync_function(table_name, column.name)
+
+    run_with_lock_timeout(
+        f"ALTER TABLE {table_name} "
+        f"ADD COLUMN IF NOT EXISTS {column.name} {column_type}"
+    )
+    op.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+        BEGIN
+            IF (TG_OP = 'INSERT' AND NEW.{column.name} IS NULL)
+                OR (TG_OP = 'UPDATE'
+                    AND NEW.{column.name} IS NOT DISTINCT FROM OLD.{column.name})
+            THEN
+                NEW.{column.name} := (
+                    SELECT {expression} FROM (SELECT (NEW).*) AS src
+                );
+            END IF;
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """
+    )
+    # Replaced in one transaction, rows written in between would miss it
+    run_with_lock_timeout(
+        f"DROP TRIGGER IF EXISTS {function} ON {table_name}; "
+        f"CREATE TRIGGER {function} BEFORE INSERT OR UPDATE ON {table_name} "
+        f"FOR EACH ROW EXECUTE FUNCTION {function}()"
+    )
+    backfill(
+        name=function,
+        table_name=table_name,
+        assignments=f"{column.name} = {expression}",
+        where=f"{column.name} IS NULL",
+        batch_size=batch_size,
+        pause=pause,
+    )
+
+
+def set_not_null(table_name: str, column_name: str) -> None:
+    """
+    Makes a filled column NOT NULL without a long exclusive lock.
+
+    The rows are checked through a NOT VALID check constraint that is
+    validated under a lock allowing writes, SET NOT NULL then reuses
+    the validated constraint instead of scanning the table.
+    """
+    if _is_offline() or not _is_postgresql():
+        op.alter_column(table_name, column_name, nullable=False)
+        return
+
+    constraint = f"{table_name}_{column_name}_not_null"
+    run_with_lock_timeout(
+        f"ALTER TABLE {table_name} DROP CONSTRAINT IF EXISTS {constraint}"
+    )
+    run_with_lock_timeout(
+        f"ALTER TABLE {table_name} ADD CONSTRAINT {constraint} "
+        f"CHECK ({column_name} IS NOT NULL) NOT VALID"
+    )
+    run_with_lock_timeout(f"ALTER TABLE {table_name} VALIDATE CONSTRAINT {constraint}")
+    run_with_lock_timeout(
+        f"ALTER TABLE {table_name} ALTER COLUMN {column_name} SET NOT NULL"
+    )
+    run_with_lock_timeout(f"ALTER TABLE {table_name} DROP CONSTRAINT {constraint}")
+
+
+def contract_column(
+    table_name: str, old_column: str, new_column: str, rename: Optional[str] = None
+) -> None:
+    """
+    Second half of a column swap, shipped after no code reads the old
+    column any more: drops the sync trigger and the old column.
+
+    args:
+    table_name: Changed table
+    old_column: Column being replaced
+    new_column: Column added by expand_column()
+    rename: Name to give the new column, e.g. the name of the old one
+    """
+    function = _sync_function(table_name, new_column)
+    run_with_lock_timeout(f"DROP TRIGGER IF EXISTS {function} ON {table_name}")
+    op.execute(f"DROP FUNCTION IF EXISTS {function}()")
+    run_with_lock_timeout(
+        f"ALTER TABLE {table_name} DROP COLUMN IF EXISTS {old_column}"
+    )
+    if rename:
+        run_with_lock_timeout(
+            f"ALTER TABLE {table_name} RENAME COLUMN {new_column} TO {rename}"
+        )
+    if _is_postgresql() and not _is_offline():
+        _ensure_checkpoints_table()
+        op.execute(
+            sa.text(f"DELETE FROM {CHECKPOINTS_TABLE} WHERE name = :name").bindparams(
+                name=function
+            )
+        )
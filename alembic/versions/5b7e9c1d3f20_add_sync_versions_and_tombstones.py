@@ -0,0 +1,77 @@
+"""add sync versions and tombstones
+
+Revision ID: 5b7e9c1d3f20
+Revises: 8d2e4b6f1a07
+Create Date: 2026-10-19 12:41:08.517346
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e9c1d3f20'
+down_revision: Union[str, None] = '8d2e4b6f1a07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+VERSIONED_TABLES = ('tasks', 'categories', 'task_categories')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing rows start at version 1, the counter continues from there
+    op.create_table(
+        'change_counter',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('value', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.execute("INSERT INTO change_counter (id, value) VALUES (1, 1)")
+
+    for table in VERSIONED_TABLES:
+        op.add_column(
+            table,
+            sa.Column(
+                'updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=False
+            ),
+        )
+        op.add_column(
+            table,
+            sa.Column('version', sa.BigInteger(), server_default='1', nullable=False),
+        )
+        op.alter_column(table, 'updated_at', server_default=None)
+        op.alter_column(table, 'version', server_default=None)
+        op.create_index(op.f(f'ix_{table}_version'), table, ['version'], unique=False)
+
+    op.create_table(
+        'sync_tombstones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('entity', sa.String(length=20), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('related_id', sa.Integer(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('version', sa.BigInteger(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        op.f('ix_sync_tombstones_user_id'), 'sync_tombstones', ['user_id'], unique=False
+    )
+    op.create_index(
+        op.f('ix_sync_tombstones_version'), 'sync_tombstones', ['version'], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_sync_tombstones_version'), table_name='sync_tombstones')
+    op.drop_index(op.f('ix_sync_tombstones_user_id'), table_name='sync_tombstones')
+    op.drop_table('sync_tombstones')
+    for table in reversed(VERSIONED_TABLES):
+        op.drop_index(op.f(f'ix_{table}_version'), table_name=table)
+        op.drop_column(table, 'version')
+        op.drop_column(table, 'updated_at')
+    op.drop_table('change_counter')
@@ -0,0 +1,52 @@
+"""add category title search indexes
+
+Revision ID: a3c5e7f9b124
+Revises: f7b2d4e6a815
+Create Date: 2026-10-19 17:12:41.530271
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c5e7f9b124'
+down_revision: Union[str, None] = 'f7b2d4e6a815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _trgm_available() -> bool:
+    return bool(
+        op.get_bind().scalar(
+            sa.text(
+                "SELECT count(*) FROM pg_available_extensions WHERE name = 'pg_trgm'"
+            )
+        )
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_categories_title_prefix',
+        'categories',
+        ['title'],
+        postgresql_ops={'title': 'text_pattern_ops'},
+    )
+    # Substring matches of the typeahead, skipped where the contrib
+    # package is not installed
+    if _trgm_available():
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute(
+            'CREATE INDEX IF NOT EXISTS ix_categories_title_trgm '
+            'ON categories USING gin (title gin_trgm_ops)'
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('DROP INDEX IF EXISTS ix_categories_title_trgm')
+    op.drop_index('ix_categories_title_prefix', table_name='categories')
@@ -0,0 +1,71 @@
+"""add task archive
+
+Revision ID: b8d1f3a5c726
+Revises: a3c5e7f9b124
+Create Date: 2026-10-19 19:05:12.604417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from online_migrations import (
+    create_index_concurrently,
+    drop_index_concurrently,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d1f3a5c726'
+down_revision: Union[str, None] = 'a3c5e7f9b124'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'archived_tasks',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('title', sa.String(length=100), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('deadline', sa.DateTime(), nullable=True),
+        sa.Column('status', sa.String(length=15), nullable=True),
+        sa.Column('priority', sa.String(length=10), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_archived_tasks_user_id_id', 'archived_tasks', ['user_id', 'id']
+    )
+    op.create_table(
+        'archived_task_categories',
+        sa.Column('task_id', sa.Integer(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['task_id'], ['archived_tasks.id'], ondelete='CASCADE'
+        ),
+        sa.ForeignKeyConstraint(
+            ['category_id'], ['categories.id'], ondelete='CASCADE'
+        ),
+        sa.PrimaryKeyConstraint('task_id', 'category_id'),
+    )
+    # tasks is the hot table, its index is built without blocking writes
+    create_index_concurrently(
+        'ix_tasks_completed_updated_at',
+        'tasks',
+        ['updated_at'],
+        postgresql_where=sa.text("status = 'выполнена'"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    drop_index_concurrently('ix_tasks_completed_updated_at', 'tasks')
+    op.drop_table('archived_task_categories')
+    op.drop_index('ix_archived_tasks_user_id_id', table_name='archived_tasks')
+    op.drop_table('archived_tasks')
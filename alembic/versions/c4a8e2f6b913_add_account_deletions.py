@@ -0,0 +1,41 @@
+"""add account deletions
+
+Revision ID: c4a8e2f6b913
+Revises: 5b7e9c1d3f20
+Create Date: 2026-10-19 14:12:37.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4a8e2f6b913'
+down_revision: Union[str, None] = '5b7e9c1d3f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_tasks_user_id'), 'tasks', ['user_id'], unique=False)
+    op.create_table(
+        'account_deletions',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('requested_at', sa.DateTime(), nullable=False),
+        sa.Column('tasks_purged', sa.Integer(), nullable=False),
+        sa.Column('links_purged', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.Column('finished_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('user_id'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('account_deletions')
+    op.drop_index(op.f('ix_tasks_user_id'), table_name='tasks')
+    op.drop_column('users', 'deleted_at')
@@ -0,0 +1,68 @@
+"""add task recurrence
+
+Revision ID: c4e6a8b0d237
+Revises: b8d1f3a5c726
+Create Date: 2026-10-19 20:41:09.318562
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e6a8b0d237'
+down_revision: Union[str, None] = 'b8d1f3a5c726'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Nullable columns and a constant default only change the catalog,
+    # the rows of tasks are not rewritten
+    op.add_column(
+        'tasks', sa.Column('recurrence', sa.String(length=15), nullable=True)
+    )
+    op.add_column(
+        'tasks',
+        sa.Column(
+            'recurrence_interval',
+            sa.Integer(),
+            server_default='1',
+            nullable=False,
+        ),
+    )
+    op.add_column(
+        'tasks', sa.Column('recurrence_until', sa.DateTime(), nullable=True)
+    )
+    op.create_table(
+        'task_occurrences',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('task_id', sa.Integer(), nullable=False),
+        sa.Column('occurs_at', sa.DateTime(), nullable=False),
+        sa.Column('deadline', sa.DateTime(), nullable=False),
+        sa.Column('status', sa.String(length=15), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'uq_task_occurrences_task_id_occurs_at',
+        'task_occurrences',
+        ['task_id', 'occurs_at'],
+        unique=True,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        'uq_task_occurrences_task_id_occurs_at', table_name='task_occurrences'
+    )
+    op.drop_table('task_occurrences')
+    op.drop_column('tasks', 'recurrence_until')
+    op.drop_column('tasks', 'recurrence_interval')
+    op.drop_column('tasks', 'recurrence')
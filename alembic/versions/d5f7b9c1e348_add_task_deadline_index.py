@@ -0,0 +1,35 @@
+"""add task deadline index
+
+Revision ID: d5f7b9c1e348
+Revises: c4e6a8b0d237
+Create Date: 2026-10-19 21:27:53.146027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from online_migrations import (
+    create_index_concurrently,
+    drop_index_concurrently,
+)
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5f7b9c1e348'
+down_revision: Union[str, None] = 'c4e6a8b0d237'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    create_index_concurrently(
+        'ix_tasks_user_id_deadline', 'tasks', ['user_id', 'deadline']
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    drop_index_concurrently('ix_tasks_user_id_deadline', 'tasks')
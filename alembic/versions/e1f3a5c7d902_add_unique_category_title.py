@@ -0,0 +1,48 @@
+"""add unique category title
+
+Revision ID: e1f3a5c7d902
+Revises: c4a8e2f6b913
+Create Date: 2026-10-19 15:03:51.662170
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e1f3a5c7d902'
+down_revision: Union[str, None] = 'c4a8e2f6b913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Duplicate titles are merged into the category with the lowest id
+    op.execute(
+        """
+        INSERT INTO task_categories (task_id, category_id, version, updated_at)
+        SELECT DISTINCT tc.task_id, k.keep_id, 1, now()
+        FROM task_categories tc
+        JOIN (
+            SELECT id, MIN(id) OVER (PARTITION BY title) AS keep_id FROM categories
+        ) k ON k.id = tc.category_id
+        WHERE k.id <> k.keep_id
+        ON CONFLICT DO NOTHING
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM categories c
+        USING categories k
+        WHERE c.title = k.title AND c.id > k.id
+        """
+    )
+    op.create_unique_constraint('categories_title_key', 'categories', ['title'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('categories_title_key', 'categories', type_='unique')
@@ -0,0 +1,54 @@
+"""add activity log
+
+Revision ID: e6a8c0d2f459
+Revises: d5f7b9c1e348
+Create Date: 2026-10-19 22:05:41.682930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6a8c0d2f459'
+down_revision: Union[str, None] = 'd5f7b9c1e348'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'activity_log',
+        sa.Column(
+            'id',
+            sa.BigInteger().with_variant(sa.Integer(), 'sqlite'),
+            nullable=False,
+        ),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('actor_id', sa.Integer(), nullable=True),
+        sa.Column('entity', sa.String(length=20), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('action', sa.String(length=30), nullable=False),
+        sa.Column('changes', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_activity_log_entity_id',
+        'activity_log',
+        ['entity', 'entity_id', 'id'],
+        unique=False,
+    )
+    op.create_index(
+        op.f('ix_activity_log_user_id'), 'activity_log', ['user_id'], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_activity_log_user_id'), table_name='activity_log')
+    op.drop_index('ix_activity_log_entity_id', table_name='activity_log')
+    op.drop_table('activity_log')
@@ -0,0 +1,43 @@
+"""add change version sequence
+
+Revision ID: f3b5d7e9a1c4
+Revises: e6a8c0d2f459
+Create Date: 2026-10-19 23:12:37.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b5d7e9a1c4'
+down_revision: Union[str, None] = 'e6a8c0d2f459'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        # Other databases keep taking versions from change_counter
+        return
+    op.execute(sa.schema.CreateSequence(sa.Sequence('change_version_seq')))
+    # The sequence continues from the last version of the counter
+    op.execute(
+        "SELECT setval('change_version_seq', value, value > 0) "
+        "FROM change_counter WHERE id = 1"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.execute(
+        "UPDATE change_counter SET value = "
+        "(SELECT CASE WHEN is_called THEN last_value ELSE 0 END "
+        "FROM change_version_seq) WHERE id = 1"
+    )
+    op.execute(sa.schema.DropSequence(sa.Sequence('change_version_seq')))
@@ -0,0 +1,58 @@
+"""add unique task title per user
+
+Revision ID: f7b2d4e6a815
+Revises: e1f3a5c7d902
+Create Date: 2026-10-19 15:47:20.118934
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f7b2d4e6a815'
+down_revision: Union[str, None] = 'e1f3a5c7d902'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TITLE_LENGTH = 100
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.text('SELECT id, user_id, title FROM tasks ORDER BY id DESC')
+    ).all()
+    taken = {(row.user_id, row.title) for row in rows}
+    kept = set()
+    renames = []
+    # Older duplicates get their id appended, the newest task keeps its title
+    for row in rows:
+        key = (row.user_id, row.title)
+        if key not in kept:
+            kept.add(key)
+            continue
+        attempt = 0
+        while True:
+            suffix = f' ({row.id})' if not attempt else f' ({row.id}-{attempt})'
+            title = row.title[:TITLE_LENGTH - len(suffix)] + suffix
+            if (row.user_id, title) not in taken:
+                break
+            attempt += 1
+        taken.add((row.user_id, title))
+        renames.append({'id': row.id, 'title': title})
+    if renames:
+        bind.execute(
+            sa.text('UPDATE tasks SET title = :title WHERE id = :id'), renames
+        )
+    op.create_index(
+        'uq_tasks_user_id_title', 'tasks', ['user_id', 'title'], unique=True
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_tasks_user_id_title', table_name='tasks')
@@ -1,17 +1,27 @@
+import hashlib
 import os
-from datetime import datetime, timedelta
+import secrets
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
 
-from fastapi import Depends, HTTPException, Request, status
+from fastapi import Depends, HTTPException, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from sqlalchemy.orm import Session
 
-from app.crud.security import verify_password
-from app.db.database import SessionLocal
-from app.db.models import User
+from app.crud.security import verify_and_update_password
+from app.crud.token_versions import get_token_version
+from app.db.activity import set_actor
+from app.db.database import SessionLocal, get_db
+from app.db.models import RefreshToken, User
+from app.schemas.users import CurrentUser, SessionTokens
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = 30
+REFRESH_REUSE_GRACE_SECONDS = 10
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
@@ -20,26 +30,42 @@ def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
     """Creates a JWT access token with the specified data and lifetime"""
     to_encode = data.copy()
     if expires_delta:
-        expire = datetime.now() + expires_delta
+        expire = datetime.now(timezone.utc) + expires_delta
     else:
-        expire = datetime.now() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+        expire = datetime.now(timezone.utc) + timedelta(
+            minutes=ACCESS_TOKEN_EXPIRE_MINUTES
+        )
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
-def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+def user_token_claims(user: User) -> dict:
+    """Returns the signed claims that describe the user in an access token"""
+    return {
+        "sub": str(user.id),
+        "name": user.name,
+        "is_admin": bool(user.is_admin),
+        "ver": user.token_version or 0,
+    }
+
+
+def decode_user_token(token: str, db: Optional[Session] = None) -> CurrentUser:
     """
-    Gets the current user from the JWT token.
+    Decodes the access token and builds the current user from its claims.
+
+    The only state checked outside the token is the token version,
+    which is served from a cache, so a valid token needs no DB access.
 
     args:
-    token: JWT token from the Authorization header
+    token: JWT access token
+    db: Session of the request, used when the token version is not cached
 
     returns:
-    User: User object
+    CurrentUser: User described by the token claims
 
     raises:
-    HTTPException: If the token is invalid or the user is not found
+    HTTPException: If the token is invalid, revoked or the user is not found
     """
     credential_exception = HTTPException(
         status_code=401,
@@ -48,46 +74,265 @@ def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
     )
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise credential_exception
-    except JWTError:
+        user_id = int(payload["sub"])
+        name = payload["name"]
+        token_version = payload["ver"]
+    except (JWTError, KeyError, TypeError, ValueError):
         raise credential_exception
 
-    session = SessionLocal()
-    user = session.query(User).filter_by(id=user_id).first()
-    session.close()
-    if user is None:
+    if get_token_version(user_id, db) != token_version:
         raise credential_exception
-    return user
+    if db is not None:
+        set_actor(db, user_id)
+
+    return CurrentUser(
+        id=user_id, name=name, is_admin=bool(payload.get("is_admin", False))
+    )
+
+
+def authenticate_request(
+    request: Request, token: str, db: Optional[Session] = None
+) -> CurrentUser:
+    """
+    Decodes the token of the request and keeps its user in request.state,
+    where the middlewares find it once the handler has run
+    """
+    current_user = decode_user_token(token, db)
+    request.state.current_user = current_user
+    return current_user
+
+
+def get_current_user(
+    request: Request,
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db),
+) -> CurrentUser:
+    """
+    Gets the current user from the JWT token.
+
+    args:
+    request: FastAPI Request object
+    token: JWT token from the Authorization header
+    db: Session of the request, shared with the handler
+
+    returns:
+    CurrentUser: User described by the token claims
+
+    raises:
+    HTTPException: If the token is invalid or the user is not found
+    """
+    return authenticate_request(request, token, db)
 
 
-def login_user(email: str, password: str) -> str:
+def _hash_refresh_token(token: str) -> str:
+    """Returns the digest under which a refresh token is stored"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def issue_refresh_token(db: Session, user_id: int, family_id: str = None) -> str:
     """
-    Authenticates the user and returns a JWT token.
+    Adds a new refresh token for the user to the session.
+
+    args:
+    db: Database session
+    user_id: User ID
+    family_id: Rotation family of the token, a new family is started if omitted
+
+    returns:
+    str: Refresh token in clear text, only its hash is stored
+    """
+    token = secrets.token_urlsafe(32)
+    db.add(
+        RefreshToken(
+            user_id=user_id,
+            token_hash=_hash_refresh_token(token),
+            family_id=family_id or secrets.token_hex(16),
+            expires_at=datetime.now() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+        )
+    )
+    return token
+
+
+def login_user(email: str, password: str) -> SessionTokens:
+    """
+    Authenticates the user and returns a JWT token with a refresh token.
 
     args:
     email: User's email
     password: User's password
 
     returns:
-    str: JWT access token
+    SessionTokens: JWT access token and refresh token
 
     raises:
     ValueError: If the email or password is incorrect
     """
     session = SessionLocal()
-    user = session.query(User).filter_by(email=email).first()
-    session.close()
+    try:
+        user = session.query(User).filter_by(email=email).first()
+
+        if user is None:
+            raise ValueError("Неверный email или пароль")
+        verified, new_hash = verify_and_update_password(password, user.password)
+        if not verified:
+            raise ValueError("Неверный email или пароль")
+        if new_hash:
+            user.password = new_hash
+
+        access_token = create_access_token(data=user_token_claims(user))
+        refresh_token = issue_refresh_token(session, user.id)
+        session.commit()
+    finally:
+        session.close()
+
+    return SessionTokens(access_token=access_token, refresh_token=refresh_token)
+
+
+def refresh_session(refresh_token: str) -> SessionTokens:
+    """
+    Exchanges a refresh token for a new access token and rotates it.
+
+    A refresh token can be used only once. Presenting an already used
+    token revokes its whole family, except for a short grace period
+    that covers parallel requests of the same browser.
+
+    args:
+    refresh_token: Refresh token from the cookie
+
+    returns:
+    SessionTokens: New access token and the rotated refresh token,
+    the refresh token is None when it was already rotated in the grace period
+
+    raises:
+    ValueError: If the token is unknown, expired, revoked or reused
+    """
+    session = SessionLocal()
+    try:
+        record = (
+            session.query(RefreshToken)
+            .filter_by(token_hash=_hash_refresh_token(refresh_token))
+            .first()
+        )
+        now = datetime.now()
+        if record is None or record.revoked_at or record.expires_at < now:
+            raise ValueError("Сессия истекла, войдите снова")
+
+        rotated = (
+            session.query(RefreshToken)
+            .filter(RefreshToken.id == record.id, RefreshToken.used_at.is_(None))
+            .update({RefreshToken.used_at: now}, synchronize_session=False)
+        )
+        new_refresh_token = None
+        if not rotated:
+            session.refresh(record)
+            grace = timedelta(seconds=REFRESH_REUSE_GRACE_SECONDS)
+            if record.used_at + grace < now:
+                revoke_refresh_family(session, record.family_id)
+                session.commit()
+                raise ValueError("Сессия отозвана, войдите снова")
+        else:
+            new_refresh_token = issue_refresh_token(
+                session, record.user_id, record.family_id
+            )
+
+        user = session.get(User, record.user_id)
+        if user is None:
+            raise ValueError("Пользователь не найден")
+        access_token = create_access_token(data=user_token_claims(user))
+        session.commit()
+    finally:
+        session.close()
+
+    return SessionTokens(access_token=access_token, refresh_token=new_refresh_token)
+
+
+def revoke_refresh_family(db: Session, family_id: str) -> None:
+    """Marks every refresh token of the rotation family as revoked"""
+    db.query(RefreshToken).filter(
+        RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None)
+    ).update({RefreshToken.revoked_at: datetime.now()}, synchronize_session=False)
+
+
+def revoke_refresh_token(refresh_token: str) -> None:
+    """Revokes the family of the refresh token, used when the user logs out"""
+    session = SessionLocal()
+    try:
+        record = (
+            session.query(RefreshToken)
+            .filter_by(token_hash=_hash_refresh_token(refresh_token))
+            .first()
+        )
+        if record is not None:
+            revoke_refresh_family(session, record.family_id)
+            session.commit()
+    finally:
+        session.close()
+
+
+def renew_session(
+    access_token: Optional[str], refresh_token: Optional[str]
+) -> Optional[SessionTokens]:
+    """
+    Decides whether the session cookies of a request have to be re-issued.
+
+    A valid access token that has used up half of its lifetime is
+    re-signed with the same claims, which needs no DB access. An expired
+    or missing access token is replaced through the refresh token.
+
+    args:
+    access_token: Access token from the cookie
+    refresh_token: Refresh token from the cookie
 
-    if user is None or not verify_password(password, user.password):
-        raise ValueError("Неверный email или пароль")
+    returns:
+    Optional[SessionTokens]: New tokens or None if the cookies stay as they are
 
-    access_token = create_access_token(data={"sub": str(user.id)})
-    return access_token
+    raises:
+    ValueError: If the session can not be renewed and the cookies must be cleared
+    """
+    if access_token:
+        try:
+            payload = jwt.decode(access_token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            payload = None
+        if payload is not None:
+            remaining = payload.get("exp", 0) - time.time()
+            if remaining > ACCESS_TOKEN_EXPIRE_MINUTES * 60 / 2:
+                return None
+            if (
+                "ver" not in payload
+                or get_token_version(int(payload["sub"])) != payload["ver"]
+            ):
+                return None
+            claims = {k: v for k, v in payload.items() if k != "exp"}
+            return SessionTokens(access_token=create_access_token(data=claims))
 
+    if not refresh_token:
+        return None
+    return refresh_session(refresh_token)
+
+
+def set_session_cookies(response: Response, tokens: SessionTokens) -> None:
+    """Sets the access and refresh token cookies on the response"""
+    response.set_cookie(key="access_token", value=tokens.access_token, httponly=True)
+    if tokens.refresh_token:
+        response.set_cookie(
+            key="refresh_token",
+            value=tokens.refresh_token,
+            max_age=60 * 60 * 24 * REFRESH_TOKEN_EXPIRE_DAYS,
+            httponly=True,
+            samesite="lax",
+        )
 
-def admin_required(current_user: User = Depends(get_current_user)) -> User:
+
+def clear_session_cookies(response: Response) -> None:
+    """Deletes the access and refresh token cookies"""
+    response.delete_cookie("access_token")
+    response.delete_cookie("refresh_token")
+
+
+def admin_required(
+    current_user: CurrentUser = Depends(get_current_user),
+) -> CurrentUser:
     """
     Checks if the user is an administrator and raise an exception if they are not
     """
@@ -99,42 +344,26 @@ def admin_required(current_user: User = Depends(get_current_user)) -> User:
     return current_user
 
 
-def get_current_user_from_cookie(request: Request) -> User:
+def get_current_user_from_cookie(
+    request: Request, db: Session = Depends(get_db)
+) -> CurrentUser:
     """
     Gets the current user from the JWT token in the cookie.
 
     args:
     request: FastAPI Request object
+    db: Session of the request, shared with the handler
 
     returns:
-    User: User object
+    CurrentUser: User described by the token claims
 
     raises:
     HTTPException: If the token is not found or is invalid
     """
-    token = request.cookies.get("access_token")
+    token = getattr(request.state, "access_token", None) or request.cookies.get(
+        "access_token"
+    )
     if not token:
         raise HTTPException(status_code=401, detail="Токен не найден в cookie")
 
-    credential_exception = HTTPException(
-        status_code=401,
-        detail="Не удалось проверить токен",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("sub")
-        if user_id is None:
-            raise credential_exception
-    except JWTError:
-        raise credential_exception
-
-    session = SessionLocal()
-    user = session.query(User).filter_by(id=user_id).first()
-    session.close()
-
-    if user is None:
-        raise credential_exception
-
-    return user
+    return authenticate_request(request, token, db)
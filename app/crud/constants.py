@@ -1,2 +1,4 @@
 ALLOWED_STATUSES = {"не выполнена", "в процессе", "выполнена"}
 ALLOWED_PRIORITIES = {"низкий", "средний", "высокий"}
+COMPLETED_STATUS = "выполнена"
+ALLOWED_RECURRENCES = {"ежедневно", "еженедельно", "ежемесячно"}
@@ -1,6 +1,21 @@
+import os
+import statistics
+import time
+from typing import Optional, Tuple
+
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+MIN_BCRYPT_ROUNDS = 10
+MAX_BCRYPT_ROUNDS = 16
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 
 
 def hash_password(password: str) -> str:
@@ -19,3 +34,65 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Checks whether a password matches its hash"""
     return pwd_context.verify(plain_password, hashed_password)
+
+
+def verify_and_update_password(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """
+    Checks whether a password matches its hash and rehashes it if needed.
+
+    A hash made with a bcrypt cost other than BCRYPT_ROUNDS is replaced,
+    so the stored hashes follow the calibrated cost of the deployment.
+
+    args:
+    plain_password: Cleartext password
+    hashed_password: Stored hash
+
+    returns:
+    Tuple[bool, Optional[str]]: Verification result and the new hash,
+    the new hash is None when the stored one is up to date
+    """
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def measure_bcrypt_verify(rounds: int, samples: int = 3) -> float:
+    """Returns the median time in seconds of a bcrypt verification with the cost"""
+    context = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=rounds)
+    hashed = context.hash("calibration-password")
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        context.verify("calibration-password", hashed)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def calibrate_bcrypt_rounds(
+    target_seconds: float,
+    samples: int = 3,
+    min_rounds: int = MIN_BCRYPT_ROUNDS,
+    max_rounds: int = MAX_BCRYPT_ROUNDS,
+) -> Tuple[int, dict]:
+    """
+    Finds the highest bcrypt cost whose verification fits the target latency.
+
+    The cost never goes below min_rounds, even on slow hardware.
+
+    args:
+    target_seconds: Target verification latency in seconds
+    samples: Number of measured verifications per cost
+    min_rounds: Lowest acceptable cost
+    max_rounds: Highest cost to try
+
+    returns:
+    Tuple[int, dict]: Chosen cost and the measured latency of every tried cost
+    """
+    chosen = min_rounds
+    timings = {}
+    for rounds in range(min_rounds, max_rounds + 1):
+        timings[rounds] = measure_bcrypt_verify(rounds, samples)
+        if timings[rounds] > target_seconds:
+            break
+        chosen = rounds
+    return chosen, timings
@@ -0,0 +1,104 @@
+import time
+from datetime import datetime
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.db.database import SessionLocal
+from app.db.invalidation import ALL_KEYS, invalidation_bus
+from app.db.models import RefreshToken, User
+
+TOKEN_VERSION_TTL_SECONDS = 60
+
+_versions: Dict[int, Tuple[int, float]] = {}
+_lock = Lock()
+
+
+def get_token_version(user_id: int, db: Optional[Session] = None) -> Optional[int]:
+    """
+    Returns the current token version of the user.
+
+    The value is served from an in-process cache and only read from
+    the users table when the cached entry is missing or expired. The
+    row is read through the given session, so it lands in the identity
+    map and the handler sharing the session gets the user without
+    another query.
+
+    args:
+    user_id: User ID
+    db: Session of the request, a separate one is opened without it
+
+    returns:
+    Optional[int]: Token version or None if the user is not found or deleted
+    """
+    now = time.monotonic()
+    cached = _versions.get(user_id)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+
+    session = db if db is not None else SessionLocal()
+    try:
+        user = (
+            session.query(User)
+            .filter(User.id == user_id, User.deleted_at.is_(None))
+            .first()
+        )
+        token_version = user.token_version if user is not None else None
+        if user is not None and db is not None:
+            # The identity map holds objects weakly, the reference keeps
+            # the row there for the handler sharing the session
+            db.info["current_user_row"] = user
+    finally:
+        if db is None:
+            session.close()
+
+    if token_version is None:
+        evict_token_version(user_id)
+        return None
+
+    with _lock:
+        _versions[user_id] = (token_version, now + TOKEN_VERSION_TTL_SECONDS)
+    return token_version
+
+
+def evict_token_version(user_id: int) -> None:
+    """Removes the cached token version of the user"""
+    with _lock:
+        _versions.pop(user_id, None)
+
+
+def clear_token_versions() -> None:
+    """Removes all cached token versions"""
+    with _lock:
+        _versions.clear()
+
+
+def revoke_user_tokens(db: Session, user_id: int) -> None:
+    """
+    Invalidates all issued tokens of the user by bumping the token version.
+    Refresh tokens are revoked too, so the session can not be renewed.
+
+    args:
+    db: Database session
+    user_id: User ID
+    """
+    db.query(User).filter_by(id=user_id).update(
+        {User.token_version: User.token_version + 1}, synchronize_session=False
+    )
+    db.query(RefreshToken).filter(
+        RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None)
+    ).update({RefreshToken.revoked_at: datetime.now()}, synchronize_session=False)
+    invalidation_bus.publish(db, "users", user_id)
+    db.commit()
+
+
+def _on_user_invalidated(key: str) -> None:
+    """Evicts cached token versions when the bus reports changed users"""
+    if key == ALL_KEYS:
+        clear_token_versions()
+    else:
+        evict_token_version(int(key))
+
+
+invalidation_bus.subscribe("users", _on_user_invalidated)
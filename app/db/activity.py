@@ -0,0 +1,260 @@
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import event, insert, inspect
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.db.database import EXTERNAL_TRANSACTION_KEY, SessionLocal
+from app.db.models import ActivityLog
+
+logger = logging.getLogger(__name__)
+
+PENDING_KEY = "pending_activity"
+DEFERRED_KEY = "deferred_activity"
+ACTOR_KEY = "activity_actor_id"
+WRITE_ATTEMPTS = 3
+OVERFLOW_POLICIES = ("drop", "block")
+
+
+def set_actor(db: Session, user_id: int) -> None:
+    """Remembers the authenticated user of the session as the author of its changes"""
+    db.info[ACTOR_KEY] = user_id
+
+
+def record_activity(
+    db: Session,
+    entity: str,
+    entity_id: int,
+    action: str,
+    user_id: Optional[int] = None,
+    changes: Optional[Dict[str, Any]] = None,
+) -> None:
+    """
+    Queues an activity entry that is handed to the writer when the
+    session commits, a rolled back change leaves no entry.
+
+    args:
+    db: Database session of the change
+    entity: "task" or "category"
+    entity_id: ID of the changed row
+    action: What happened, e.g. "created", "updated" or "deleted"
+    user_id: Owner of the changed task
+    changes: JSON-serializable details, e.g. old and new field values
+    """
+    db.info.setdefault(PENDING_KEY, []).append(
+        {
+            "user_id": user_id,
+            "actor_id": db.info.get(ACTOR_KEY),
+            "entity": entity,
+            "entity_id": entity_id,
+            "action": action,
+            "changes": (
+                json.dumps(changes, ensure_ascii=False, default=str)
+                if changes
+                else None
+            ),
+            "created_at": datetime.now(),
+        }
+    )
+
+
+def changed_fields(obj, fields: Iterable[str]) -> Dict[str, List[Any]]:
+    """
+    Old and new values of the object's fields changed in the session,
+    related objects are described by their titles.
+
+    returns:
+    Dict[str, List[Any]]: [old, new] of every changed field
+    """
+    state = inspect(obj)
+    changes = {}
+    for field in fields:
+        history = state.attrs[field].history
+        if not history.has_changes():
+            continue
+        old, new = list(history.deleted), list(history.added)
+        if field in state.mapper.relationships:
+            unchanged = list(history.unchanged)
+            changes[field] = [
+                sorted(item.title for item in unchanged + old),
+                sorted(item.title for item in unchanged + new),
+            ]
+        else:
+            changes[field] = [old[0] if old else None, new[0] if new else None]
+    return changes
+
+
+class ActivityLogWriter:
+    """
+    Writes activity entries behind the requests.
+
+    Committed sessions put their entries into a bounded in-process queue,
+    a background thread inserts them in batches every `interval` seconds
+    or as soon as a batch is full. When the queue is full, the "drop"
+    policy discards new entries and counts them, "block" makes the
+    committing request wait up to `block_timeout` seconds for room
+    first. Entries still queued are written on stop().
+    """
+
+    def __init__(
+        self,
+        max_size: int = 10000,
+        batch_size: int = 500,
+        interval: float = 1.0,
+        overflow: str = "drop",
+        block_timeout: float = 0.5,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.batch_size = batch_size
+        self.interval = interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self._queue: "queue.Queue[dict]" = queue.Queue(maxsize=max_size)
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stats = {"queued": 0, "written": 0, "dropped": 0, "failed": 0}
+        self._reported_drops = 0
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += amount
+
+    def stats(self) -> Dict[str, int]:
+        """Counters of the writer and the current queue length"""
+        with self._lock:
+            return {**self._stats, "pending": self._queue.qsize()}
+
+    def submit(self, entries: List[dict]) -> None:
+        """Queues committed entries, applying the overflow policy when full"""
+        for entry in entries:
+            try:
+                if self.overflow == "block":
+                    self._queue.put(entry, timeout=self.block_timeout)
+                else:
+                    self._queue.put_nowait(entry)
+            except queue.Full:
+                self._count("dropped")
+            else:
+                self._count("queued")
+        if self._queue.qsize() >= self.batch_size:
+            self._wakeup.set()
+
+    def submit_deferred(self, db: Session) -> None:
+        """
+        Queues the entries a session joined to an external transaction
+        collected, called by the owner after the transaction committed
+        """
+        entries = db.info.pop(DEFERRED_KEY, None)
+        if entries:
+            self.submit(entries)
+
+    def start(self) -> None:
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="activity-log", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the thread and writes the entries that are still queued"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Activity log flush failed")
+            self._report_drops()
+
+    def _report_drops(self) -> None:
+        dropped = self.stats()["dropped"]
+        if dropped > self._reported_drops:
+            logger.warning(
+                "Activity log queue is full, %s entries dropped",
+                dropped - self._reported_drops,
+            )
+            self._reported_drops = dropped
+
+    def flush(self) -> int:
+        """
+        Writes the queued entries in batches of `batch_size`.
+
+        returns:
+        int: Number of entries taken from the queue
+        """
+        taken = 0
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return taken
+            taken += len(batch)
+            self._write(batch)
+
+    def _write(self, batch: List[dict]) -> None:
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            db = SessionLocal()
+            try:
+                db.execute(insert(ActivityLog), batch)
+                db.commit()
+                self._count("written", len(batch))
+                return
+            except SQLAlchemyError:
+                db.rollback()
+                logger.exception(
+                    "Activity log batch not written (%s/%s)", attempt, WRITE_ATTEMPTS
+                )
+            finally:
+                db.close()
+            if attempt < WRITE_ATTEMPTS:
+                # Returns at once on stop, the remaining attempts follow quickly
+                self._stopped.wait(attempt)
+        self._count("failed", len(batch))
+
+
+activity_log = ActivityLogWriter(
+    max_size=int(os.getenv("ACTIVITY_LOG_QUEUE_SIZE", "10000")),
+    batch_size=int(os.getenv("ACTIVITY_LOG_BATCH_SIZE", "500")),
+    interval=float(os.getenv("ACTIVITY_LOG_FLUSH_SECONDS", "1")),
+    overflow=os.getenv("ACTIVITY_LOG_OVERFLOW", "drop"),
+)
+
+
+@event.listens_for(Session, "after_commit")
+def _submit_pending(session: Session) -> None:
+    entries = session.info.pop(PENDING_KEY, None)
+    if not entries:
+        return
+    if session.info.get(EXTERNAL_TRANSACTION_KEY):
+        # Only a savepoint was released, see ActivityLogWriter.submit_deferred()
+        session.info.setdefault(DEFERRED_KEY, []).extend(entries)
+        return
+    activity_log.submit(entries)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_pending(session: Session, transaction) -> None:
+    # Entries of a rolled back or closed transaction were never committed
+    if transaction.parent is None and not transaction.nested:
+        session.info.pop(PENDING_KEY, None)
@@ -1,16 +1,154 @@
+from contextlib import ExitStack
+from itertools import cycle
+from threading import Lock
+from typing import Generator, List, Optional
+
 from environs import Env
-from sqlalchemy import create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import Engine, create_engine, event, text
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
 
-env = Env()
-env.read_env()
+Base = declarative_base()
 
-db_url = env("DATABASE_URL")
+_engine: Optional[Engine] = None
+_replica_engines: Optional[List[Engine]] = None
+_replica_cycle = None
+_engine_lock = Lock()
 
-engine = create_engine(db_url)
-SessionLocal = sessionmaker(bind=engine)
-Base = declarative_base()
+
+def get_engine() -> Engine:
+    """
+    Returns the engine of DATABASE_URL, creating it on first use.
+
+    Nothing is read from the environment on import, so the application
+    can be imported before its settings are known and a process that
+    never touches the database never builds an engine.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                env = Env()
+                env.read_env()
+                _engine = create_engine(env("DATABASE_URL"))
+    return _engine
+
+
+def get_replica_engines() -> List[Engine]:
+    """
+    Returns the engines of the read replicas, created on first use.
+
+    Replicas are listed comma-separated in DATABASE_REPLICA_URLS, without
+    them the list is empty and reads go to the primary.
+    """
+    global _replica_engines, _replica_cycle
+    if _replica_engines is None:
+        with _engine_lock:
+            if _replica_engines is None:
+                env = Env()
+                env.read_env()
+                engines = [
+                    create_engine(url, pool_pre_ping=True)
+                    for url in env.list("DATABASE_REPLICA_URLS", [])
+                ]
+                _replica_cycle = cycle(engines or [None])
+                _replica_engines = engines
+    return _replica_engines
+
+
+def get_read_engine() -> Engine:
+    """Returns the next replica engine in turn, the primary one without replicas"""
+    get_replica_engines()
+    return next(_replica_cycle) or get_engine()
+
+
+def dispose_engine(close: bool = True) -> None:
+    """
+    Closes the pooled connections of the engines that were created.
+
+    args:
+    close: False only forgets the connections, used in forked processes
+    that must not close the connections of their parent
+    """
+    for engine in [_engine, *(_replica_engines or [])]:
+        if engine is not None:
+            engine.dispose(close=close)
+
+
+class LazySessionmaker(sessionmaker):
+    """Session factory bound to the engine when the first session is opened"""
+
+    def __call__(self, **local_kw) -> Session:
+        if self.kw.get("bind") is None:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
+
+
+class ReadOnlySession(Session):
+    """Session of a read replica, flushing changes through it is an error"""
+
+
+@event.listens_for(ReadOnlySession, "before_flush")
+def _reject_writes(session: Session, flush_context, instances) -> None:
+    raise RuntimeError("Read-only session cannot write, use the primary session")
+
+
+class ReadSessionmaker(sessionmaker):
+    """Session factory taking the replicas in turn for every new session"""
+
+    def __call__(self, **local_kw) -> Session:
+        local_kw.setdefault("bind", get_read_engine())
+        return super().__call__(**local_kw)
+
+
+# Set in Session.info of a session joined to a transaction it does not own,
+# its commits only release savepoints and the owner commits for real
+EXTERNAL_TRANSACTION_KEY = "external_transaction"
+
+SessionLocal = LazySessionmaker()
+ReadSessionLocal = ReadSessionmaker(class_=ReadOnlySession)
+
+
+def get_db() -> Generator[Session, None, None]:
+    """
+    Dependency to receive session for DB.
+
+    FastAPI caches dependencies per request, so authentication and the
+    handler that both depend on it share one session, one connection and
+    one identity map.
+    """
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def warm_up_pool(connections: Optional[int] = None) -> int:
+    """
+    Opens the connections of the primary and replica pools ahead of the
+    first requests.
+
+    args:
+    connections: Number of connections per engine, the pool size by default
+
+    returns:
+    int: Number of connections opened
+    """
+    opened = 0
+    for engine in [get_engine(), *get_replica_engines()]:
+        count = connections
+        if count is None:
+            size = getattr(engine.pool, "size", None)
+            count = size() if callable(size) else 1
+        # All connections are held at once, otherwise the pool would hand
+        # the same one out again
+        with ExitStack() as stack:
+            for _ in range(count):
+                connection = stack.enter_context(engine.connect())
+                connection.execute(text("SELECT 1"))
+        opened += count
+    return opened
 
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=get_engine())
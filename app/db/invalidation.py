@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import select
+import threading
+import uuid
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.db.database import EXTERNAL_TRANSACTION_KEY, get_engine
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "flaptask_invalidate"
+ALL_KEYS = "*"
+PENDING_KEY = "pending_invalidations"
+DEFERRED_KEY = "deferred_invalidations"
+HOST_ID = uuid.uuid4().hex
+
+Event = Tuple[str, str]
+
+
+def current_origin() -> str:
+    """
+    Identifies the current worker process, the pid is part of it because
+    workers forked from a preloaded master share module state
+    """
+    return f"{HOST_ID}:{os.getpid()}"
+
+
+class InMemoryBackend:
+    """
+    Backend for tests and single-process runs.
+
+    Events are only dispatched inside the current process, which the bus
+    already does after every commit, so there is nothing left to send.
+    """
+
+    def send(self, db: Session, events: List[Event]) -> None:
+        pass
+
+    def start(self, bus: "InvalidationBus") -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+
+class PostgresBackend:
+    """
+    Backend that delivers events to every worker with LISTEN/NOTIFY.
+
+    Events are sent with pg_notify inside the writing transaction, so
+    Postgres only delivers them if the transaction commits. Every
+    worker keeps one dedicated connection that listens on the channel.
+    """
+
+    def __init__(self, engine: Engine, poll_timeout: float = 5.0):
+        self.engine = engine
+        self.poll_timeout = poll_timeout
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def send(self, db: Session, events: List[Event]) -> None:
+        for topic, key in events:
+            payload = json.dumps({"o": current_origin(), "t": topic, "k": key})
+            db.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": CHANNEL, "payload": payload},
+            )
+
+    def start(self, bus: "InvalidationBus") -> None:
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._listen, args=(bus,), name="invalidation-listener", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_timeout + 1)
+            self._thread = None
+
+    def _listen(self, bus: "InvalidationBus") -> None:
+        """Listens on the channel and reconnects after connection errors"""
+        while not self._stopped.is_set():
+            connection = None
+            try:
+                raw = self.engine.raw_connection()
+                raw.detach()
+                connection = raw.dbapi_connection
+                connection.autocommit = True
+                with connection.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANNEL}")
+                # Events sent while we were not listening are lost
+                bus.dispatch_all()
+
+                while not self._stopped.is_set():
+                    readable, _, _ = select.select(
+                        [connection], [], [], self.poll_timeout
+                    )
+                    if not readable:
+                        continue
+                    connection.poll()
+                    while connection.notifies:
+                        self._handle(bus, connection.notifies.pop(0).payload)
+            except Exception:
+                logger.exception("Invalidation listener failed, reconnecting")
+                self._stopped.wait(self.poll_timeout)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+    @staticmethod
+    def _handle(bus: "InvalidationBus", payload: str) -> None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning("Malformed invalidation payload: %s", payload)
+            return
+        if message.get("o") == current_origin():
+            return
+        bus.dispatch(message["t"], message["k"])
+
+
+class InvalidationBus:
+    """
+    Delivers cache invalidation events of committed writes to every worker.
+
+    Services call publish() inside their transaction. After the commit
+    the event is dispatched to the local subscribers at once, and the
+    backend delivers it to the other workers.
+    """
+
+    def __init__(self, backend=None):
+        self._backend = backend
+        self._subscribers: Dict[str, List[Callable[[str], None]]] = defaultdict(list)
+
+    @property
+    def backend(self):
+        """Backend of the bus, chosen by create_backend() unless configured"""
+        if self._backend is None:
+            self._backend = create_backend(get_engine())
+        return self._backend
+
+    def configure(self, backend) -> None:
+        """Replaces the backend, must be called before start()"""
+        self._backend = backend
+
+    def subscribe(self, topic: str, callback: Callable[[str], None]) -> None:
+        """Registers a callback receiving the invalidated key of the topic"""
+        self._subscribers[topic].append(callback)
+
+    def publish(self, db: Session, topic: str, key: str = ALL_KEYS) -> None:
+        """Queues an invalidation event that is sent when the session commits"""
+        if not db.in_transaction():
+            # Otherwise a rollback ends no transaction and keeps the event
+            db.begin()
+        db.info.setdefault(PENDING_KEY, []).append((topic, str(key)))
+
+    def dispatch(self, topic: str, key: str) -> None:
+        """Calls the local subscribers of the topic"""
+        for callback in self._subscribers.get(topic, ()):
+            try:
+                callback(key)
+            except Exception:
+                logger.exception("Invalidation subscriber failed for %s", topic)
+
+    def dispatch_deferred(self, db: Session) -> None:
+        """
+        Dispatches the events a session joined to an external transaction
+        collected, called by the owner after the transaction committed
+        """
+        for topic, key in db.info.pop(DEFERRED_KEY, ()):
+            self.dispatch(topic, key)
+
+    def dispatch_all(self) -> None:
+        """Tells every local subscriber to drop everything it caches"""
+        for topic in list(self._subscribers):
+            self.dispatch(topic, ALL_KEYS)
+
+    def start(self) -> None:
+        self.backend.start(self)
+
+    def stop(self) -> None:
+        self.backend.stop()
+
+
+invalidation_bus = InvalidationBus()
+
+
+def create_backend(engine: Engine):
+    """
+    Chooses the backend from INVALIDATION_BACKEND ("postgres" or "memory"),
+    by default Postgres databases use LISTEN/NOTIFY
+    """
+    name = os.getenv("INVALIDATION_BACKEND")
+    if name is None:
+        name = "postgres" if engine.dialect.name == "postgresql" else "memory"
+    if name == "postgres":
+        return PostgresBackend(engine)
+    return InMemoryBackend()
+
+
+@event.listens_for(Session, "before_commit")
+def _send_pending(session: Session) -> None:
+    events = session.info.get(PENDING_KEY)
+    if events:
+        invalidation_bus.backend.send(session, events)
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_pending(session: Session) -> None:
+    events = session.info.pop(PENDING_KEY, ())
+    if session.info.get(EXTERNAL_TRANSACTION_KEY):
+        # Only a savepoint was released, the owner of the transaction
+        # dispatches them with dispatch_deferred() after its commit
+        session.info.setdefault(DEFERRED_KEY, []).extend(events)
+        return
+    for topic, key in events:
+        invalidation_bus.dispatch(topic, key)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_pending(session: Session, transaction) -> None:
+    # Events of a rolled back or closed transaction were never committed
+    if transaction.parent is None and not transaction.nested:
+        session.info.pop(PENDING_KEY, None)
@@ -1,16 +1,22 @@
+from datetime import datetime
+
 from sqlalchemy import (
+    BigInteger,
     Boolean,
     Column,
     DateTime,
     ForeignKey,
+    Index,
     Integer,
     String,
     Table,
     Text,
+    text,
 )
 from sqlalchemy.orm import relationship
 
 from app.db.database import Base
+from app.db.versioning import version_default
 
 task_categories_association = Table(
     "task_categories",
@@ -24,6 +30,8 @@ task_categories_association = Table(
         ForeignKey("categories.id", ondelete="CASCADE"),
         primary_key=True,
     ),
+    Column("version", BigInteger, nullable=False, default=version_default, index=True),
+    Column("updated_at", DateTime, nullable=False, default=datetime.now),
 )
 
 
@@ -35,33 +43,196 @@ class User(Base):
     email = Column(String(100), unique=True, nullable=False)
     password = Column(String(256), nullable=False)
     is_admin = Column(Boolean, default=False)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
+    deleted_at = Column(DateTime, nullable=True)
 
     tasks = relationship("Task", back_populates="user", passive_deletes=True)
+    refresh_tokens = relationship(
+        "RefreshToken", back_populates="user", passive_deletes=True
+    )
 
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        Index("uq_tasks_user_id_title", "user_id", "title", unique=True),
+        # Deadline range queries of the calendar
+        Index("ix_tasks_user_id_deadline", "user_id", "deadline"),
+        # Completed tasks waiting for the archive, the rest is not indexed
+        Index(
+            "ix_tasks_completed_updated_at",
+            "updated_at",
+            postgresql_where=text("status = 'выполнена'"),
+            sqlite_where=text("status = 'выполнена'"),
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
     title = Column(String(100), nullable=False)
     description = Column(Text, nullable=True)
     deadline = Column(DateTime, nullable=True)
     status = Column(String(15), default="не выполнена")
     priority = Column(String(10), default="средний")
+    updated_at = Column(DateTime, nullable=False, default=datetime.now)
+    version = Column(BigInteger, nullable=False, default=version_default, index=True)
+    # A recurring task repeats from its deadline, the occurrences are
+    # computed for the requested dates and never stored as tasks
+    recurrence = Column(String(15), nullable=True)
+    recurrence_interval = Column(Integer, nullable=False, default=1, server_default="1")
+    recurrence_until = Column(DateTime, nullable=True)
 
     user = relationship("User", back_populates="tasks")
     categories = relationship(
         "Category", secondary=task_categories_association, back_populates="tasks"
     )
+    occurrences = relationship(
+        "TaskOccurrence", back_populates="task", cascade="all, delete-orphan"
+    )
+
+
+class TaskOccurrence(Base):
+    """
+    Stored state of one occurrence of a recurring task. Only completed or
+    edited occurrences have a row, the others follow the task.
+    """
+
+    __tablename__ = "task_occurrences"
+    __table_args__ = (
+        Index(
+            "uq_task_occurrences_task_id_occurs_at",
+            "task_id",
+            "occurs_at",
+            unique=True,
+        ),
+    )
+
+    id = Column(Integer, primary_key=True)
+    task_id = Column(
+        Integer, ForeignKey("tasks.id", ondelete="CASCADE"), nullable=False
+    )
+    # Moment given by the recurrence rule, identifies the occurrence
+    occurs_at = Column(DateTime, nullable=False)
+    deadline = Column(DateTime, nullable=False)
+    status = Column(String(15), nullable=False)
+    description = Column(Text, nullable=True)
+    updated_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    task = relationship("Task", back_populates="occurrences")
 
 
 class Category(Base):
     __tablename__ = "categories"
+    # Serves the typeahead's LIKE 'prefix%' whatever the collation is
+    __table_args__ = (
+        Index(
+            "ix_categories_title_prefix",
+            "title",
+            postgresql_ops={"title": "text_pattern_ops"},
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
-    title = Column(String(50), nullable=False)
+    title = Column(String(50), nullable=False, unique=True)
+    updated_at = Column(DateTime, nullable=False, default=datetime.now)
+    version = Column(BigInteger, nullable=False, default=version_default, index=True)
 
     tasks = relationship(
         "Task", secondary=task_categories_association, back_populates="categories"
     )
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(
+        Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    token_hash = Column(String(64), unique=True, nullable=False)
+    family_id = Column(String(32), nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False)
+    used_at = Column(DateTime, nullable=True)
+    revoked_at = Column(DateTime, nullable=True)
+
+    user = relationship("User", back_populates="refresh_tokens")
+
+
+class SyncTombstone(Base):
+    __tablename__ = "sync_tombstones"
+
+    id = Column(Integer, primary_key=True)
+    entity = Column(String(20), nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    related_id = Column(Integer, nullable=True)
+    user_id = Column(Integer, nullable=True, index=True)
+    version = Column(BigInteger, nullable=False, index=True)
+    deleted_at = Column(DateTime, nullable=False, default=datetime.now)
+
+
+class AccountDeletion(Base):
+    __tablename__ = "account_deletions"
+
+    user_id = Column(Integer, primary_key=True)
+    requested_at = Column(DateTime, nullable=False, default=datetime.now)
+    tasks_purged = Column(Integer, nullable=False, default=0)
+    links_purged = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+archived_task_categories = Table(
+    "archived_task_categories",
+    Base.metadata,
+    Column(
+        "task_id",
+        Integer,
+        ForeignKey("archived_tasks.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    Column(
+        "category_id",
+        Integer,
+        ForeignKey("categories.id", ondelete="CASCADE"),
+        primary_key=True,
+    ),
+)
+
+
+class ArchivedTask(Base):
+    """Completed task moved out of the tasks table, keeps its original id"""
+
+    __tablename__ = "archived_tasks"
+    __table_args__ = (Index("ix_archived_tasks_user_id_id", "user_id", "id"),)
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    title = Column(String(100), nullable=False)
+    description = Column(Text, nullable=True)
+    deadline = Column(DateTime, nullable=True)
+    status = Column(String(15))
+    priority = Column(String(10))
+    updated_at = Column(DateTime, nullable=False)
+    archived_at = Column(DateTime, nullable=False, default=datetime.now)
+
+    categories = relationship("Category", secondary=archived_task_categories)
+
+
+class ActivityLog(Base):
+    """
+    Audit entry of a task or category change. Entries are written behind
+    the requests in batches, see app.db.activity.
+    """
+
+    __tablename__ = "activity_log"
+    __table_args__ = (Index("ix_activity_log_entity_id", "entity", "entity_id", "id"),)
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    # Owner of the changed task, kept after the task is deleted
+    user_id = Column(Integer, nullable=True, index=True)
+    actor_id = Column(Integer, nullable=True)
+    entity = Column(String(20), nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    action = Column(String(30), nullable=False)
+    changes = Column(Text, nullable=True)
+    created_at = Column(DateTime, nullable=False)
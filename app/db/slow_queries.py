@@ -0,0 +1,253 @@
+"""
+Slow query log.
+
+Every statement sent by an engine is timed, statements slower than
+SLOW_QUERY_MS (0 turns the log off) are logged with the shapes of their
+parameters (types and lengths, never the values) and the service
+function that issued them.
+The plan of a slow statement is captured once per statement fingerprint
+by a background thread on a separate connection, so a statement that is
+slow for every request is explained only once per worker.
+
+SLOW_QUERY_EXPLAIN selects the plan: "plan" runs EXPLAIN, "analyze"
+runs EXPLAIN ANALYZE for SELECT statements, which executes them once
+more, and "off" disables the capture.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "plan")
+EXPLAIN_MODES = ("off", "plan", "analyze")
+MAX_FINGERPRINTS = 500
+EXPLAIN_TIMEOUT_MS = 30000
+START_TIMES_KEY = "slow_query_start_times"
+SKIP_OPTION = "skip_slow_query_log"
+
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|\?|(?<!:):\w+")
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_SPACES = re.compile(r"\s+")
+_EXPLAINABLE = ("select", "with", "insert", "update", "delete")
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Normalized statement: literals and placeholders become "?" and a list
+    of placeholders of any length becomes "?, ...", so an IN of ten IDs
+    and an IN of twenty have the same fingerprint
+    """
+    normalized = _STRING.sub("?", statement)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _NUMBER.sub("?", normalized)
+    normalized = _PLACEHOLDER_LIST.sub("?, ...", normalized)
+    return _SPACES.sub(" ", normalized).strip()
+
+
+def _value_shape(value: Any) -> str:
+    if isinstance(value, (str, bytes, list, tuple, set)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def parameter_shapes(parameters: Any, executemany: bool = False) -> Any:
+    """
+    Types of the bound parameters, with the length of strings and
+    sequences, e.g. {"user_id_1": "int", "title_1": "str[12]"}
+    """
+    if executemany:
+        rows = list(parameters)
+        return {"rows": len(rows), "first": parameter_shapes(rows[0]) if rows else None}
+    if isinstance(parameters, dict):
+        return {name: _value_shape(value) for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_value_shape(value) for value in parameters]
+    return _value_shape(parameters)
+
+
+def _caller() -> Optional[str]:
+    """First function of the application's services or web layer on the stack"""
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        filename = frame.f_code.co_filename.replace(os.sep, "/")
+        if "/app/" in filename and "/app/db/" not in filename:
+            location = f"{filename.rsplit('/app/', 1)[1]}:{frame.f_code.co_name}"
+            if "/app/services/" in filename:
+                return location
+            fallback = fallback or location
+        frame = frame.f_back
+    return fallback
+
+
+class SlowQueryLog:
+    """
+    Collects the slow statements of the process by fingerprint.
+
+    The statistics and plans of at most `max_fingerprints` statements are
+    kept, the least recently seen one is forgotten first.
+    """
+
+    def __init__(
+        self,
+        threshold_ms: float = 200.0,
+        explain: str = "plan",
+        max_fingerprints: int = MAX_FINGERPRINTS,
+    ):
+        if explain not in EXPLAIN_MODES:
+            raise ValueError(f"Unknown explain mode: {explain}")
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self.max_fingerprints = max_fingerprints
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def record(
+        self,
+        engine: Engine,
+        statement: str,
+        parameters: Any,
+        executemany: bool,
+        elapsed_ms: float,
+    ) -> None:
+        """Logs a slow statement and schedules the capture of its plan"""
+        key = hashlib.sha1(fingerprint(statement).encode()).hexdigest()[:12]
+        shapes = parameter_shapes(parameters, executemany)
+        source = _caller()
+        logger.warning(
+            "Slow query %.0f ms [%s] from %s: %s; parameters: %s",
+            elapsed_ms,
+            key,
+            source,
+            _SPACES.sub(" ", statement).strip(),
+            shapes,
+        )
+
+        with self._lock:
+            entry = self._entries.get(key)
+            is_new = entry is None
+            if is_new:
+                entry = self._entries[key] = {
+                    "fingerprint": key,
+                    "statement": fingerprint(statement),
+                    "parameters": shapes,
+                    "source": source,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "plan": None,
+                }
+                while len(self._entries) > self.max_fingerprints:
+                    self._entries.popitem(last=False)
+            self._entries.move_to_end(key)
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+
+        if is_new and self.explain != "off":
+            sample = list(parameters)[0] if executemany else parameters
+            self._submit(self._capture_plan, engine, key, statement, sample)
+
+    def _submit(self, function, *args) -> None:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="slow-query-explain"
+                )
+            self._executor.submit(function, *args)
+
+    def _capture_plan(
+        self, engine: Engine, key: str, statement: str, parameters: Any
+    ) -> None:
+        verb = statement.lstrip().split(None, 1)[0].lower()
+        if verb not in _EXPLAINABLE:
+            return
+        dialect = engine.dialect.name
+        if dialect == "postgresql":
+            prefix = "EXPLAIN"
+            if self.explain == "analyze" and verb == "select":
+                prefix = "EXPLAIN (ANALYZE, BUFFERS)"
+        elif dialect == "sqlite":
+            prefix = "EXPLAIN QUERY PLAN"
+        else:
+            return
+
+        try:
+            with engine.connect() as connection:
+                connection = connection.execution_options(**{SKIP_OPTION: True})
+                # Never committed, an explained write changes nothing
+                with connection.begin() as transaction:
+                    if dialect == "postgresql":
+                        connection.exec_driver_sql(
+                            f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}"
+                        )
+                    rows = connection.exec_driver_sql(
+                        f"{prefix} {statement}", parameters
+                    ).all()
+                    transaction.rollback()
+        except SQLAlchemyError:
+            logger.exception("Plan of slow query [%s] not captured", key)
+            return
+
+        plan = "\n".join(" ".join(str(value) for value in row) for row in rows)
+        with self._lock:
+            if key in self._entries:
+                self._entries[key]["plan"] = plan
+        logger.warning("Plan of slow query [%s]:\n%s", key, plan)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Collected statements, the slowest in total first"""
+        with self._lock:
+            entries = [dict(entry) for entry in self._entries.values()]
+        return sorted(entries, key=lambda entry: entry["total_ms"], reverse=True)
+
+    def stop(self) -> None:
+        """Stops the plan capture, plans that are still queued are skipped"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+slow_query_log = SlowQueryLog(SLOW_QUERY_MS, SLOW_QUERY_EXPLAIN)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_timer(conn, cursor, statement, parameters, context, executemany) -> None:
+    conn.info.setdefault(START_TIMES_KEY, []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _check_duration(conn, cursor, statement, parameters, context, executemany):
+    elapsed_ms = (time.perf_counter() - conn.info[START_TIMES_KEY].pop()) * 1000
+    threshold_ms = slow_query_log.threshold_ms
+    if threshold_ms <= 0 or elapsed_ms < threshold_ms:
+        return
+    if conn.get_execution_options().get(SKIP_OPTION):
+        return
+    slow_query_log.record(conn.engine, statement, parameters, executemany, elapsed_ms)
+
+
+@event.listens_for(Engine, "handle_error")
+def _drop_timer(exception_context) -> None:
+    # A failed statement never reaches after_cursor_execute
+    connection = exception_context.connection
+    if connection is not None and connection.info.get(START_TIMES_KEY):
+        connection.info[START_TIMES_KEY].pop()
@@ -0,0 +1,27 @@
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+
+def insert_ignoring_conflicts(db: Session, target, index_elements):
+    """
+    INSERT ... ON CONFLICT DO NOTHING in the dialect of the session.
+
+    args:
+    db: Database session
+    target: Mapped class or table to insert into
+    index_elements: Columns of the unique index that decides the conflict
+
+    returns:
+    Insert: Statement to add values and RETURNING to
+
+    raises:
+    NotImplementedError: If the database supports neither dialect
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        statement = postgresql.insert(target)
+    elif dialect == "sqlite":
+        statement = sqlite.insert(target)
+    else:
+        raise NotImplementedError(f"ON CONFLICT is not supported by {dialect}")
+    return statement.on_conflict_do_nothing(index_elements=index_elements)
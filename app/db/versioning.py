@@ -0,0 +1,306 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import (
+    DDL,
+    BigInteger,
+    Column,
+    Engine,
+    Integer,
+    Sequence,
+    Table,
+    event,
+    inspect,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session, attributes
+
+from app.db.database import Base, get_engine
+
+logger = logging.getLogger(__name__)
+
+VERSION_KEY = "change_version"
+# Version of the transaction when each open savepoint was started
+SAVEPOINT_VERSIONS_KEY = "savepoint_change_versions"
+# Advisory lock held by every transaction from before it takes a version
+WRITER_LOCK_KEY = (0x66746B76, 0)
+SETTLE_ATTEMPTS = 20
+SETTLE_DELAY = 0.005
+SETTLED_PUBLISH_SECONDS = float(os.getenv("SETTLED_VERSION_PUBLISH_SECONDS", "1"))
+
+# Change versions on PostgreSQL. Writers never wait for each other, but
+# versions can commit out of order, so readers only trust the versions
+# up to settled_change_version().
+change_version_seq = Sequence("change_version_seq", metadata=Base.metadata)
+
+# Single-row counter of change versions for databases without sequences.
+# Taking a version locks the row until the transaction ends, so versions
+# become visible in commit order. SQLite serializes writers anyway.
+# On PostgreSQL the row holds the settled version published by
+# SettledVersionPublisher instead, see replayed_change_version().
+change_counter = Table(
+    "change_counter",
+    Base.metadata,
+    Column("id", Integer, primary_key=True),
+    Column("value", BigInteger, nullable=False),
+)
+
+event.listen(
+    change_counter,
+    "after_create",
+    DDL("INSERT INTO change_counter (id, value) VALUES (1, 0)"),
+)
+
+
+# The writer lock is taken before nextval() and the version is locked
+# right after it, so a reader sees every version taken and not committed
+_TAKE_VERSION = text(
+    """
+    SELECT taken.version
+    FROM (
+        SELECT nextval('change_version_seq') AS version
+        FROM pg_advisory_xact_lock_shared(:lock_class, :lock_key) AS writer
+        OFFSET 0
+    ) AS taken, pg_advisory_xact_lock_shared(taken.version) AS held
+    """
+)
+
+# Lowest version held by a running transaction and the number of writers
+# between nextval() and the lock of their version
+_UNSETTLED_VERSIONS = text(
+    """
+    SELECT
+        min((classid::bigint << 32) | objid::bigint)
+            FILTER (WHERE objsubid = 1),
+        count(*) FILTER (WHERE objsubid = 2)
+            - count(*) FILTER (WHERE objsubid = 1)
+    FROM pg_locks
+    WHERE locktype = 'advisory'
+        AND granted
+        AND database = (
+            SELECT oid FROM pg_database WHERE datname = current_database()
+        )
+        AND (objsubid = 1 OR (classid = :lock_class AND objid = :lock_key))
+    """
+)
+
+_LAST_VERSION = text(
+    "SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END "
+    "FROM change_version_seq"
+)
+
+
+def current_change_version(connection: Connection) -> int:
+    """
+    Returns the change version of the connection's current transaction.
+
+    Every row written in one transaction gets the same version, a new one
+    is only taken on the first call.
+    """
+    version = connection.info.get(VERSION_KEY)
+    if version is None:
+        if connection.dialect.name == "postgresql":
+            lock_class, lock_key = WRITER_LOCK_KEY
+            version = connection.execute(
+                _TAKE_VERSION, {"lock_class": lock_class, "lock_key": lock_key}
+            ).scalar_one()
+        else:
+            version = connection.execute(
+                update(change_counter)
+                .where(change_counter.c.id == 1)
+                .values(value=change_counter.c.value + 1)
+                .returning(change_counter.c.value)
+            ).scalar_one()
+        connection.info[VERSION_KEY] = version
+    return version
+
+
+def settled_change_version(connection: Connection) -> int:
+    """
+    Returns the highest version up to which every change is committed or
+    rolled back, so a client that has seen it never misses an older change.
+
+    Versions are held by single-key advisory locks, other users of such
+    locks in the same database would hold the horizon back.
+    """
+    if connection.dialect.name != "postgresql":
+        # The counter only shows committed versions
+        return connection.execute(
+            select(change_counter.c.value).where(change_counter.c.id == 1)
+        ).scalar_one()
+    lock_class, lock_key = WRITER_LOCK_KEY
+    for _ in range(SETTLE_ATTEMPTS):
+        # Read first: versions taken later are above it
+        last = connection.execute(_LAST_VERSION).scalar_one()
+        lowest, taking = connection.execute(
+            _UNSETTLED_VERSIONS, {"lock_class": lock_class, "lock_key": lock_key}
+        ).one()
+        if not taking:
+            return last if lowest is None else min(last, lowest - 1)
+        # A writer got a version it has not locked yet, it does in a moment
+        time.sleep(SETTLE_DELAY)
+    # Nothing can be trusted, the client asks again later
+    return 0
+
+
+def version_default(context) -> int:
+    """Column default that stamps inserted rows with the transaction version"""
+    return current_change_version(context.connection)
+
+
+def replayed_change_version(connection: Connection) -> int:
+    """
+    Returns a version up to which every change is visible to the
+    connection, also when it reads from a replica, with a single-row read.
+
+    On PostgreSQL it is the settled version the primary last published,
+    a replica replays the row only after the changes it covers. Elsewhere
+    the counter is the latest committed version.
+    """
+    return connection.execute(
+        select(change_counter.c.value).where(change_counter.c.id == 1)
+    ).scalar_one()
+
+
+class SettledVersionPublisher:
+    """
+    Background thread that stores the settled version of the primary in
+    the change_counter row every `interval` seconds, where the pages
+    read by replicas find it. Only needed on PostgreSQL, the row never
+    moves backwards when several workers publish.
+    """
+
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if get_engine().dialect.name != "postgresql":
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="settled-version", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.publish()
+            except Exception:
+                logger.exception("Settled version not published")
+            self._stopped.wait(self.interval)
+
+    def publish(self) -> int:
+        """
+        Publishes the current settled version.
+
+        returns:
+        int: The published version
+        """
+        with get_engine().begin() as connection:
+            settled = settled_change_version(connection)
+            connection.execute(
+                update(change_counter)
+                .where(change_counter.c.id == 1, change_counter.c.value < settled)
+                .values(value=settled)
+            )
+        return settled
+
+
+settled_version_publisher = SettledVersionPublisher(SETTLED_PUBLISH_SECONDS)
+
+
+@event.listens_for(Engine, "commit")
+@event.listens_for(Engine, "rollback")
+def _reset_version(connection: Connection) -> None:
+    connection.info.pop(VERSION_KEY, None)
+    connection.info.pop(SAVEPOINT_VERSIONS_KEY, None)
+
+
+@event.listens_for(Engine, "savepoint")
+def _remember_version(connection: Connection, name: str) -> None:
+    connection.info.setdefault(SAVEPOINT_VERSIONS_KEY, []).append(
+        connection.info.get(VERSION_KEY)
+    )
+
+
+@event.listens_for(Engine, "rollback_savepoint")
+def _restore_version(connection: Connection, name: str, context) -> None:
+    # A version taken inside the savepoint lost its lock or counter update
+    saved = connection.info.get(SAVEPOINT_VERSIONS_KEY)
+    version = saved.pop() if saved else None
+    if version is None:
+        connection.info.pop(VERSION_KEY, None)
+    else:
+        connection.info[VERSION_KEY] = version
+
+
+@event.listens_for(Engine, "release_savepoint")
+def _keep_version(connection: Connection, name: str, context) -> None:
+    saved = connection.info.get(SAVEPOINT_VERSIONS_KEY)
+    if saved:
+        saved.pop()
+
+
+@event.listens_for(Session, "before_flush")
+def _stamp_versions(session: Session, flush_context, instances) -> None:
+    """
+    Stamps changed tasks and categories with the transaction version and
+    records tombstones of deleted tasks, categories and task links
+    """
+    from app.db.models import Category, SyncTombstone, Task
+
+    changed = [
+        obj
+        for obj in list(session.new) + list(session.dirty)
+        if isinstance(obj, (Task, Category)) and session.is_modified(obj)
+    ]
+    deleted = [obj for obj in session.deleted if isinstance(obj, (Task, Category))]
+    if not changed and not deleted:
+        return
+
+    version = current_change_version(session.connection())
+    now = datetime.now()
+
+    for obj in changed:
+        obj.version = version
+        obj.updated_at = now
+        if isinstance(obj, Task) and inspect(obj).persistent:
+            removed = attributes.get_history(obj, "categories").deleted
+            for category in removed:
+                session.add(
+                    SyncTombstone(
+                        entity="task_category",
+                        entity_id=obj.id,
+                        related_id=category.id,
+                        user_id=obj.user_id,
+                        version=version,
+                        deleted_at=now,
+                    )
+                )
+
+    for obj in deleted:
+        session.add(
+            SyncTombstone(
+                entity="task" if isinstance(obj, Task) else "category",
+                entity_id=obj.id,
+                user_id=obj.user_id if isinstance(obj, Task) else None,
+                version=version,
+                deleted_at=now,
+            )
+        )
@@ -1,25 +1,37 @@
 from typing import Generator
 
-from fastapi import HTTPException, Request
+from fastapi import Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 
 from app.crud.auth import get_current_user_from_cookie
-from app.db.database import SessionLocal
+from app.db.database import ReadSessionLocal, get_db, get_replica_engines
 
 
-def get_db() -> Generator[Session, None, None]:
-    """Dependency to receive session for DB"""
-    db = SessionLocal()
-    try:
+def get_read_db(
+    request: Request, db: Session = Depends(get_db)
+) -> Generator[Session, None, None]:
+    """
+    Dependency to receive a read-only session, served by a read replica.
+
+    A client that has written within the last seconds reads from the
+    primary instead, so it sees its own changes despite replication lag.
+    Reads that go to the primary share the session of the request.
+    """
+    read_from_primary = getattr(request.state, "read_from_primary", False)
+    if read_from_primary or not get_replica_engines():
         yield db
+        return
+    read_db = ReadSessionLocal()
+    try:
+        yield read_db
     finally:
-        db.close()
+        read_db.close()
 
 
-def get_template_user(request: Request):
+def get_template_user(request: Request, db: Session = Depends(get_db)):
     """Returned user or None"""
     try:
-        current_user = get_current_user_from_cookie(request)
+        current_user = get_current_user_from_cookie(request, db)
         return current_user
     except HTTPException:
         return None
@@ -0,0 +1,419 @@
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+    event,
+    inspect,
+    select,
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import ORMExecuteState, Session
+
+from app.db.database import get_engine, init_db
+from app.db.models import Category, Task, User
+from app.services.recurrence_service import RecurrenceService
+
+logger = logging.getLogger(__name__)
+
+APPLYING_REMOTE = "replica_applying_remote"
+LOCAL_CHANGES = "replica_local_changes"
+
+replica_metadata = MetaData()
+
+# Link between a local task and its server copy. A local change bumps
+# revision, the sync pushes the task while revision > pushed_revision.
+# Deleted tasks keep their row until the delete reaches the server.
+replica_tasks = Table(
+    "replica_tasks",
+    replica_metadata,
+    Column("local_id", Integer, primary_key=True),
+    Column("remote_id", Integer, unique=True, nullable=True),
+    Column("user_id", Integer, nullable=False, index=True),
+    Column("revision", Integer, nullable=False, default=0),
+    Column("pushed_revision", Integer, nullable=False, default=0),
+    Column("deleted", Boolean, nullable=False, default=False),
+    Column("error", Text, nullable=True),
+)
+
+replica_state = Table(
+    "replica_state",
+    replica_metadata,
+    Column("key", String(50), primary_key=True),
+    Column("value", Text, nullable=True),
+)
+
+
+def _add_sync_columns() -> None:
+    """Adds the sync version columns to a replica created before they existed"""
+    with get_engine().begin() as connection:
+        for table in ("tasks", "categories", "task_categories"):
+            columns = {
+                column["name"] for column in inspect(connection).get_columns(table)
+            }
+            if "version" in columns:
+                continue
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table} ADD COLUMN version BIGINT NOT NULL DEFAULT 0"
+            )
+            # SQLite adds no column with a non-constant default, the ORM
+            # fills it from now on
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table} ADD COLUMN updated_at DATETIME"
+            )
+            connection.exec_driver_sql(
+                f"UPDATE {table} SET updated_at = datetime('now', 'localtime')"
+            )
+
+
+def _add_user_columns() -> None:
+    """Adds the account deletion column to a replica created before it existed"""
+    with get_engine().begin() as connection:
+        columns = {
+            column["name"] for column in inspect(connection).get_columns("users")
+        }
+        if "deleted_at" not in columns:
+            connection.exec_driver_sql(
+                "ALTER TABLE users ADD COLUMN deleted_at DATETIME"
+            )
+
+
+def _add_recurrence_columns() -> None:
+    """Adds the recurrence columns to a replica created before they existed"""
+    with get_engine().begin() as connection:
+        columns = {
+            column["name"] for column in inspect(connection).get_columns("tasks")
+        }
+        if "recurrence" in columns:
+            return
+        connection.exec_driver_sql(
+            "ALTER TABLE tasks ADD COLUMN recurrence VARCHAR(15)"
+        )
+        connection.exec_driver_sql(
+            "ALTER TABLE tasks ADD COLUMN recurrence_interval INTEGER NOT NULL "
+            "DEFAULT 1"
+        )
+        connection.exec_driver_sql(
+            "ALTER TABLE tasks ADD COLUMN recurrence_until DATETIME"
+        )
+
+
+def init_replica() -> None:
+    """Creates the application tables and the replica bookkeeping tables"""
+    init_db()
+    _add_sync_columns()
+    _add_user_columns()
+    _add_recurrence_columns()
+    replica_metadata.create_all(bind=get_engine())
+
+
+def _record_local_change(session: Session, task: Task, deleted: bool) -> None:
+    """Bumps the revision of a locally changed task"""
+    statement = sqlite_insert(replica_tasks).values(
+        local_id=task.id,
+        user_id=task.user_id,
+        revision=1,
+        pushed_revision=0,
+        deleted=deleted,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[replica_tasks.c.local_id],
+        set_={
+            "revision": replica_tasks.c.revision + 1,
+            "deleted": deleted,
+            "error": None,
+        },
+    )
+    session.connection().execute(statement)
+    session.info[LOCAL_CHANGES] = True
+
+
+def _track_task_changes(session: Session, flush_context) -> None:
+    if session.info.get(APPLYING_REMOTE):
+        return
+    for obj in session.new:
+        if isinstance(obj, Task):
+            _record_local_change(session, obj, deleted=False)
+    for obj in session.dirty:
+        if isinstance(obj, Task) and session.is_modified(obj):
+            _record_local_change(session, obj, deleted=False)
+    for obj in session.deleted:
+        if isinstance(obj, Task):
+            _record_local_change(session, obj, deleted=True)
+
+
+def _track_task_inserts(state: ORMExecuteState):
+    """Records tasks created by INSERT ... RETURNING, which bypasses the flush"""
+    if (
+        not state.is_insert
+        or state.session.info.get(APPLYING_REMOTE)
+        or state.bind_mapper is not inspect(Task)
+    ):
+        return None
+    frozen = state.invoke_statement().freeze()
+    for task in frozen().scalars():
+        _record_local_change(state.session, task, deleted=False)
+    return frozen()
+
+
+def install_change_tracking(on_local_commit=None) -> None:
+    """
+    Starts recording local task changes for the sync.
+
+    args:
+    on_local_commit: Called after a commit that contained local task changes
+    """
+    event.listen(Session, "after_flush", _track_task_changes)
+    event.listen(Session, "do_orm_execute", _track_task_inserts)
+
+    def _after_commit(session: Session) -> None:
+        if session.info.pop(LOCAL_CHANGES, False) and on_local_commit:
+            on_local_commit()
+
+    event.listen(Session, "after_commit", _after_commit)
+
+
+def get_state(db: Session, key: str) -> Optional[str]:
+    """Reads a value of the replica state"""
+    return db.execute(
+        select(replica_state.c.value).where(replica_state.c.key == key)
+    ).scalar()
+
+
+def set_state(db: Session, key: str, value: Optional[str]) -> None:
+    """Writes a value of the replica state, the caller commits"""
+    statement = sqlite_insert(replica_state).values(key=key, value=value)
+    db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[replica_state.c.key], set_={"value": value}
+        )
+    )
+
+
+def upsert_user(
+    db: Session, user_id: int, name: str, email: str, password_hash: str, is_admin
+) -> None:
+    """Creates or updates the local copy of a server account"""
+    user = db.get(User, user_id)
+    if user is None:
+        stale = db.query(User).filter_by(email=email).first()
+        if stale is not None:
+            db.delete(stale)
+            db.flush()
+        user = User(id=user_id)
+        db.add(user)
+    user.name = name
+    user.email = email
+    user.password = password_hash
+    user.is_admin = bool(is_admin)
+
+
+def pending_tasks(db: Session, user_id: int) -> List[dict]:
+    """Returns the locally changed tasks of the user that are not pushed yet"""
+    rows = db.execute(
+        select(replica_tasks).where(
+            replica_tasks.c.user_id == user_id,
+            replica_tasks.c.revision > replica_tasks.c.pushed_revision,
+        )
+    ).mappings()
+    return [dict(row) for row in rows]
+
+
+def mark_pushed(
+    db: Session, local_id: int, revision: int, remote_id: Optional[int] = None
+) -> None:
+    """Marks the revision as pushed, a newer local change stays pending"""
+    values = {"pushed_revision": revision, "error": None}
+    if remote_id is not None:
+        values["remote_id"] = remote_id
+    db.execute(
+        replica_tasks.update()
+        .where(replica_tasks.c.local_id == local_id)
+        .values(**values)
+    )
+
+
+def mark_failed(db: Session, local_id: int, revision: int, error: str) -> None:
+    """Stores the server error and stops retrying until the next local change"""
+    db.execute(
+        replica_tasks.update()
+        .where(replica_tasks.c.local_id == local_id)
+        .values(pushed_revision=revision, error=error)
+    )
+
+
+def forget_task(db: Session, local_id: int) -> None:
+    """Drops the bookkeeping row of a task that no longer exists anywhere"""
+    db.execute(replica_tasks.delete().where(replica_tasks.c.local_id == local_id))
+
+
+def apply_remote_categories(
+    db: Session, categories: List[dict], deleted_ids: Iterable[int] = ()
+) -> None:
+    """Applies changed and deleted server categories, IDs are kept"""
+    for category_id in deleted_ids:
+        category = db.get(Category, category_id)
+        if category is not None:
+            db.delete(category)
+    # Deleted titles may come back under new IDs, titles are unique
+    db.flush()
+    for data in categories:
+        category = db.get(Category, data["id"])
+        if category is None:
+            category = Category(id=data["id"])
+            db.add(category)
+        category.title = data["title"]
+
+
+def _parse_deadline(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+def _task_links(db: Session, user_id: int) -> Dict[int, dict]:
+    return {
+        row.remote_id: dict(row._mapping)
+        for row in db.execute(
+            select(replica_tasks).where(
+                replica_tasks.c.user_id == user_id,
+                replica_tasks.c.remote_id.is_not(None),
+            )
+        )
+    }
+
+
+def _drop_remote_task(db: Session, link: dict) -> None:
+    task = db.get(Task, link["local_id"])
+    if task is not None:
+        db.delete(task)
+    forget_task(db, link["local_id"])
+
+
+def apply_remote_tasks(
+    db: Session, user_id: int, tasks: List[dict], deleted_ids: Iterable[int] = ()
+) -> None:
+    """
+    Applies changed and deleted server tasks of the user to the replica.
+
+    Tasks with unpushed local changes are left alone, the local change
+    wins when it is pushed. A local task that was never linked to the
+    server and has the title of a new server task is adopted by it: its
+    create reached the server but the response got lost, or the task was
+    created on both sides. Any other server task whose title is held by
+    a local task is skipped, the push reports the conflict.
+    """
+    links = _task_links(db, user_id)
+    for remote_id in deleted_ids:
+        link = links.pop(remote_id, None)
+        if link is not None and link["revision"] <= link["pushed_revision"]:
+            _drop_remote_task(db, link)
+
+    unlinked = {
+        row.local_id: dict(row._mapping)
+        for row in db.execute(
+            select(replica_tasks).where(
+                replica_tasks.c.user_id == user_id,
+                replica_tasks.c.remote_id.is_(None),
+                replica_tasks.c.deleted.is_(False),
+            )
+        )
+    }
+    titles = dict(db.query(Task.title, Task.id).filter_by(user_id=user_id).all())
+
+    changes = []
+    for data in tasks:
+        link = links.get(data["id"])
+        if link is None and titles.get(data["title"]) in unlinked:
+            link = unlinked.pop(titles[data["title"]])
+            link["remote_id"] = data["id"]
+            db.execute(
+                replica_tasks.update()
+                .where(replica_tasks.c.local_id == link["local_id"])
+                .values(remote_id=data["id"], error=None)
+            )
+            links[data["id"]] = link
+        if link is not None and link["revision"] > link["pushed_revision"]:
+            continue
+        task = db.get(Task, link["local_id"]) if link is not None else None
+        changes.append((data, link, task))
+
+    # A title held by a local task that keeps its title blocks the server
+    # task, skipping it may keep another title held, so repeat until stable
+    skipped = True
+    while skipped:
+        skipped = False
+        moving = {task.id for _, _, task in changes if task is not None}
+        for change in list(changes):
+            holder = titles.get(change[0]["title"])
+            if holder is not None and holder not in moving:
+                logger.warning(
+                    "Server task %s clashes with a local title", change[0]["id"]
+                )
+                changes.remove(change)
+                skipped = True
+
+    for data, link, task in changes:
+        if task is not None and task.title != data["title"]:
+            # Titles are unique per user, parking the old ones first lets
+            # tasks of one page swap titles
+            task.title = f"~sync~{data['id']}"
+    db.flush()
+
+    for data, link, task in changes:
+        if task is None:
+            task = Task(user_id=user_id)
+            db.add(task)
+        task.title = data["title"]
+        task.description = data["description"]
+        task.deadline = _parse_deadline(data["deadline"])
+        task.status = data["status"]
+        task.priority = data["priority"]
+        task.recurrence = data.get("recurrence")
+        task.recurrence_interval = data.get("recurrence_interval") or 1
+        task.recurrence_until = _parse_deadline(data.get("recurrence_until"))
+        if task.id is not None:
+            # Occurrences stored for a rule the server changed
+            RecurrenceService.drop_stale_occurrences(task)
+        task.categories = [
+            category
+            for category in (
+                db.get(Category, category["id"]) for category in data["categories"]
+            )
+            if category is not None
+        ]
+        db.flush()
+        if link is None:
+            db.execute(
+                replica_tasks.insert().values(
+                    local_id=task.id,
+                    remote_id=data["id"],
+                    user_id=user_id,
+                    revision=0,
+                    pushed_revision=0,
+                    deleted=False,
+                )
+            )
+
+
+def prune_remote_rows(
+    db: Session, user_id: int, task_ids: Set[int], category_ids: Set[int]
+) -> None:
+    """
+    Removes server rows that a full sync did not return.
+
+    Catches up a replica whose deletes happened before the server kept
+    tombstones, locally created and unpushed tasks are kept.
+    """
+    for category in db.query(Category).all():
+        if category.id not in category_ids:
+            db.delete(category)
+    for remote_id, link in _task_links(db, user_id).items():
+        if remote_id in task_ids or link["revision"] > link["pushed_revision"]:
+            continue
+        _drop_remote_task(db, link)
@@ -0,0 +1,375 @@
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+import requests
+from jose import jwt
+
+from app.crud.security import hash_password
+from app.db.database import SessionLocal
+from app.db.models import Task
+from app.desktop.replica import (
+    APPLYING_REMOTE,
+    apply_remote_categories,
+    apply_remote_tasks,
+    forget_task,
+    get_state,
+    mark_failed,
+    mark_pushed,
+    pending_tasks,
+    prune_remote_rows,
+    set_state,
+    upsert_user,
+)
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 500
+BATCH_SIZE = 100
+
+
+class RemoteUnavailable(Exception):
+    """The server can not be reached, the replica keeps working offline"""
+
+
+class RemoteAuthError(Exception):
+    """The server rejected the stored credentials"""
+
+
+class RemoteClient:
+    """Client of the server JSON API used by the sync"""
+
+    def __init__(self, base_url: str, timeout: float = 10.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.http = requests.Session()
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        try:
+            return self.http.request(
+                method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs
+            )
+        except requests.RequestException as e:
+            raise RemoteUnavailable(str(e)) from e
+
+    def obtain_tokens(self, email: str, password: str) -> Dict[str, str]:
+        """
+        Signs in on the server.
+
+        raises:
+        ValueError: If the server rejects the email or password
+        RemoteUnavailable: If the server can not be reached
+        """
+        response = self._request(
+            "POST",
+            "/api/v1/auth/token",
+            data={"username": email, "password": password},
+        )
+        if response.status_code == 401:
+            raise ValueError("Неверный email или пароль")
+        if response.status_code != 200:
+            raise RemoteUnavailable(f"Ошибка сервера: {response.status_code}")
+        return response.json()
+
+    def refresh_tokens(self, refresh_token: str) -> Dict[str, str]:
+        response = self._request(
+            "POST", "/api/v1/auth/refresh", json={"refresh_token": refresh_token}
+        )
+        if response.status_code == 401:
+            raise RemoteAuthError(response.text)
+        if response.status_code != 200:
+            raise RemoteUnavailable(f"Ошибка сервера: {response.status_code}")
+        return response.json()
+
+    def register(self, name: str, email: str, password: str) -> None:
+        """
+        Registers an account on the server through the registration form.
+
+        raises:
+        ValueError: If the server does not accept the registration
+        RemoteUnavailable: If the server can not be reached
+        """
+        response = self._request(
+            "POST",
+            "/register",
+            data={"name": name, "email": email, "password": password},
+            allow_redirects=False,
+        )
+        if response.status_code != 302:
+            raise ValueError("Сервер не принял регистрацию, проверьте данные")
+
+    def authorized(
+        self, method: str, path: str, access_token: str, **kwargs
+    ) -> requests.Response:
+        response = self._request(
+            method,
+            path,
+            headers={"Authorization": f"Bearer {access_token}"},
+            **kwargs,
+        )
+        if response.status_code == 401:
+            raise RemoteAuthError(response.text)
+        if response.status_code >= 500:
+            raise RemoteUnavailable(f"Ошибка сервера: {response.status_code}")
+        return response
+
+    def changes_since(self, version: int, access_token: str) -> dict:
+        return self.authorized(
+            "GET",
+            "/api/v1/sync/changes",
+            access_token,
+            params={"since": version, "limit": PAGE_SIZE},
+        ).json()
+
+
+class SyncWorker:
+    """
+    Background thread that keeps the replica and the server in step.
+
+    Local task changes are pushed through the batch endpoint, then the
+    server state is pulled. The worker runs every `interval` seconds and
+    right away after a local commit that changed tasks.
+    """
+
+    def __init__(self, client: RemoteClient, interval: float = 30.0):
+        self.client = client
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_error: Optional[str] = None
+
+    def start(self) -> None:
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="replica-sync", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.client.timeout + 1)
+            self._thread = None
+
+    def trigger(self) -> None:
+        """Asks for a sync as soon as possible"""
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            try:
+                self.sync_once()
+                self.last_error = None
+            except RemoteUnavailable as e:
+                self.last_error = str(e)
+                logger.info("Server is unavailable, working offline: %s", e)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.exception("Replica sync failed")
+            self._wakeup.wait(self.interval)
+
+    def sync_once(self) -> None:
+        """Pushes local changes and pulls the server state of the signed-in user"""
+        db = SessionLocal()
+        try:
+            user_id = get_state(db, "user_id")
+            if user_id is None:
+                return
+            self._with_token(db, lambda token: self._push(db, int(user_id), token))
+            self._with_token(db, lambda token: self._pull(db, int(user_id), token))
+        finally:
+            db.close()
+
+    def _with_token(self, db, action: Callable[[str], None]) -> None:
+        """Runs the action, refreshing the server tokens once if they expired"""
+        access_token = get_state(db, "access_token")
+        if access_token is None:
+            return
+        try:
+            action(access_token)
+        except RemoteAuthError:
+            refresh_token = get_state(db, "refresh_token")
+            if refresh_token is None:
+                raise
+            tokens = self.client.refresh_tokens(refresh_token)
+            set_state(db, "access_token", tokens["access_token"])
+            if tokens.get("refresh_token"):
+                set_state(db, "refresh_token", tokens["refresh_token"])
+            db.commit()
+            action(tokens["access_token"])
+
+    def _push(self, db, user_id: int, access_token: str) -> None:
+        pending = pending_tasks(db, user_id)
+        operations: List[dict] = []
+        sent: List[dict] = []
+        for row in pending:
+            if row["deleted"]:
+                if row["remote_id"] is None:
+                    forget_task(db, row["local_id"])
+                    continue
+                operations.append({"op": "delete", "id": row["remote_id"]})
+            else:
+                task = db.get(Task, row["local_id"])
+                if task is None:
+                    forget_task(db, row["local_id"])
+                    continue
+                data = {
+                    "title": task.title,
+                    "description": task.description,
+                    "deadline": task.deadline.isoformat() if task.deadline else None,
+                    "categories": [category.id for category in task.categories],
+                    "status": task.status,
+                    "priority": task.priority,
+                    "recurrence": task.recurrence,
+                    "recurrence_interval": task.recurrence_interval or 1,
+                    "recurrence_until": (
+                        task.recurrence_until.isoformat()
+                        if task.recurrence_until
+                        else None
+                    ),
+                }
+                if row["remote_id"] is None:
+                    operations.append({"op": "create", "data": data})
+                else:
+                    operations.append(
+                        {"op": "update", "id": row["remote_id"], "data": data}
+                    )
+            sent.append(row)
+        db.commit()
+
+        for start in range(0, len(operations), BATCH_SIZE):
+            response = self.client.authorized(
+                "POST",
+                "/api/v1/tasks/batch",
+                access_token,
+                json={"operations": operations[start : start + BATCH_SIZE]},
+            )
+            results = response.json()["results"]
+            for row, result in zip(sent[start : start + BATCH_SIZE], results):
+                self._apply_push_result(db, row, result)
+            db.commit()
+
+    @staticmethod
+    def _apply_push_result(db, row: dict, result: dict) -> None:
+        status = result["status"]
+        if row["deleted"]:
+            if status in (204, 404):
+                forget_task(db, row["local_id"])
+            else:
+                mark_failed(db, row["local_id"], row["revision"], result["error"])
+        elif status in (200, 201):
+            mark_pushed(
+                db, row["local_id"], row["revision"], remote_id=result["task"]["id"]
+            )
+        else:
+            mark_failed(db, row["local_id"], row["revision"], result["error"])
+
+    def _pull(self, db, user_id: int, access_token: str) -> None:
+        """
+        Pulls the server changes since the last applied version.
+
+        The first sync starts from version 0 and also removes the rows
+        the server no longer has.
+        """
+        since = int(get_state(db, "sync_version") or 0)
+        full_sync = since == 0
+        seen_tasks, seen_categories = set(), set()
+        while True:
+            changes = self.client.changes_since(since, access_token)
+            db.info[APPLYING_REMOTE] = True
+            try:
+                apply_remote_categories(
+                    db, changes["categories"], changes["deleted"]["categories"]
+                )
+                apply_remote_tasks(
+                    db, user_id, changes["tasks"], changes["deleted"]["tasks"]
+                )
+                seen_tasks.update(task["id"] for task in changes["tasks"])
+                seen_categories.update(
+                    category["id"] for category in changes["categories"]
+                )
+                if full_sync and not changes["has_more"]:
+                    prune_remote_rows(db, user_id, seen_tasks, seen_categories)
+                since = changes["version"]
+                set_state(db, "sync_version", str(since))
+                db.commit()
+            finally:
+                db.info.pop(APPLYING_REMOTE, None)
+            if not changes["has_more"]:
+                return
+
+
+class DesktopReplica:
+    """Entry point of the offline desktop mode used by the web routes"""
+
+    def __init__(self, server_url: str, interval: float = 30.0):
+        self.client = RemoteClient(server_url)
+        self.worker = SyncWorker(self.client, interval=interval)
+
+    def start(self) -> None:
+        self.worker.start()
+
+    def stop(self) -> None:
+        self.worker.stop()
+
+    def sign_in(self, email: str, password: str) -> None:
+        """
+        Signs in on the server and refreshes the local copy of the account.
+
+        Without a connection the local copy is used as is, so the user
+        can sign in offline with the password of the last online sign-in.
+
+        raises:
+        ValueError: If the server rejects the email or password
+        """
+        try:
+            tokens = self.client.obtain_tokens(email, password)
+        except RemoteUnavailable:
+            return
+
+        claims = jwt.get_unverified_claims(tokens["access_token"])
+        db = SessionLocal()
+        try:
+            upsert_user(
+                db,
+                int(claims["sub"]),
+                claims["name"],
+                email,
+                hash_password(password),
+                claims.get("is_admin", False),
+            )
+            if get_state(db, "user_id") != claims["sub"]:
+                set_state(db, "sync_version", None)
+            set_state(db, "user_id", claims["sub"])
+            set_state(db, "access_token", tokens["access_token"])
+            set_state(db, "refresh_token", tokens.get("refresh_token"))
+            db.commit()
+        finally:
+            db.close()
+        self.worker.trigger()
+
+    def register(self, name: str, email: str, password: str) -> None:
+        """
+        Registers the account on the server, the local copy is created
+        on the first sign-in.
+
+        raises:
+        ValueError: If the server is unavailable or rejects the registration
+        """
+        try:
+            self.client.register(name, email, password)
+        except RemoteUnavailable:
+            raise ValueError("Регистрация доступна только при подключении к серверу")
+
+    def sign_out(self) -> None:
+        """Forgets the server tokens, unpushed changes stay in the replica"""
+        db = SessionLocal()
+        try:
+            for key in ("user_id", "access_token", "refresh_token", "sync_version"):
+                set_state(db, key, None)
+            db.commit()
+        finally:
+            db.close()
@@ -0,0 +1,107 @@
+from datetime import datetime
+from typing import Annotated, List, Literal, Optional, Union
+
+from pydantic import BaseModel, Field, field_validator
+
+
+def to_naive_local(value: Optional[datetime]) -> Optional[datetime]:
+    """Deadlines are stored as naive local time, aware values are converted"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+
+class TaskCreateRequest(BaseModel):
+    title: str
+    description: Optional[str] = None
+    deadline: Optional[datetime] = None
+    categories: Optional[List[int]] = None
+    status: str = "не выполнена"
+    priority: str = "средний"
+    recurrence: Optional[str] = None
+    recurrence_interval: int = 1
+    recurrence_until: Optional[datetime] = None
+
+    _normalize_deadline = field_validator("deadline", "recurrence_until")(
+        to_naive_local
+    )
+
+
+class TaskUpdateRequest(BaseModel):
+    title: Optional[str] = None
+    description: Optional[str] = None
+    deadline: Optional[datetime] = None
+    categories: Optional[List[int]] = None
+    status: Optional[str] = None
+    priority: Optional[str] = None
+    recurrence: Optional[str] = None
+    recurrence_interval: Optional[int] = None
+    recurrence_until: Optional[datetime] = None
+
+    _normalize_deadline = field_validator("deadline", "recurrence_until")(
+        to_naive_local
+    )
+
+
+class OccurrenceUpdateRequest(BaseModel):
+    status: Optional[str] = None
+    description: Optional[str] = None
+    deadline: Optional[datetime] = None
+
+    _normalize_deadline = field_validator("deadline")(to_naive_local)
+
+
+class CreateOperation(BaseModel):
+    op: Literal["create"]
+    data: TaskCreateRequest
+
+
+class UpdateOperation(BaseModel):
+    op: Literal["update"]
+    id: int
+    data: TaskUpdateRequest
+
+
+class DeleteOperation(BaseModel):
+    op: Literal["delete"]
+    id: int
+
+
+class StatusOperation(BaseModel):
+    op: Literal["status"]
+    id: int
+    status: str
+
+
+BatchOperation = Annotated[
+    Union[CreateOperation, UpdateOperation, DeleteOperation, StatusOperation],
+    Field(discriminator="op"),
+]
+
+
+class BatchRequest(BaseModel):
+    operations: List[BatchOperation] = Field(min_length=1, max_length=100)
+    atomic: bool = False
+
+
+class TokenResponse(BaseModel):
+    access_token: str
+    refresh_token: Optional[str] = None
+    token_type: str = "bearer"
+
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+
+class CategoriesCreateRequest(BaseModel):
+    titles: List[str] = Field(min_length=1, max_length=1000)
+
+
+class CategoriesDeleteRequest(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=1000)
+
+
+class CategoriesMergeRequest(BaseModel):
+    source_ids: List[int] = Field(min_length=1, max_length=1000)
+    target_id: int
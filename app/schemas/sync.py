@@ -0,0 +1,14 @@
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+
+@dataclass
+class ChangeSet:
+    version: int
+    has_more: bool = False
+    tasks: list = field(default_factory=list)
+    categories: list = field(default_factory=list)
+    links: List[Tuple[int, int]] = field(default_factory=list)
+    deleted_tasks: List[int] = field(default_factory=list)
+    deleted_categories: List[int] = field(default_factory=list)
+    deleted_links: List[Tuple[int, int]] = field(default_factory=list)
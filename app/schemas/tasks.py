@@ -1,6 +1,6 @@
 import datetime
 from dataclasses import dataclass
-from typing import List, Optional, Union
+from typing import Any, Dict, List, Optional, Union
 
 NOT_PROVIDED = object()
 
@@ -13,6 +13,9 @@ class TaskCreateData:
     categories: Optional[List[int]] = None
     status: str = "не выполнена"
     priority: str = "средний"
+    recurrence: Optional[str] = None
+    recurrence_interval: int = 1
+    recurrence_until: Union[datetime, str] = None
 
 
 @dataclass
@@ -23,9 +26,50 @@ class TaskUpdateData:
     categories: Optional[List[int]] = NOT_PROVIDED
     status: Optional[str] = NOT_PROVIDED
     priority: Optional[str] = NOT_PROVIDED
+    recurrence: Optional[str] = NOT_PROVIDED
+    recurrence_interval: Optional[int] = NOT_PROVIDED
+    recurrence_until: Union[datetime, str, None] = NOT_PROVIDED
 
 
 @dataclass
 class TaskFilterData:
     status: Optional[str] = None
     priority: Optional[str] = None
+
+
+@dataclass
+class OccurrenceUpdateData:
+    status: Optional[str] = None
+    description: Optional[str] = NOT_PROVIDED
+    deadline: Optional[datetime.datetime] = None
+
+
+@dataclass
+class TaskOccurrenceData:
+    task_id: int
+    title: str
+    priority: str
+    occurs_at: datetime.datetime
+    deadline: datetime.datetime
+    status: str
+    description: Optional[str] = None
+    stored: bool = False
+
+
+@dataclass
+class CalendarEntry:
+    task_id: int
+    title: str
+    status: str
+    priority: str
+    deadline: datetime.datetime
+    occurs_at: Optional[datetime.datetime] = None
+
+
+@dataclass
+class ActivityEntry:
+    id: int
+    action: str
+    actor_id: Optional[int]
+    changes: Dict[str, Any]
+    created_at: datetime.datetime
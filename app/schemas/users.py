@@ -0,0 +1,15 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class CurrentUser:
+    id: int
+    name: str
+    is_admin: bool = False
+
+
+@dataclass
+class SessionTokens:
+    access_token: str
+    refresh_token: Optional[str] = None
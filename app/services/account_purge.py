@@ -0,0 +1,79 @@
+import logging
+import os
+import threading
+from typing import Optional
+
+from app.db.database import SessionLocal
+from app.db.invalidation import invalidation_bus
+from app.services.user_service import UserService
+
+logger = logging.getLogger(__name__)
+
+
+class AccountPurgeWorker:
+    """
+    Background thread that purges deleted accounts batch by batch.
+
+    Every batch is its own short transaction, so locks are held for one
+    batch only and a restarted worker continues where the last committed
+    batch stopped. Workers of several processes share the queue, a
+    deletion locked by one of them is skipped by the others.
+    """
+
+    def __init__(
+        self, batch_size: int = 500, pause: float = 0.05, interval: float = 60.0
+    ):
+        self.batch_size = batch_size
+        self.pause = pause
+        self.interval = interval
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="account-purge", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def trigger(self) -> None:
+        """Asks for a purge as soon as possible"""
+        self._wakeup.set()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            try:
+                self.purge_pending()
+            except Exception:
+                logger.exception("Account purge failed")
+            self._wakeup.wait(self.interval)
+
+    def purge_pending(self) -> None:
+        """Purges batches until no unfinished deletion is left"""
+        while not self._stopped.is_set():
+            db = SessionLocal()
+            try:
+                purged = UserService.purge_deleted_user_batch(db, self.batch_size)
+            finally:
+                db.close()
+            if not purged:
+                return
+            # Leaves room for the foreground queries between batches
+            self._stopped.wait(self.pause)
+
+
+account_purge_worker = AccountPurgeWorker(
+    batch_size=int(os.getenv("ACCOUNT_PURGE_BATCH_SIZE", "500"))
+)
+invalidation_bus.subscribe(
+    "account_deletions", lambda key: account_purge_worker.trigger()
+)
@@ -0,0 +1,58 @@
+import json
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.db.models import ActivityLog
+from app.schemas.tasks import ActivityEntry
+
+MAX_HISTORY_LIMIT = 200
+
+
+class ActivityService:
+    @staticmethod
+    def get_task_history(
+        db: Session,
+        user_id: int,
+        task_id: int,
+        limit: int = 50,
+        before_id: Optional[int] = None,
+    ) -> List[ActivityEntry]:
+        """
+        Getting the activity log of a user's task, newest entries first.
+
+        The history outlives the task, a deleted or archived task keeps
+        its entries. Pages are read by keyset over the entry IDs.
+
+        args:
+        db: Database session
+        user_id: User ID, owner of the task
+        task_id: Task ID
+        limit: Maximum number of entries
+        before_id: Only entries older than this entry are returned
+
+        returns:
+        List[ActivityEntry]: Entries with their parsed changes
+        """
+        query = db.query(ActivityLog).filter(
+            ActivityLog.entity == "task",
+            ActivityLog.entity_id == task_id,
+            ActivityLog.user_id == user_id,
+        )
+        if before_id is not None:
+            query = query.filter(ActivityLog.id < before_id)
+        rows = (
+            query.order_by(ActivityLog.id.desc())
+            .limit(min(limit, MAX_HISTORY_LIMIT))
+            .all()
+        )
+        return [
+            ActivityEntry(
+                id=row.id,
+                action=row.action,
+                actor_id=row.actor_id,
+                changes=json.loads(row.changes) if row.changes else {},
+                created_at=row.created_at,
+            )
+            for row in rows
+        ]
@@ -0,0 +1,182 @@
+from datetime import datetime
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import DateTime, delete, func, insert, literal, select
+from sqlalchemy.orm import Session, selectinload
+
+from app.crud.constants import COMPLETED_STATUS
+from app.db.activity import record_activity
+from app.db.invalidation import invalidation_bus
+from app.db.models import (
+    ArchivedTask,
+    SyncTombstone,
+    Task,
+    TaskOccurrence,
+    archived_task_categories,
+    task_categories_association,
+)
+from app.db.versioning import current_change_version
+
+ARCHIVED_COLUMNS = (
+    "id",
+    "user_id",
+    "title",
+    "description",
+    "deadline",
+    "status",
+    "priority",
+    "updated_at",
+)
+EXPORT_CHUNK_SIZE = 500
+
+
+class ArchiveService:
+    @staticmethod
+    def archive_completed_batch(
+        db: Session, completed_before: datetime, batch_size: int
+    ) -> int:
+        """
+        Moves one batch of completed tasks with their category links into
+        the archive tables in a short transaction.
+
+        The tasks leave the delta sync as deleted and disappear from the
+        owners' open pages, exactly like tasks deleted by the user.
+
+        args:
+        db: Database session
+        completed_before: Tasks last changed before this moment are moved
+        batch_size: Maximum number of tasks moved by the batch
+
+        returns:
+        int: Number of moved tasks, 0 when nothing is left to archive
+        """
+        rows = db.execute(
+            select(Task.id, Task.user_id)
+            .where(Task.status == COMPLETED_STATUS, Task.updated_at < completed_before)
+            .order_by(Task.updated_at)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not rows:
+            return 0
+
+        task_ids = [row.id for row in rows]
+        links = task_categories_association
+        now = datetime.now()
+
+        db.execute(
+            insert(ArchivedTask).from_select(
+                [*ARCHIVED_COLUMNS, "archived_at"],
+                select(
+                    *(getattr(Task, column) for column in ARCHIVED_COLUMNS),
+                    literal(now, DateTime),
+                ).where(Task.id.in_(task_ids)),
+            )
+        )
+        db.execute(
+            insert(archived_task_categories).from_select(
+                ["task_id", "category_id"],
+                select(links.c.task_id, links.c.category_id).where(
+                    links.c.task_id.in_(task_ids)
+                ),
+            )
+        )
+        db.execute(delete(links).where(links.c.task_id.in_(task_ids)))
+        # A finished series leaves its stored occurrences behind
+        db.execute(delete(TaskOccurrence).where(TaskOccurrence.task_id.in_(task_ids)))
+        db.execute(delete(Task).where(Task.id.in_(task_ids)))
+
+        version = current_change_version(db.connection())
+        db.execute(
+            insert(SyncTombstone),
+            [
+                {
+                    "entity": "task",
+                    "entity_id": row.id,
+                    "user_id": row.user_id,
+                    "version": version,
+                    "deleted_at": now,
+                }
+                for row in rows
+            ],
+        )
+        for row in rows:
+            invalidation_bus.publish(
+                db, "tasks", f"{row.user_id}:{row.id}:deleted:{version}"
+            )
+            record_activity(db, "task", row.id, "archived", row.user_id)
+        db.commit()
+        return len(rows)
+
+    @staticmethod
+    def _user_archive(user_id: int, query: str):
+        statement = select(ArchivedTask).where(ArchivedTask.user_id == user_id)
+        clean_query = query.strip().lower()
+        if clean_query:
+            statement = statement.where(
+                func.lower(ArchivedTask.title).contains(clean_query, autoescape=True)
+            )
+        return statement
+
+    @staticmethod
+    def search_archived_tasks(
+        db: Session, user_id: int, query: str = "", limit: int = 50, offset: int = 0
+    ) -> Tuple[List[ArchivedTask], int]:
+        """
+        Searching the user's archived tasks by title, newest first.
+
+        args:
+        db: Database session
+        user_id: User ID
+        query: Part of the title, empty for the whole archive
+        limit: Maximum number of tasks on the page
+        offset: Number of tasks to skip
+
+        returns:
+        Tuple[List[ArchivedTask], int]: Tasks of the page and the total count
+        """
+        statement = ArchiveService._user_archive(user_id, query)
+        total = db.execute(
+            select(func.count()).select_from(statement.subquery())
+        ).scalar_one()
+        tasks = (
+            db.execute(
+                statement.options(selectinload(ArchivedTask.categories))
+                .order_by(ArchivedTask.id.desc())
+                .limit(limit)
+                .offset(offset)
+            )
+            .scalars()
+            .all()
+        )
+        return tasks, total
+
+    @staticmethod
+    def iter_archived_tasks(
+        db: Session, user_id: int, query: str = ""
+    ) -> Iterator[ArchivedTask]:
+        """
+        Iterating over the user's archived tasks for an export.
+
+        The archive is read in chunks of EXPORT_CHUNK_SIZE tasks ordered by
+        id, so an export of any size holds one chunk in memory.
+        """
+        statement = ArchiveService._user_archive(user_id, query).options(
+            selectinload(ArchivedTask.categories)
+        )
+        last_id = 0
+        while True:
+            chunk = (
+                db.execute(
+                    statement.where(ArchivedTask.id > last_id)
+                    .order_by(ArchivedTask.id)
+                    .limit(EXPORT_CHUNK_SIZE)
+                )
+                .scalars()
+                .all()
+            )
+            if not chunk:
+                return
+            yield from chunk
+            last_id = chunk[-1].id
+            db.expunge_all()
@@ -0,0 +1,140 @@
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.db.models import Task
+from app.schemas.tasks import CalendarEntry
+from app.services.recurrence_service import RecurrenceService
+
+
+def _day_bounds(start: date, end: date) -> Tuple[datetime, datetime]:
+    return datetime.combine(start, time.min), datetime.combine(end, time.min)
+
+
+def _as_date(value) -> date:
+    """DATE() gives a date on PostgreSQL and an ISO string on SQLite"""
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+class CalendarService:
+    @staticmethod
+    def month_window(day: date) -> Tuple[date, date]:
+        """
+        Visible days of the month grid around a day: whole weeks from the
+        Monday before the 1st to the Sunday after the last day.
+
+        returns:
+        Tuple[date, date]: First visible day and the day after the last one
+        """
+        first = day.replace(day=1)
+        next_month = (first + timedelta(days=31)).replace(day=1)
+        start = first - timedelta(days=first.weekday())
+        end = next_month + timedelta(days=(7 - next_month.weekday()) % 7)
+        return start, end
+
+    @staticmethod
+    def week_window(day: date) -> Tuple[date, date]:
+        """Monday of the day's week and the Monday after it"""
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=7)
+
+    @staticmethod
+    def count_by_day(
+        db: Session, user_id: int, start: date, end: date
+    ) -> Dict[date, int]:
+        """
+        Number of tasks due on each day of a window.
+
+        The tasks are counted by one GROUP BY over the (user_id, deadline)
+        index, so the cost depends on the window and not on the tasks
+        outside it. Occurrences of recurring tasks are added to their days.
+
+        args:
+        db: Database session
+        user_id: User ID
+        start: First day of the window
+        end: Day after the last day of the window
+
+        returns:
+        Dict[date, int]: Days with tasks and their task count
+        """
+        window_start, window_end = _day_bounds(start, end)
+        day = func.date(Task.deadline)
+        rows = (
+            db.query(day, func.count())
+            .filter(
+                Task.user_id == user_id,
+                Task.deadline >= window_start,
+                Task.deadline < window_end,
+                Task.recurrence.is_(None),
+            )
+            .group_by(day)
+        )
+        counts = defaultdict(int)
+        for value, count in rows:
+            counts[_as_date(value)] += count
+        for occurrence in RecurrenceService.get_occurrences(
+            db, user_id, window_start, window_end
+        ):
+            counts[occurrence.deadline.date()] += 1
+        return dict(counts)
+
+    @staticmethod
+    def get_entries(
+        db: Session, user_id: int, start: date, end: date
+    ) -> Dict[date, List[CalendarEntry]]:
+        """
+        Tasks and occurrences of recurring tasks due within a window,
+        grouped by day.
+
+        args:
+        db: Database session
+        user_id: User ID
+        start: First day of the window
+        end: Day after the last day of the window
+
+        returns:
+        Dict[date, List[CalendarEntry]]: Entries of each day ordered by deadline
+        """
+        window_start, window_end = _day_bounds(start, end)
+        tasks = (
+            db.query(Task.id, Task.title, Task.status, Task.priority, Task.deadline)
+            .filter(
+                Task.user_id == user_id,
+                Task.deadline >= window_start,
+                Task.deadline < window_end,
+                Task.recurrence.is_(None),
+            )
+            .order_by(Task.deadline, Task.id)
+        )
+        entries = [
+            CalendarEntry(
+                task_id=task.id,
+                title=task.title,
+                status=task.status,
+                priority=task.priority,
+                deadline=task.deadline,
+            )
+            for task in tasks
+        ]
+        entries.extend(
+            CalendarEntry(
+                task_id=occurrence.task_id,
+                title=occurrence.title,
+                status=occurrence.status,
+                priority=occurrence.priority,
+                deadline=occurrence.deadline,
+                occurs_at=occurrence.occurs_at,
+            )
+            for occurrence in RecurrenceService.get_occurrences(
+                db, user_id, window_start, window_end
+            )
+        )
+
+        days = defaultdict(list)
+        for entry in sorted(entries, key=lambda entry: (entry.deadline, entry.task_id)):
+            days[entry.deadline.date()].append(entry)
+        return dict(days)
@@ -1,33 +1,214 @@
-from typing import List
+from datetime import datetime
+from typing import Iterable, List, Tuple
 
-from sqlalchemy.orm import Session
+from sqlalchemy import Table, delete, func, insert, select, update
+from sqlalchemy.orm import Session, aliased
 
-from app.db.models import Category
+from app.db.activity import record_activity
+from app.db.invalidation import ALL_KEYS, invalidation_bus
+from app.db.models import (
+    Category,
+    SyncTombstone,
+    Task,
+    archived_task_categories,
+    task_categories_association,
+)
+from app.db.upsert import insert_ignoring_conflicts
+from app.db.versioning import current_change_version
+from app.services.category_index import category_index
+
+MAX_TITLE_LENGTH = 50
 
 
 class CategoryService:
     @staticmethod
-    def create_category(db: Session, title: str) -> Category:
-        """Create new category with validate data"""
+    def _clean_title(title: str) -> str:
         clean_title = title.lower().strip()
         if not clean_title:
             raise ValueError("Название категории не может быть пустым")
+        if len(clean_title) > MAX_TITLE_LENGTH:
+            raise ValueError(
+                f"Название категории не может быть длиннее {MAX_TITLE_LENGTH} символов"
+            )
+        return clean_title
+
+    @staticmethod
+    def _insert_categories(db: Session, titles: List[str]) -> List[Category]:
+        """Inserts the titles in one statement, existing titles are skipped"""
+        statement = (
+            insert_ignoring_conflicts(db, Category, ["title"])
+            .values([{"title": title} for title in titles])
+            .returning(Category)
+        )
+        return list(db.scalars(statement))
 
-        existing = db.query(Category).filter_by(title=clean_title).first()
-        if existing:
+    @staticmethod
+    def create_category(db: Session, title: str) -> Category:
+        """Create new category with validate data"""
+        clean_title = CategoryService._clean_title(title)
+        created = CategoryService._insert_categories(db, [clean_title])
+        if not created:
+            db.rollback()
             raise ValueError("Такая категория уже существует")
 
-        category = Category(title=clean_title)
-        db.add(category)
+        category = created[0]
+        invalidation_bus.publish(db, "categories", category.id)
+        record_activity(
+            db, "category", category.id, "created", changes={"title": category.title}
+        )
         db.commit()
-        db.refresh(category)
         return category
 
+    @staticmethod
+    def create_categories(
+        db: Session, titles: Iterable[str]
+    ) -> Tuple[List[Category], List[str]]:
+        """
+        Bulk creation of categories with a single INSERT.
+
+        args:
+        db: Database session
+        titles: Titles of the new categories, blank ones are ignored
+
+        returns:
+        Tuple[List[Category], List[str]]: Created categories and the titles
+        that already existed
+
+        raises:
+        ValueError: If no title is given or a title is too long
+        """
+        clean_titles = list(
+            dict.fromkeys(
+                CategoryService._clean_title(title) for title in titles if title.strip()
+            )
+        )
+        if not clean_titles:
+            raise ValueError("Название категории не может быть пустым")
+
+        created = CategoryService._insert_categories(db, clean_titles)
+        if created:
+            invalidation_bus.publish(db, "categories", ALL_KEYS)
+        for category in created:
+            record_activity(
+                db,
+                "category",
+                category.id,
+                "created",
+                changes={"title": category.title},
+            )
+        db.commit()
+        created_titles = {category.title for category in created}
+        existing = [title for title in clean_titles if title not in created_titles]
+        return created, existing
+
     @staticmethod
     def get_all_categories(db: Session) -> List[Category]:
         """Getting all categories"""
         return db.query(Category).all()
 
+    @staticmethod
+    def get_categories_by_ids(
+        db: Session, category_ids: Iterable[int]
+    ) -> List[Category]:
+        """Getting the categories with the given IDs ordered by title"""
+        ids = set(category_ids)
+        if not ids:
+            return []
+        return (
+            db.query(Category)
+            .filter(Category.id.in_(ids))
+            .order_by(Category.title)
+            .all()
+        )
+
+    @staticmethod
+    def search_categories(db: Session, query: str, limit: int = 10) -> List[Category]:
+        """
+        Typeahead search of categories.
+
+        On Postgres titles starting with the query come first (btree index
+        with text_pattern_ops), the rest is filled with titles containing
+        it (pg_trgm GIN index). Other databases are served by the
+        in-memory prefix index.
+
+        args:
+        db: Database session
+        query: Beginning of the title
+        limit: Maximum number of categories
+
+        returns:
+        List[Category]: Matching categories, prefix matches first
+        """
+        clean_query = query.lower().strip()
+        if not clean_query:
+            return []
+
+        if db.get_bind().dialect.name != "postgresql":
+            return [
+                Category(id=category_id, title=title)
+                for title, category_id in category_index.search(clean_query, limit)
+            ]
+
+        pattern = (
+            clean_query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        )
+        matches = (
+            db.query(Category)
+            .filter(Category.title.like(f"{pattern}%", escape="\\"))
+            .order_by(Category.title)
+            .limit(limit)
+            .all()
+        )
+        # Trigram indexes need at least three characters to narrow anything
+        if len(matches) < limit and len(clean_query) >= 3:
+            matches += (
+                db.query(Category)
+                .filter(
+                    Category.title.like(f"%{pattern}%", escape="\\"),
+                    Category.title.notlike(f"{pattern}%", escape="\\"),
+                )
+                .order_by(func.length(Category.title), Category.title)
+                .limit(limit - len(matches))
+                .all()
+            )
+        return matches
+
+    @staticmethod
+    def get_categories_page(
+        db: Session, limit: int, offset: int = 0
+    ) -> Tuple[List[Category], int]:
+        """Getting one page of categories ordered by ID and the total count"""
+        total = db.query(Category).count()
+        categories = (
+            db.query(Category).order_by(Category.id).limit(limit).offset(offset).all()
+        )
+        return categories, total
+
+    @staticmethod
+    def _touch_tasks(
+        db: Session, category_ids: List[int], version: int, now: datetime
+    ) -> None:
+        """
+        Stamps the tasks linked to the categories with the version, so the
+        delta sync re-sends their category lists, and announces them to the
+        owners' open pages. Called while the links still exist.
+        """
+        links = task_categories_association
+        touched = db.execute(
+            update(Task)
+            .where(
+                Task.id.in_(
+                    select(links.c.task_id).where(links.c.category_id.in_(category_ids))
+                )
+            )
+            .values(version=version, updated_at=now)
+            .returning(Task.id, Task.user_id)
+        ).all()
+        for task_id, user_id in touched:
+            invalidation_bus.publish(
+                db, "tasks", f"{user_id}:{task_id}:changed:{version}"
+            )
+
     @staticmethod
     def delete_category(db: Session, category_id: int) -> str:
         """
@@ -37,17 +218,167 @@ class CategoryService:
         category = db.get(Category, category_id)
         if not category:
             raise ValueError("Категория с таким ID не найдена")
+        CategoryService._touch_tasks(
+            db, [category_id], current_change_version(db.connection()), datetime.now()
+        )
+        db.execute(
+            delete(archived_task_categories).where(
+                archived_task_categories.c.category_id == category_id
+            )
+        )
+        record_activity(
+            db, "category", category_id, "deleted", changes={"title": category.title}
+        )
         db.delete(category)
+        invalidation_bus.publish(db, "categories", category_id)
         db.commit()
         return "Категория успешно удалена"
 
     @staticmethod
-    def delete_categories_list(db: Session, categories_ids: list[int]) -> str:
-        """Deleting list categories and return success message or raise ValueError"""
-        for category_id in categories_ids:
-            category = db.get(Category, category_id)
-            if not category:
-                raise ValueError(f"Категория с {category_id} не найдена")
-            db.delete(category)
+    def _tombstone_categories(
+        db: Session, category_ids: List[int], version: int, now: datetime
+    ) -> None:
+        db.execute(
+            insert(SyncTombstone),
+            [
+                {
+                    "entity": "category",
+                    "entity_id": category_id,
+                    "version": version,
+                    "deleted_at": now,
+                }
+                for category_id in category_ids
+            ],
+        )
+
+    @staticmethod
+    def delete_categories_list(
+        db: Session, categories_ids: List[int]
+    ) -> Tuple[List[int], List[int]]:
+        """
+        Bulk deletion of categories with a constant number of statements.
+
+        args:
+        db: Database session
+        categories_ids: IDs of the categories to delete
+
+        returns:
+        Tuple[List[int], List[int]]: Deleted IDs and the IDs that were not found
+        """
+        requested = list(dict.fromkeys(categories_ids))
+        if not requested:
+            return [], []
+
+        version = current_change_version(db.connection())
+        now = datetime.now()
+        CategoryService._touch_tasks(db, requested, version, now)
+        for links in (task_categories_association, archived_task_categories):
+            db.execute(delete(links).where(links.c.category_id.in_(requested)))
+        deleted = sorted(
+            db.execute(
+                delete(Category)
+                .where(Category.id.in_(requested))
+                .returning(Category.id)
+            ).scalars()
+        )
+        if deleted:
+            CategoryService._tombstone_categories(db, deleted, version, now)
+            invalidation_bus.publish(db, "categories", ALL_KEYS)
+        for category_id in deleted:
+            record_activity(db, "category", category_id, "deleted")
+        db.commit()
+        deleted_set = set(deleted)
+        return deleted, [
+            category_id for category_id in requested if category_id not in deleted_set
+        ]
+
+    @staticmethod
+    def _move_links(
+        db: Session, links: Table, sources: List[int], target_id: int, **values
+    ) -> int:
+        """
+        Moves the links of the source categories to the target by one
+        UPDATE, a task that ends up with the target twice keeps one link.
+        The links left on the sources are deleted.
+
+        returns:
+        int: Number of moved links
+        """
+        other = aliased(links)
+        moved = db.execute(
+            update(links)
+            .where(
+                links.c.category_id.in_(sources),
+                ~select(other.c.task_id)
+                .where(
+                    other.c.task_id == links.c.task_id, other.c.category_id == target_id
+                )
+                .exists(),
+                links.c.category_id
+                == select(func.min(other.c.category_id))
+                .where(
+                    other.c.task_id == links.c.task_id, other.c.category_id.in_(sources)
+                )
+                .scalar_subquery(),
+            )
+            .values(category_id=target_id, **values)
+        ).rowcount
+        db.execute(delete(links).where(links.c.category_id.in_(sources)))
+        return moved
+
+    @staticmethod
+    def merge_categories(db: Session, source_ids: List[int], target_id: int) -> int:
+        """
+        Merges categories into the target one with set-based statements.
+
+        Links of active and archived tasks to the source categories are
+        moved to the target, the source categories are deleted afterwards.
+
+        args:
+        db: Database session
+        source_ids: IDs of the categories to merge
+        target_id: ID of the category that stays
+
+        returns:
+        int: Number of moved task links
+
+        raises:
+        ValueError: If a category is not found or the target is among the sources
+        """
+        sources = list(dict.fromkeys(source_ids))
+        if not sources:
+            raise ValueError("Не выбраны категории для объединения")
+        if target_id in sources:
+            raise ValueError("Категория не может быть объединена сама с собой")
+
+        found = set(
+            db.execute(
+                select(Category.id).where(Category.id.in_([*sources, target_id]))
+            ).scalars()
+        )
+        missing = [
+            category_id
+            for category_id in [*sources, target_id]
+            if category_id not in found
+        ]
+        if missing:
+            raise ValueError(f"Категории не найдены: {', '.join(map(str, missing))}")
+
+        links = task_categories_association
+        version = current_change_version(db.connection())
+        now = datetime.now()
+
+        CategoryService._touch_tasks(db, sources, version, now)
+        moved = CategoryService._move_links(
+            db, links, sources, target_id, version=version, updated_at=now
+        )
+        CategoryService._move_links(db, archived_task_categories, sources, target_id)
+        db.execute(delete(Category).where(Category.id.in_(sources)))
+        CategoryService._tombstone_categories(db, sources, version, now)
+        invalidation_bus.publish(db, "categories", ALL_KEYS)
+        for category_id in sources:
+            record_activity(
+                db, "category", category_id, "merged", changes={"target_id": target_id}
+            )
         db.commit()
-        return "Категории успешно удалены"
+        return moved
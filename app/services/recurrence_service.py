@@ -0,0 +1,337 @@
+import calendar
+from datetime import datetime, time, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.crud.constants import ALLOWED_RECURRENCES, ALLOWED_STATUSES
+from app.db.activity import record_activity
+from app.db.models import Task, TaskOccurrence
+from app.schemas.tasks import NOT_PROVIDED, OccurrenceUpdateData, TaskOccurrenceData
+
+RECURRENCE_STEPS = {"ежедневно": timedelta(days=1), "еженедельно": timedelta(weeks=1)}
+MONTHLY = "ежемесячно"
+MAX_RECURRENCE_INTERVAL = 365
+DEFAULT_OCCURRENCE_STATUS = "не выполнена"
+
+
+def _add_months(moment: datetime, months: int) -> datetime:
+    """Shifts a moment by whole months, the day is clamped to the month's length"""
+    month_index = moment.month - 1 + months
+    year, month = moment.year + month_index // 12, month_index % 12 + 1
+    day = min(moment.day, calendar.monthrange(year, month)[1])
+    return moment.replace(year=year, month=month, day=day)
+
+
+def occurrence_dates(
+    start: datetime,
+    rule: str,
+    interval: int,
+    window_start: datetime,
+    window_end: datetime,
+    until: Optional[datetime] = None,
+) -> Iterator[datetime]:
+    """
+    Yields the occurrences of a recurrence rule within a window.
+
+    The first occurrence in the window is computed arithmetically, so the
+    cost depends on the size of the window and not on how long the task
+    has been repeating.
+
+    args:
+    start: First occurrence, the deadline of the task
+    rule: One of ALLOWED_RECURRENCES
+    interval: Number of days, weeks or months between the occurrences
+    window_start: Beginning of the window, inclusive
+    window_end: End of the window, exclusive
+    until: Last moment an occurrence may fall on
+    """
+    if rule == MONTHLY:
+        months = (window_start.year - start.year) * 12 + (
+            window_start.month - start.month
+        )
+        # One step back, a clamped day may fall before the window's day
+        index = max(0, months // interval - 1)
+
+        def moment_at(position: int) -> datetime:
+            return _add_months(start, position * interval)
+
+    else:
+        step = RECURRENCE_STEPS[rule] * interval
+        index = max(0, -((start - window_start) // step))
+
+        def moment_at(position: int) -> datetime:
+            return start + step * position
+
+    while True:
+        moment = moment_at(index)
+        if moment >= window_end or (until is not None and moment > until):
+            return
+        if moment >= window_start:
+            yield moment
+        index += 1
+
+
+def task_occurrence_dates(
+    task: Task, window_start: datetime, window_end: datetime
+) -> Iterator[datetime]:
+    """Yields the occurrences of a task within a window, none if it does not repeat"""
+    if not task.recurrence or task.deadline is None:
+        return iter(())
+    return occurrence_dates(
+        task.deadline,
+        task.recurrence,
+        task.recurrence_interval or 1,
+        window_start,
+        window_end,
+        task.recurrence_until,
+    )
+
+
+def is_occurrence(task: Task, moment: datetime) -> bool:
+    """Tells whether the task's rule puts an occurrence at the moment"""
+    return any(task_occurrence_dates(task, moment, moment + timedelta(microseconds=1)))
+
+
+class RecurrenceService:
+    @staticmethod
+    def validate_rule(
+        recurrence: Optional[str],
+        interval: Optional[int],
+        until: Union[datetime, str, None],
+        deadline: Optional[datetime],
+    ) -> Tuple[Optional[str], int, Optional[datetime]]:
+        """
+        Validates a recurrence rule of a task.
+
+        args:
+        recurrence: One of ALLOWED_RECURRENCES, empty for a task that
+        does not repeat
+        interval: Number of days, weeks or months between the occurrences
+        until: Last day of the repetitions as a datetime or a string in
+        the 'YYYY-MM-DD' format, empty to repeat without end
+        deadline: Deadline of the task, the first occurrence
+
+        returns:
+        Tuple[Optional[str], int, Optional[datetime]]: Rule, interval and end
+
+        raises:
+        ValueError: If the rule is invalid
+        """
+        recurrence = (recurrence or "").lower().strip() or None
+        if recurrence is None:
+            return None, 1, None
+        if recurrence not in ALLOWED_RECURRENCES:
+            raise ValueError("Недопустимое правило повторения")
+        if deadline is None:
+            raise ValueError("Для повторяющейся задачи нужен срок выполнения")
+
+        interval = interval or 1
+        if not 1 <= interval <= MAX_RECURRENCE_INTERVAL:
+            raise ValueError(
+                f"Интервал повторения должен быть от 1 до {MAX_RECURRENCE_INTERVAL}"
+            )
+
+        if isinstance(until, str):
+            if not until.strip():
+                until = None
+            else:
+                try:
+                    until = datetime.combine(
+                        datetime.strptime(until.strip(), "%Y-%m-%d").date(), time.max
+                    )
+                except ValueError:
+                    raise ValueError(
+                        "Неверный формат даты окончания. Ожидается формат: "
+                        "'YYYY-MM-DD'"
+                    )
+        if until is not None and until < deadline:
+            raise ValueError("Повторения не могут закончиться раньше срока выполнения")
+        return recurrence, interval, until
+
+    @staticmethod
+    def drop_stale_occurrences(task: Task) -> None:
+        """
+        Removes the stored occurrences that the task's current rule no
+        longer produces, e.g. after its deadline or rule changed
+        """
+        for occurrence in list(task.occurrences):
+            if not is_occurrence(task, occurrence.occurs_at):
+                task.occurrences.remove(occurrence)
+
+    @staticmethod
+    def _to_data(
+        task: Task, occurs_at: datetime, stored: Optional[TaskOccurrence] = None
+    ) -> TaskOccurrenceData:
+        if stored is None:
+            return TaskOccurrenceData(
+                task_id=task.id,
+                title=task.title,
+                priority=task.priority,
+                occurs_at=occurs_at,
+                deadline=occurs_at,
+                status=DEFAULT_OCCURRENCE_STATUS,
+                description=task.description,
+            )
+        return TaskOccurrenceData(
+            task_id=task.id,
+            title=task.title,
+            priority=task.priority,
+            occurs_at=occurs_at,
+            deadline=stored.deadline,
+            status=stored.status,
+            description=stored.description,
+            stored=True,
+        )
+
+    @staticmethod
+    def get_occurrences(
+        db: Session, user_id: int, window_start: datetime, window_end: datetime
+    ) -> List[TaskOccurrenceData]:
+        """
+        Getting the occurrences of the user's recurring tasks due within a
+        window.
+
+        Occurrences are computed from the rules, only the completed or
+        edited ones are read from the task_occurrences table.
+
+        args:
+        db: Database session
+        user_id: User ID
+        window_start: Beginning of the window, inclusive
+        window_end: End of the window, exclusive
+
+        returns:
+        List[TaskOccurrenceData]: Occurrences ordered by their deadline
+        """
+        tasks = (
+            db.query(Task)
+            .filter(
+                Task.user_id == user_id,
+                Task.recurrence.isnot(None),
+                Task.deadline < window_end,
+                or_(
+                    Task.recurrence_until.is_(None),
+                    Task.recurrence_until >= window_start,
+                ),
+            )
+            .all()
+        )
+        stored: Dict[Tuple[int, datetime], Tuple[TaskOccurrence, Task]] = {
+            (occurrence.task_id, occurrence.occurs_at): (occurrence, task)
+            for occurrence, task in db.query(TaskOccurrence, Task)
+            .join(Task, Task.id == TaskOccurrence.task_id)
+            .filter(
+                Task.user_id == user_id,
+                or_(
+                    TaskOccurrence.occurs_at.between(window_start, window_end),
+                    TaskOccurrence.deadline.between(window_start, window_end),
+                ),
+            )
+        }
+
+        occurrences = []
+        for task in tasks:
+            for moment in task_occurrence_dates(task, window_start, window_end):
+                occurrence, _ = stored.pop((task.id, moment), (None, None))
+                occurrences.append(RecurrenceService._to_data(task, moment, occurrence))
+        # Occurrences moved into the window from outside of it
+        for occurrence, task in stored.values():
+            occurrences.append(
+                RecurrenceService._to_data(task, occurrence.occurs_at, occurrence)
+            )
+
+        return sorted(
+            (
+                occurrence
+                for occurrence in occurrences
+                if window_start <= occurrence.deadline < window_end
+            ),
+            key=lambda occurrence: (occurrence.deadline, occurrence.task_id),
+        )
+
+    @staticmethod
+    def update_occurrence(
+        db: Session,
+        user_id: int,
+        task_id: int,
+        occurs_at: datetime,
+        update_data: OccurrenceUpdateData,
+    ) -> TaskOccurrenceData:
+        """
+        Changes the status, description or deadline of one occurrence.
+
+        The occurrence is stored only while it differs from the task,
+        an occurrence changed back is removed again.
+
+        args:
+        db: Database session
+        user_id: User ID
+        task_id: Task ID
+        occurs_at: Moment of the occurrence given by the rule
+        update_data: Data to update
+
+        returns:
+        TaskOccurrenceData: Updated occurrence
+
+        raises:
+        ValueError: If the task or the occurrence is not found or the data is invalid
+        """
+        task = db.query(Task).filter_by(id=task_id, user_id=user_id).first()
+        if not task:
+            raise ValueError("Задача не найдена")
+        if not task.recurrence:
+            raise ValueError("Задача не повторяется")
+        if not is_occurrence(task, occurs_at):
+            raise ValueError("Повторение задачи не найдено")
+
+        occurrence = (
+            db.query(TaskOccurrence)
+            .filter_by(task_id=task.id, occurs_at=occurs_at)
+            .first()
+        )
+        current = RecurrenceService._to_data(task, occurs_at, occurrence)
+
+        status = current.status
+        if update_data.status is not None:
+            status = update_data.status.lower().strip()
+            if status not in ALLOWED_STATUSES:
+                raise ValueError("Недопустимый статус задачи")
+        description = current.description
+        if update_data.description is not NOT_PROVIDED:
+            description = update_data.description
+        deadline = update_data.deadline or current.deadline
+
+        if (
+            status == DEFAULT_OCCURRENCE_STATUS
+            and description == task.description
+            and deadline == occurs_at
+        ):
+            if occurrence is not None:
+                db.delete(occurrence)
+                occurrence = None
+        else:
+            if occurrence is None:
+                occurrence = TaskOccurrence(task_id=task.id, occurs_at=occurs_at)
+                db.add(occurrence)
+            occurrence.status = status
+            occurrence.description = description
+            occurrence.deadline = deadline
+            occurrence.updated_at = datetime.now()
+        changes = {
+            field: [old, new]
+            for field, old, new in (
+                ("status", current.status, status),
+                ("description", current.description, description),
+                ("deadline", current.deadline, deadline),
+            )
+            if old != new
+        }
+        if changes:
+            changes["occurs_at"] = occurs_at
+            record_activity(
+                db, "task", task.id, "occurrence_updated", task.user_id, changes
+            )
+        db.commit()
+        return RecurrenceService._to_data(task, occurs_at, occurrence)
@@ -0,0 +1,138 @@
+from sqlalchemy import func, or_, select, union_all
+from sqlalchemy.orm import Session, selectinload
+
+from app.db.models import Category, SyncTombstone, Task, task_categories_association
+from app.db.versioning import replayed_change_version, settled_change_version
+from app.schemas.sync import ChangeSet
+
+
+class SyncService:
+    @staticmethod
+    def _changed_versions(user_id: int, since: int, settled: int):
+        """
+        Versions of every row visible to the user that changed after `since`
+        up to the `settled` version
+        """
+        links = task_categories_association
+        return union_all(
+            select(Task.version).where(
+                Task.user_id == user_id, Task.version > since, Task.version <= settled
+            ),
+            select(Category.version).where(
+                Category.version > since, Category.version <= settled
+            ),
+            select(links.c.version)
+            .join(Task, Task.id == links.c.task_id)
+            .where(
+                Task.user_id == user_id,
+                links.c.version > since,
+                links.c.version <= settled,
+            ),
+            select(SyncTombstone.version).where(
+                or_(SyncTombstone.user_id == user_id, SyncTombstone.user_id.is_(None)),
+                SyncTombstone.version > since,
+                SyncTombstone.version <= settled,
+            ),
+        ).subquery()
+
+    @staticmethod
+    def page_version(db: Session) -> int:
+        """
+        Version a page is up to date with, the page asks for the changes
+        after it when it subscribes to the task events.
+
+        Read with one row from the page's own session before its data, so
+        it is also safe on a replica. It may lag behind the data, changes
+        the page already shows are then replayed to it again, which is
+        harmless.
+        """
+        return replayed_change_version(db.connection())
+
+    @staticmethod
+    def get_changes(db: Session, user_id: int, since: int, limit: int) -> ChangeSet:
+        """
+        Getting the rows that changed after a version.
+
+        Rows written in one transaction share a version and are never split
+        between pages, so a page may hold a bit more than `limit` rows.
+        Versions of transactions that are still running hold the page back,
+        see settled_change_version().
+
+        args:
+        db: Database session
+        user_id: User ID
+        since: Last version the client has applied, 0 for a full sync
+        limit: Approximate maximum number of changed rows
+
+        returns:
+        ChangeSet: Changed and deleted rows up to the returned version
+        """
+        settled = settled_change_version(db.connection())
+        if settled <= since:
+            return ChangeSet(version=since)
+        versions = SyncService._changed_versions(user_id, since, settled)
+        upto = db.execute(
+            select(versions.c.version)
+            .order_by(versions.c.version)
+            .offset(limit - 1)
+            .limit(1)
+        ).scalar()
+        if upto is None:
+            upto = db.execute(select(func.max(versions.c.version))).scalar() or since
+        changes = ChangeSet(version=upto)
+        if upto == since:
+            return changes
+
+        changes.has_more = (
+            db.execute(
+                select(versions.c.version).where(versions.c.version > upto).limit(1)
+            ).first()
+            is not None
+        )
+        changes.tasks = (
+            db.query(Task)
+            .options(selectinload(Task.categories))
+            .filter(Task.user_id == user_id, Task.version > since, Task.version <= upto)
+            .order_by(Task.id)
+            .all()
+        )
+        changes.categories = (
+            db.query(Category)
+            .filter(Category.version > since, Category.version <= upto)
+            .order_by(Category.id)
+            .all()
+        )
+        links = task_categories_association
+        changes.links = [
+            tuple(row)
+            for row in db.execute(
+                select(links.c.task_id, links.c.category_id)
+                .join(Task, Task.id == links.c.task_id)
+                .where(
+                    Task.user_id == user_id,
+                    links.c.version > since,
+                    links.c.version <= upto,
+                )
+                .order_by(links.c.task_id, links.c.category_id)
+            )
+        ]
+
+        tombstones = (
+            db.query(SyncTombstone)
+            .filter(
+                or_(SyncTombstone.user_id == user_id, SyncTombstone.user_id.is_(None)),
+                SyncTombstone.version > since,
+                SyncTombstone.version <= upto,
+            )
+            .order_by(SyncTombstone.id)
+        )
+        for tombstone in tombstones:
+            if tombstone.entity == "task":
+                changes.deleted_tasks.append(tombstone.entity_id)
+            elif tombstone.entity == "category":
+                changes.deleted_categories.append(tombstone.entity_id)
+            else:
+                changes.deleted_links.append(
+                    (tombstone.entity_id, tombstone.related_id)
+                )
+        return changes
@@ -1,28 +1,51 @@
 from datetime import datetime, timezone
-from typing import List, Optional, Union
+from typing import List, Optional, Tuple, Union
 
 from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session, selectinload
 
 from app.crud.constants import ALLOWED_PRIORITIES, ALLOWED_STATUSES
+from app.db.activity import changed_fields, record_activity
+from app.db.invalidation import invalidation_bus
 from app.db.models import Category, Task, User
+from app.db.upsert import insert_ignoring_conflicts
+from app.db.versioning import current_change_version
 from app.schemas.tasks import (
     NOT_PROVIDED,
     TaskCreateData,
     TaskFilterData,
     TaskUpdateData,
 )
+from app.services.recurrence_service import RecurrenceService
+
+# Fields whose old and new values are kept in the activity log
+TRACKED_FIELDS = (
+    "title",
+    "description",
+    "deadline",
+    "status",
+    "priority",
+    "recurrence",
+    "recurrence_interval",
+    "recurrence_until",
+    "categories",
+)
 
 
 class TaskService:
     @staticmethod
-    def _validate_deadline(deadline: Union[datetime, str]) -> Optional[datetime]:
+    def _validate_deadline(
+        deadline: Union[datetime, str], current: Optional[datetime] = None
+    ) -> Optional[datetime]:
         """
         Validates and converts a task deadline.
 
         args:
         deadline: Deadline as a datetime object or a
         string in the 'YYYY-MM-DD HH:MM' format
+        current: Deadline the task already has, it may stay in the past,
+        e.g. the first occurrence of a recurring task
 
         returns:
         Optional[datetime]: The validated deadline or None if an empty string is passed
@@ -40,7 +63,7 @@ class TaskService:
                     raise ValueError(
                         "Неверный формат даты. Ожидается формат: 'YYYY-MM-DD HH:MM'"
                     )
-        if deadline and deadline < datetime.now():
+        if deadline and deadline != current and deadline < datetime.now():
             raise ValueError("Нельзя установить дедлайн в прошлом")
         return deadline
 
@@ -52,6 +75,49 @@ class TaskService:
         if priority.lower().strip() not in ALLOWED_PRIORITIES:
             raise ValueError("Недопустимый приоритет задачи")
 
+    @staticmethod
+    def _publish_change(
+        db: Session, task: Task, kind: str = "changed", action: str = "updated"
+    ) -> None:
+        """
+        Announces a task change to the owner's open pages and records it in
+        the activity log after the commit.
+
+        args:
+        db: Database session
+        task: Changed task, its changes must not be flushed yet
+        kind: Kind of the invalidation event, "changed" or "deleted"
+        action: Action of the activity entry
+        """
+        if action == "updated":
+            changes = changed_fields(task, TRACKED_FIELDS)
+        else:
+            # Created and deleted tasks are described by their current values
+            changes = {
+                field: getattr(task, field)
+                for field in TRACKED_FIELDS
+                if field != "categories" and getattr(task, field) is not None
+            }
+        if changes or action != "updated":
+            record_activity(db, "task", task.id, action, task.user_id, changes)
+        version = current_change_version(db.connection())
+        invalidation_bus.publish(
+            db, "tasks", f"{task.user_id}:{task.id}:{kind}:{version}"
+        )
+
+    @staticmethod
+    def _duplicate_title_error(user: User) -> ValueError:
+        return ValueError(f"Такая задача у пользователя {user.name} уже существует")
+
+    @staticmethod
+    def _is_duplicate_title(error: IntegrityError) -> bool:
+        """Tells a violation of the unique (user_id, title) index from other errors"""
+        message = str(error.orig)
+        return (
+            "uq_tasks_user_id_title" in message
+            or "tasks.user_id, tasks.title" in message
+        )
+
     @staticmethod
     def create_task(db: Session, user_id: int, task_data: TaskCreateData) -> Task:
         """
@@ -74,28 +140,18 @@ class TaskService:
 
         task_data.deadline = TaskService._validate_deadline(task_data.deadline)
         TaskService._validate_status_priority(task_data.status, task_data.priority)
+        recurrence, interval, until = RecurrenceService.validate_rule(
+            task_data.recurrence,
+            task_data.recurrence_interval,
+            task_data.recurrence_until,
+            task_data.deadline,
+        )
 
         user = db.get(User, user_id)
         if not user:
             raise ValueError("Пользователь не найден")
 
-        existing = (
-            db.query(Task)
-            .filter_by(user_id=user_id, title=task_data.title.strip())
-            .first()
-        )
-        if existing:
-            raise ValueError(f"Такая задача у пользователя {user.name} уже существует")
-
-        task = Task(
-            user_id=user_id,
-            title=task_data.title.strip(),
-            description=task_data.description,
-            deadline=task_data.deadline,
-            status=task_data.status.lower().strip(),
-            priority=task_data.priority.lower().strip(),
-        )
-
+        found_categories = []
         if task_data.categories:
             categories = [int(cat_id) for cat_id in task_data.categories]
             found_categories = (
@@ -103,11 +159,32 @@ class TaskService:
             )
             if len(found_categories) != len(set(categories)):
                 raise ValueError("Одна или несколько категорий не найдена")
-            task.categories = found_categories
 
-        db.add(task)
+        # The unique index decides about duplicates, no pre-check needed
+        statement = (
+            insert_ignoring_conflicts(db, Task, ["user_id", "title"])
+            .values(
+                user_id=user_id,
+                title=task_data.title.strip(),
+                description=task_data.description,
+                deadline=task_data.deadline,
+                status=task_data.status.lower().strip(),
+                priority=task_data.priority.lower().strip(),
+                recurrence=recurrence,
+                recurrence_interval=interval,
+                recurrence_until=until,
+            )
+            .returning(Task)
+        )
+        task = db.scalars(statement).first()
+        if task is None:
+            db.rollback()
+            raise TaskService._duplicate_title_error(user)
+
+        if found_categories:
+            task.categories = found_categories
+        TaskService._publish_change(db, task, action="created")
         db.commit()
-        db.refresh(task)
 
         return (
             db.query(Task)
@@ -148,7 +225,9 @@ class TaskService:
             task.description = update_data.description
 
         if update_data.deadline is not None:
-            update_data.deadline = TaskService._validate_deadline(update_data.deadline)
+            update_data.deadline = TaskService._validate_deadline(
+                update_data.deadline, task.deadline
+            )
             task.deadline = update_data.deadline
 
         if update_data.status is not None:
@@ -163,21 +242,45 @@ class TaskService:
                 raise ValueError("Недопустимый приоритет")
             task.priority = clean_priority
 
-        if update_data.categories is not NOT_PROVIDED:
-            if update_data.categories is None:
-                task.categories = []
-            else:
-                new_ids = set(map(int, update_data.categories))
-                current_ids = set(c.id for c in task.categories)
-                if new_ids != current_ids:
-                    found_cats = (
-                        db.query(Category).filter(Category.id.in_(new_ids)).all()
-                    )
-                    if len(found_cats) != len(new_ids):
-                        raise ValueError("Одна или несколько категорий не найдены")
-                    task.categories = found_cats
+        recurrence = task.recurrence
+        if update_data.recurrence is not NOT_PROVIDED:
+            recurrence = update_data.recurrence
+        interval = task.recurrence_interval
+        if update_data.recurrence_interval not in (None, NOT_PROVIDED):
+            interval = update_data.recurrence_interval
+        until = task.recurrence_until
+        if update_data.recurrence_until is not NOT_PROVIDED:
+            until = update_data.recurrence_until
+        task.recurrence, task.recurrence_interval, task.recurrence_until = (
+            RecurrenceService.validate_rule(recurrence, interval, until, task.deadline)
+        )
 
-        db.commit()
+        # A changed title is flushed at the commit, where its conflict is mapped
+        with db.no_autoflush:
+            if update_data.categories is not NOT_PROVIDED:
+                if update_data.categories is None:
+                    task.categories = []
+                else:
+                    new_ids = set(map(int, update_data.categories))
+                    current_ids = set(c.id for c in task.categories)
+                    if new_ids != current_ids:
+                        found_cats = (
+                            db.query(Category).filter(Category.id.in_(new_ids)).all()
+                        )
+                        if len(found_cats) != len(new_ids):
+                            raise ValueError("Одна или несколько категорий не найдены")
+                        task.categories = found_cats
+            # Occurrences the changed rule or deadline no longer produces
+            RecurrenceService.drop_stale_occurrences(task)
+
+        TaskService._publish_change(db, task)
+        try:
+            db.commit()
+        except IntegrityError as e:
+            db.rollback()
+            if TaskService._is_duplicate_title(e):
+                raise TaskService._duplicate_title_error(db.get(User, user_id))
+            raise
         db.refresh(task)
         return (
             db.query(Task)
@@ -222,6 +325,45 @@ class TaskService:
 
         return query.all()
 
+    @staticmethod
+    def get_tasks_page(
+        db: Session,
+        user_id: int,
+        filters: TaskFilterData,
+        limit: int,
+        offset: int = 0,
+        with_categories: bool = True,
+    ) -> Tuple[List[Task], int]:
+        """
+        Getting one page of user tasks using filters.
+
+        args:
+        db: Database session
+        user_id: User ID
+        filters: Status and priority filters
+        limit: Maximum number of tasks on the page
+        offset: Number of tasks to skip
+        with_categories: Whether to load the task categories
+
+        returns:
+        Tuple[List[Task], int]: Tasks of the page ordered by ID and the total count
+        """
+        query = db.query(Task).filter(Task.user_id == user_id)
+        if filters.status:
+            query = query.filter(
+                func.lower(Task.status) == func.lower(filters.status.strip())
+            )
+        if filters.priority:
+            query = query.filter(
+                func.lower(Task.priority) == func.lower(filters.priority.strip())
+            )
+
+        total = query.order_by(None).count()
+        if with_categories:
+            query = query.options(selectinload(Task.categories))
+        tasks = query.order_by(Task.id).limit(limit).offset(offset).all()
+        return tasks, total
+
     @staticmethod
     def update_task_categories(
         db: Session, user_id: int, task_id: int, new_categories: list[str]
@@ -233,6 +375,7 @@ class TaskService:
         task.categories = (
             db.query(Category).filter(Category.title.in_(new_categories)).all()
         )
+        TaskService._publish_change(db, task)
         db.commit()
         db.refresh(task)
         task_with_categories = (
@@ -255,6 +398,7 @@ class TaskService:
         if clean_status not in ALLOWED_STATUSES:
             raise ValueError("Недопустимый статус задачи")
         task.status = clean_status
+        TaskService._publish_change(db, task)
         db.commit()
         db.refresh(task)
         task_with_categories = (
@@ -277,6 +421,7 @@ class TaskService:
         if clean_priority not in ALLOWED_PRIORITIES:
             raise ValueError("Недопустимый формат приоритета")
         task.priority = clean_priority
+        TaskService._publish_change(db, task)
         db.commit()
         db.refresh(task)
         task_with_categories = (
@@ -296,6 +441,7 @@ class TaskService:
         if not task:
             raise ValueError("Задача с таким ID у пользователя не найдена")
         task.description = new_description
+        TaskService._publish_change(db, task)
         db.commit()
         db.refresh(task)
         task_with_categories = (
@@ -319,6 +465,7 @@ class TaskService:
             raise ValueError("Дедлайн не может быть в прошлом")
 
         task.deadline = new_deadline
+        TaskService._publish_change(db, task)
         db.commit()
         db.refresh(task)
         task_with_categories = (
@@ -352,6 +499,7 @@ class TaskService:
         task = db.query(Task).filter_by(id=task_id, user_id=user_id).first()
         if not task:
             raise ValueError("Задача с таким ID у пользователя не найдена")
+        TaskService._publish_change(db, task, "deleted", "deleted")
         db.delete(task)
         db.commit()
         return "Задача успешно удалена"
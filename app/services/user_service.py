@@ -1,7 +1,24 @@
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import delete
 from sqlalchemy.orm import Session
 
-from app.crud.security import hash_password, verify_password
-from app.db.models import User
+from app.crud.security import hash_password, verify_and_update_password
+from app.crud.token_versions import revoke_user_tokens
+from app.db.invalidation import invalidation_bus
+from app.db.models import (
+    AccountDeletion,
+    ActivityLog,
+    ArchivedTask,
+    RefreshToken,
+    SyncTombstone,
+    Task,
+    TaskOccurrence,
+    User,
+    archived_task_categories,
+    task_categories_association,
+)
 
 
 class UserService:
@@ -29,16 +46,128 @@ class UserService:
     def login_user(db: Session, email: str, password: str) -> type[User] | None:
         """Method for login user with validate data"""
         user = db.query(User).filter_by(email=email).first()
-        if not user or not verify_password(password, user.password):
+        if not user:
+            raise ValueError("Неверный email или пароль")
+        verified, new_hash = verify_and_update_password(password, user.password)
+        if not verified:
             raise ValueError("Неверный email или пароль")
+        if new_hash:
+            user.password = new_hash
+            db.commit()
+            db.refresh(user)
         return user
 
     @staticmethod
     def delete_user(db: Session, user_id: int) -> str:
-        """Method for deleting user"""
+        """
+        Method for deleting user.
+
+        The account is only marked as deleted and signed out everywhere,
+        its tasks are purged in batches by the account purge worker.
+        """
         user = db.get(User, user_id)
-        if not user:
+        if not user or user.deleted_at is not None:
             raise ValueError("Пользователь с таким ID не найден")
-        db.delete(user)
-        db.commit()
+        user.deleted_at = datetime.now()
+        # Frees the email at once, the row itself lives until the purge ends
+        user.email = f"deleted-{user.id}@invalid"
+        db.add(AccountDeletion(user_id=user.id))
+        invalidation_bus.publish(db, "account_deletions", user.id)
+        revoke_user_tokens(db, user.id)
         return "Пользователь успешно удален"
+
+    @staticmethod
+    def purge_deleted_user_batch(db: Session, batch_size: int) -> bool:
+        """
+        Purges one batch of tasks of a deleted account in a short transaction.
+        Active tasks go first, archived ones, the activity log and the sync
+        tombstones next, the user row is removed by the batch that finds
+        nothing left.
+
+        args:
+        db: Database session
+        batch_size: Maximum number of tasks removed by the batch
+
+        returns:
+        bool: False if there is no unfinished deletion to work on
+        """
+        deletion = (
+            db.query(AccountDeletion)
+            .filter(AccountDeletion.finished_at.is_(None))
+            .order_by(AccountDeletion.requested_at)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if deletion is None:
+            return False
+
+        now = datetime.now()
+        for model, links in (
+            (Task, task_categories_association),
+            (ArchivedTask, archived_task_categories),
+        ):
+            task_ids = [
+                row.id
+                for row in db.query(model.id)
+                .filter(model.user_id == deletion.user_id)
+                .limit(batch_size)
+            ]
+            if task_ids:
+                purged_links = db.execute(
+                    delete(links).where(links.c.task_id.in_(task_ids))
+                )
+                if model is Task:
+                    db.execute(
+                        delete(TaskOccurrence).where(
+                            TaskOccurrence.task_id.in_(task_ids)
+                        )
+                    )
+                db.query(model).filter(model.id.in_(task_ids)).delete(
+                    synchronize_session=False
+                )
+                deletion.tasks_purged += len(task_ids)
+                deletion.links_purged += purged_links.rowcount
+                break
+        else:
+            for model in (ActivityLog, SyncTombstone):
+                row_ids = [
+                    row.id
+                    for row in db.query(model.id)
+                    .filter(model.user_id == deletion.user_id)
+                    .limit(batch_size)
+                ]
+                if row_ids:
+                    db.query(model).filter(model.id.in_(row_ids)).delete(
+                        synchronize_session=False
+                    )
+                    break
+            else:
+                db.query(RefreshToken).filter_by(user_id=deletion.user_id).delete(
+                    synchronize_session=False
+                )
+                db.query(User).filter_by(id=deletion.user_id).delete(
+                    synchronize_session=False
+                )
+                deletion.finished_at = now
+        deletion.updated_at = now
+        db.commit()
+        return True
+
+    @staticmethod
+    def get_pending_deletions(db: Session) -> List[AccountDeletion]:
+        """Getting unfinished account deletions with their progress"""
+        return (
+            db.query(AccountDeletion)
+            .filter(AccountDeletion.finished_at.is_(None))
+            .order_by(AccountDeletion.requested_at)
+            .all()
+        )
+
+    @staticmethod
+    def revoke_tokens(db: Session, user_id: int) -> str:
+        """Method for invalidating all issued tokens of user"""
+        user = db.get(User, user_id)
+        if not user:
+            raise ValueError("Пользователь с таким ID не найден")
+        revoke_user_tokens(db, user_id)
+        return "Все сессии пользователя завершены"
@@ -0,0 +1,711 @@
+import csv
+import io
+import time
+from dataclasses import asdict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.crud.auth import (
+    authenticate_request,
+    get_current_user_from_cookie,
+    login_user,
+    refresh_session,
+)
+from app.db.activity import activity_log, set_actor
+from app.db.database import EXTERNAL_TRANSACTION_KEY, ReadSessionLocal, get_engine
+from app.db.invalidation import invalidation_bus
+from app.db.models import Category, Task
+from app.dependencies import get_db, get_read_db
+from app.schemas.api import (
+    BatchOperation,
+    BatchRequest,
+    CategoriesCreateRequest,
+    CategoriesDeleteRequest,
+    CategoriesMergeRequest,
+    OccurrenceUpdateRequest,
+    RefreshRequest,
+    TaskCreateRequest,
+    TaskUpdateRequest,
+    TokenResponse,
+    to_naive_local,
+)
+from app.schemas.tasks import (
+    NOT_PROVIDED,
+    OccurrenceUpdateData,
+    TaskCreateData,
+    TaskFilterData,
+    TaskUpdateData,
+)
+from app.schemas.users import CurrentUser
+from app.services.activity_service import MAX_HISTORY_LIMIT, ActivityService
+from app.services.archive_service import ArchiveService
+from app.services.calendar_service import CalendarService
+from app.services.category_service import CategoryService
+from app.services.recurrence_service import RecurrenceService
+from app.services.sync_service import SyncService
+from app.services.task_service import TaskService
+from app.web.profiling import ProfiledRoute
+from app.web.throttling import client_ip, login_email_limiter, login_ip_limiter
+
+TASK_FIELDS = (
+    "id",
+    "title",
+    "description",
+    "deadline",
+    "status",
+    "priority",
+    "categories",
+    "updated_at",
+    "version",
+    "recurrence",
+    "recurrence_interval",
+    "recurrence_until",
+)
+CATEGORY_FIELDS = ("id", "title", "updated_at", "version")
+TASK_CATEGORY_FIELDS = ("id", "title")
+MAX_PAGE_SIZE = 200
+MAX_CHANGES_PAGE_SIZE = 1000
+MAX_SEARCH_LIMIT = 50
+MAX_CATEGORY_QUERY_LENGTH = 50
+ARCHIVED_TASK_FIELDS = (
+    "id",
+    "title",
+    "description",
+    "deadline",
+    "status",
+    "priority",
+    "categories",
+    "updated_at",
+    "archived_at",
+)
+EXPORT_FLUSH_BYTES = 64 * 1024
+MAX_WINDOW_DAYS = 366
+
+
+class TimedJSONResponse(ORJSONResponse):
+    """
+    JSON response rendered with orjson that reports its serialization time
+    in the Server-Timing header
+    """
+
+    def render(self, content: Any) -> bytes:
+        started = time.perf_counter()
+        body = super().render(content)
+        self._serialize_ms = (time.perf_counter() - started) * 1000
+        return body
+
+    def init_headers(self, headers=None) -> None:
+        super().init_headers(headers)
+        serialize_ms = getattr(self, "_serialize_ms", None)
+        if serialize_ms is not None:
+            self.raw_headers.append(
+                (b"server-timing", f"serialize;dur={serialize_ms:.3f}".encode())
+            )
+
+
+api_oauth2_scheme = OAuth2PasswordBearer(
+    tokenUrl="/api/v1/auth/token", auto_error=False
+)
+
+router = APIRouter(
+    prefix="/api/v1",
+    default_response_class=TimedJSONResponse,
+    route_class=ProfiledRoute,
+)
+
+
+def get_api_user(
+    request: Request,
+    token: Optional[str] = Depends(api_oauth2_scheme),
+    db: Session = Depends(get_db),
+) -> CurrentUser:
+    """Authenticates the API client by a Bearer token or the session cookie"""
+    if token:
+        return authenticate_request(request, token, db)
+    return get_current_user_from_cookie(request, db)
+
+
+def get_api_admin(current_user: CurrentUser = Depends(get_api_user)) -> CurrentUser:
+    """Lets only administrators through"""
+    if not current_user.is_admin:
+        raise HTTPException(
+            status_code=403, detail="Данные действия доступны только администратору"
+        )
+    return current_user
+
+
+def parse_fields(fields: Optional[str], allowed: Tuple[str, ...]) -> Tuple[str, ...]:
+    """
+    Parses a sparse fieldset like "id,title,status".
+
+    returns:
+    Tuple[str, ...]: Selected fields in the order of the allowed ones
+
+    raises:
+    HTTPException: If the fieldset contains an unknown field
+    """
+    if not fields:
+        return allowed
+    selected = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = selected.difference(allowed)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Неизвестные поля: {', '.join(sorted(unknown))}",
+        )
+    return tuple(field for field in allowed if field in selected)
+
+
+def serialize_category(category: Category, fields: Iterable[str]) -> Dict[str, Any]:
+    """Converts a category to a dict with the selected fields"""
+    return {field: getattr(category, field) for field in fields}
+
+
+def serialize_task(task: Task, fields: Iterable[str]) -> Dict[str, Any]:
+    """Converts a task to a dict with the selected fields"""
+    data = {}
+    for field in fields:
+        if field == "categories":
+            data[field] = [
+                serialize_category(category, TASK_CATEGORY_FIELDS)
+                for category in task.categories
+            ]
+        else:
+            data[field] = getattr(task, field)
+    return data
+
+
+def to_update_data(body: TaskUpdateRequest) -> TaskUpdateData:
+    """Converts a partial update request, fields that were not sent stay unchanged"""
+    provided = body.model_dump(exclude_unset=True)
+    return TaskUpdateData(
+        title=provided.get("title"),
+        description=provided.get("description"),
+        deadline=provided.get("deadline"),
+        categories=provided.get("categories", NOT_PROVIDED),
+        status=provided.get("status"),
+        priority=provided.get("priority"),
+        recurrence=provided.get("recurrence", NOT_PROVIDED),
+        recurrence_interval=provided.get("recurrence_interval"),
+        recurrence_until=provided.get("recurrence_until", NOT_PROVIDED),
+    )
+
+
+def service_error(exc: ValueError) -> HTTPException:
+    """Maps a service validation error to an HTTP error"""
+    message = str(exc)
+    status_code = 404 if "не найден" in message else 400
+    return HTTPException(status_code=status_code, detail=message)
+
+
+@router.post("/auth/token", response_model=TokenResponse)
+def create_token(request: Request, form: OAuth2PasswordRequestForm = Depends()):
+    """
+    Issues an access and refresh token pair, the username is the user's email.
+    """
+    if not login_ip_limiter.allow(client_ip(request)) or not login_email_limiter.allow(
+        form.username.strip().lower()
+    ):
+        raise HTTPException(status_code=429, detail="Слишком много попыток входа")
+    try:
+        tokens = login_user(form.username, form.password)
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    return {"access_token": tokens.access_token, "refresh_token": tokens.refresh_token}
+
+
+@router.post("/auth/refresh", response_model=TokenResponse)
+def refresh_token(body: RefreshRequest):
+    """Exchanges a refresh token for a new token pair"""
+    try:
+        tokens = refresh_session(body.refresh_token)
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    return {"access_token": tokens.access_token, "refresh_token": tokens.refresh_token}
+
+
+@router.get("/tasks")
+def list_tasks(
+    status: Optional[str] = None,
+    priority: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    fields: Optional[str] = None,
+    current_user: CurrentUser = Depends(get_api_user),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Paginated list of the user's tasks.
+
+    returns:
+    dict: Tasks of the page with the selected fields and the total count
+    """
+    selected = parse_fields(fields, TASK_FIELDS)
+    tasks, total = TaskService.get_tasks_page(
+        db,
+        current_user.id,
+        TaskFilterData(status=status, priority=priority),
+        limit=limit,
+        offset=offset,
+        with_categories="categories" in selected,
+    )
+    return {
+        "items": [serialize_task(task, selected) for task in tasks],
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+    }
+
+
+@router.get("/tasks/{task_id}")
+def get_task(
+    task_id: int,
+    fields: Optional[str] = None,
+    current_user: CurrentUser = Depends(get_api_user),
+    db: Session = Depends(get_read_db),
+):
+    """A single task of the user"""
+    selected = parse_fields(fields, TASK_FIELDS)
+    try:
+        task = TaskService.get_user_task_by_id(db, current_user.id, task_id)
+    except ValueError as e:
+        raise service_error(e)
+    return serialize_task(task, selected)
+
+
+@router.post("/tasks", status_code=201)
+def create_task(
+    body: TaskCreateRequest,
+    current_user: CurrentUser = Depends(get_api_user),
+    db: Session = Depends(get_db),
+):
+    """Creates a task and returns it"""
+    try:
+        task = TaskService.create_task(
+            db, current_user.id, TaskCreateData(**body.model_dump())
+        )
+    except ValueError as e:
+        raise service_error(e)
+    return serialize_task(task, TASK_FIELDS)
+
+
+@router.patch("/tasks/{task_id}")
+def update_task(
+    task_id: int,
+    body: TaskUpdateRequest,
+    current_user: CurrentUser = Depends(get_api_user),
+    db: Session = Depends(get_db),
+):
+    """Updates the given fields of a task and returns it"""
+    try:
+        task = TaskService.update_task_full(
+            db, current_user.id, task_id, to_update_data(body)
+        )
+    except ValueError as e:
+        raise service_error(e)
+    return serialize_task(task, TASK_FIELDS)
+
+
+@router.delete("/tasks/{task_id}", status_code=204)
+def delete_task(
+    task_id: int,
+    current_user: CurrentUser = Depends(get_api_user),
+    db: Session = Depends(get_db),
+):
+    """Deletes a task"""
+    try:
+        TaskService.delete_task(db, current_user.id, task_id)
+    except ValueError as e:
+        raise service_error(e)
+    return Response(status_code=204)
+
+
+def check_window(start: date, end: date) -> Tuple[date, date]:
+    """
+    Checks a date window of the calendar and occurrence queries.
+
+    raises:
+    HTTPException: If the window is empty or too long
+    """
+    if end <= start:
+        raise HTTPException(status_code=400, detail="Конец периода раньше начала")
+    if end - start > timedelta(days=MAX_WINDOW_DAYS):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Период не может быть длиннее {MAX_WINDOW_DAYS} дней",
+        )
+    return start, end
+
+
+@router.get("/calendar/counts")
+def calendar_counts(
+    start: date,
+    end: date,
+    current_user: CurrentUser = Depends(get_api_user),
+    db: Session = Depends(get_read_db),
+):
+    """Number of tasks due on each day from `start` to the day before `end`"""
+    start, end = check_window(start, end)
+    counts = CalendarService.count_by_day(db, current_user.id, start, end)
+    return {"items": [{"date": day, "count": counts[day]} for day in sorted(counts)]}
+
+
+@router.get("/calendar/entries")
+def calendar_entries(
+    start: date,
+    end: date,
+    current_user: CurrentUser = Depends(get_api_user),
+    db: Session = Depends(get_read_db),
+):
+    """Tasks and occurrences due from `start` to the day before `end`, by day"""
+    start, end = check_window(start, end)
+    days = CalendarService.get_entries(db, current_user.id, start, end)
+    return {
+        "items": [
+            {"date": day, "entries": [asdict(entry) for entry in days[day]]}
+            for day in sorted(days)
+        ]
+    }
+
+
+@router.get("/occurrences")
+def list_occurrences(
+    start: datetime,
+    end: datetime,
+    current_user: CurrentUser = Depends(get_api_user),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Occurrences of the user's recurring tasks due from `start` to `end`.
+
+    The occurrences are computed for the window, so a window of any
+    position costs the same however long the tasks have been repeating.
+    """
+    start, end = check_window(to_naive_local(start), to_naive_local(end))
+    occurrences = RecurrenceService.get_occurrences(db, current_user.id, start, end)
+    return {"items": [asdict(occurrence) for occurrence in occurrences]}
+
+
+@router.get("/tasks/{task_id}/history")
+def task_history(
+    task_id: int,
+    limit: int = Query(50, ge=1, le=MAX_HISTORY_LIMIT),
+    before: Optional[int] = Query(None, ge=1),
+    current_user: CurrentUser = Depends(get_api_user),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Activity log of a task, newest entries first. The next page is read
+    with `before` set to `next_before` of the previous one.
+    """
+    entries = ActivityService.get_task_history(
+        db, current_user.id, task_id, limit, before
+    )
+    return {
+        "items": [asdict(entry) for entry in entries],
+        "next_before": entries[-1].id if len(entries) == limit else None,
+    }
+
+
+@router.patch("/tasks/{task_id}/occurrences/{occurs_at}")
+def update_occurrence(
+    task_id: int,
+    occurs_at: datetime,
+    body: OccurrenceUpdateRequest,
+    current_user: CurrentUser = Depends(get_api_user),
+    db: Session = Depends(get_db),
+):
+    """Changes the status, description or deadline of one occurrence"""
+    provided = body.model_dump(exclude_unset=True)
+    try:
+        occurrence = RecurrenceService.update_occurrence(
+            db,
+            current_user.id,
+            task_id,
+            to_naive_local(occurs_at),
+            OccurrenceUpdateData(
+                status=provided.get("status"),
+                description=provided.get("description", NOT_PROVIDED),
+                deadline=provided.get("deadline"),
+            ),
+        )
+    except ValueError as e:
+        raise service_error(e)
+    return asdict(occurrence)
+
+
+def apply_batch_operation(
+    db: Session, user_id: int, operation: BatchOperation
+) -> Dict[str, Any]:
+    """
+    Runs one operation of a batch and describes its outcome.
+
+    Service commits inside a batch only release a savepoint, so a failed
+    operation is rolled back alone and the batch continues.
+    """
+    try:
+        if operation.op == "create":
+            task = TaskService.create_task(
+                db, user_id, TaskCreateData(**operation.data.model_dump())
+            )
+            return {"status": 201, "task": serialize_task(task, TASK_FIELDS)}
+        if operation.op == "update":
+            task = TaskService.update_task_full(
+                db, user_id, operation.id, to_update_data(operation.data)
+            )
+        elif operation.op == "status":
+            task = TaskService.update_task_status(
+                db, user_id, operation.id, operation.status
+            )
+        else:
+            TaskService.delete_task(db, user_id, operation.id)
+            return {"status": 204}
+        return {"status": 200, "task": serialize_task(task, TASK_FIELDS)}
+    except ValueError as e:
+        db.rollback()
+        error = service_error(e)
+        return {"status": error.status_code, "error": error.detail}
+    except SQLAlchemyError:
+        db.rollback()
+        return {"status": 500, "error": "Ошибка при работе с базой данных"}
+
+
+@router.post("/tasks/batch")
+def run_batch(
+    body: BatchRequest,
+    current_user: CurrentUser = Depends(get_api_user),
+):
+    """
+    Runs several task operations in one transaction and one round trip.
+
+    Every operation gets its own result in the order of the request. With
+    atomic=true nothing is committed if any operation fails.
+
+    returns:
+    dict: Per-operation results and whether the transaction was committed
+    """
+    with get_engine().connect() as connection:
+        transaction = connection.begin()
+        if connection.dialect.name == "sqlite":
+            # pysqlite begins a transaction only before DML, so the first
+            # savepoint would start one and releasing it would commit
+            connection.exec_driver_sql("BEGIN")
+        db = Session(
+            bind=connection,
+            join_transaction_mode="create_savepoint",
+            info={EXTERNAL_TRANSACTION_KEY: True},
+        )
+        set_actor(db, current_user.id)
+        try:
+            results = [
+                apply_batch_operation(db, current_user.id, operation)
+                for operation in body.operations
+            ]
+            failed = any(result["status"] >= 400 for result in results)
+            committed = not (body.atomic and failed)
+            if committed:
+                transaction.commit()
+                # The operations' commits only released savepoints
+                invalidation_bus.dispatch_deferred(db)
+                activity_log.submit_deferred(db)
+            else:
+                transaction.rollback()
+        except Exception:
+            transaction.rollback()
+            raise
+        finally:
+            db.close()
+
+    for index, result in enumerate(results):
+        result["index"] = index
+    return {"results": results, "committed": committed}
+
+
+@router.get("/categories")
+def list_categories(
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    fields: Optional[str] = None,
+    current_user: CurrentUser = Depends(get_api_user),
+    db: Session = Depends(get_read_db),
+):
+    """Paginated list of all categories"""
+    selected = parse_fields(fields, CATEGORY_FIELDS)
+    categories, total = CategoryService.get_categories_page(db, limit, offset)
+    return {
+        "items": [serialize_category(category, selected) for category in categories],
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+    }
+
+
+@router.get("/categories/search")
+def search_categories(
+    q: str = Query(..., max_length=MAX_CATEGORY_QUERY_LENGTH),
+    limit: int = Query(10, ge=1, le=MAX_SEARCH_LIMIT),
+    current_user: CurrentUser = Depends(get_api_user),
+    db: Session = Depends(get_read_db),
+):
+    """Typeahead of categories, titles starting with the query come first"""
+    categories = CategoryService.search_categories(db, q, limit)
+    return {
+        "items": [
+            serialize_category(category, TASK_CATEGORY_FIELDS)
+            for category in categories
+        ]
+    }
+
+
+@router.post("/categories", status_code=201)
+def create_categories(
+    body: CategoriesCreateRequest,
+    current_user: CurrentUser = Depends(get_api_admin),
+    db: Session = Depends(get_db),
+):
+    """Bulk creation of categories, titles that already exist are reported"""
+    try:
+        created, existing = CategoryService.create_categories(db, body.titles)
+    except ValueError as e:
+        raise service_error(e)
+    return {
+        "created": [
+            serialize_category(category, CATEGORY_FIELDS) for category in created
+        ],
+        "existing": existing,
+    }
+
+
+@router.post("/categories/delete")
+def delete_categories(
+    body: CategoriesDeleteRequest,
+    current_user: CurrentUser = Depends(get_api_admin),
+    db: Session = Depends(get_db),
+):
+    """Bulk deletion of categories, IDs that were not found are reported"""
+    deleted, missing = CategoryService.delete_categories_list(db, body.ids)
+    return {"deleted": deleted, "missing": missing}
+
+
+@router.post("/categories/merge")
+def merge_categories(
+    body: CategoriesMergeRequest,
+    current_user: CurrentUser = Depends(get_api_admin),
+    db: Session = Depends(get_db),
+):
+    """Merges the source categories into the target one"""
+    try:
+        moved = CategoryService.merge_categories(db, body.source_ids, body.target_id)
+    except ValueError as e:
+        raise service_error(e)
+    return {"target_id": body.target_id, "moved_links": moved}
+
+
+@router.get("/sync/changes")
+def list_changes(
+    since: int = Query(0, ge=0),
+    limit: int = Query(500, ge=1, le=MAX_CHANGES_PAGE_SIZE),
+    current_user: CurrentUser = Depends(get_api_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Rows changed after the `since` version.
+
+    The client applies the deletions first, then the changed rows, stores
+    the returned version and asks again while `has_more` is true.
+    """
+    changes = SyncService.get_changes(db, current_user.id, since, limit)
+    return {
+        "version": changes.version,
+        "has_more": changes.has_more,
+        "tasks": [serialize_task(task, TASK_FIELDS) for task in changes.tasks],
+        "categories": [
+            serialize_category(category, CATEGORY_FIELDS)
+            for category in changes.categories
+        ],
+        "links": [
+            {"task_id": task_id, "category_id": category_id}
+            for task_id, category_id in changes.links
+        ],
+        "deleted": {
+            "tasks": changes.deleted_tasks,
+            "categories": changes.deleted_categories,
+            "links": [
+                {"task_id": task_id, "category_id": category_id}
+                for task_id, category_id in changes.deleted_links
+            ],
+        },
+    }
+
+
+@router.get("/archive/tasks")
+def list_archived_tasks(
+    q: str = Query("", max_length=100),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    current_user: CurrentUser = Depends(get_api_user),
+    db: Session = Depends(get_read_db),
+):
+    """Search in the user's archived tasks by title, newest first"""
+    tasks, total = ArchiveService.search_archived_tasks(
+        db, current_user.id, q, limit, offset
+    )
+    return {
+        "items": [serialize_task(task, ARCHIVED_TASK_FIELDS) for task in tasks],
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+    }
+
+
+def archive_csv(user_id: int, query: str) -> Iterator[str]:
+    """
+    CSV of the user's archived tasks, produced chunk by chunk.
+
+    The stream outlives the request's session, so it reads through a
+    session of its own.
+    """
+    db = ReadSessionLocal()
+    try:
+        buffer = io.StringIO()
+        # BOM lets spreadsheet programs detect UTF-8
+        buffer.write("\ufeff")
+        writer = csv.writer(buffer)
+        writer.writerow(ARCHIVED_TASK_FIELDS)
+        for task in ArchiveService.iter_archived_tasks(db, user_id, query):
+            writer.writerow(
+                [
+                    (
+                        ", ".join(category.title for category in task.categories)
+                        if field == "categories"
+                        else getattr(task, field)
+                    )
+                    for field in ARCHIVED_TASK_FIELDS
+                ]
+            )
+            if buffer.tell() >= EXPORT_FLUSH_BYTES:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    finally:
+        db.close()
+
+
+@router.get("/archive/tasks/export")
+def export_archived_tasks(
+    q: str = Query("", max_length=100),
+    current_user: CurrentUser = Depends(get_api_user),
+):
+    """CSV export of the user's archived tasks matching the search"""
+    return StreamingResponse(
+        archive_csv(current_user.id, q),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": 'attachment; filename="archive.csv"'},
+    )
@@ -1,8 +1,75 @@
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Request
 from fastapi.responses import RedirectResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
+
+from app.crud.auth import clear_session_cookies, renew_session, set_session_cookies
+from app.db.activity import activity_log
+from app.db.database import dispose_engine, get_replica_engines, warm_up_pool
+from app.db.invalidation import invalidation_bus
+from app.db.slow_queries import slow_query_log
+from app.db.versioning import settled_version_publisher
+from app.services.account_purge import account_purge_worker
+from app.web import api, routes
+from app.web.profiling import (
+    PROFILING_ENABLED,
+    RequestProfile,
+    is_profile_allowed,
+    is_profile_flagged,
+    is_profile_sampled,
+)
+from app.web.templating import warm_up_templates
+
+logger = logging.getLogger(__name__)
 
-from app.web import routes
+WARM_UP_ON_STARTUP = os.getenv("WARM_UP_ON_STARTUP", "0") == "1"
+# Should exceed the replication lag of the replicas
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+PRIMARY_COOKIE = "read_primary"
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+STATIC_PREFIX = "/static/"
+
+
+def warm_up() -> None:
+    """Opens the connection pool and compiles the templates before serving"""
+    started = time.perf_counter()
+    connections = warm_up_pool()
+    compiled = warm_up_templates()
+    logger.info(
+        "Warm-up: %s connections, %s templates in %.0f ms",
+        connections,
+        compiled,
+        (time.perf_counter() - started) * 1000,
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Starts the worker's background services and stops them on shutdown.
+
+    The engine and the templates are created on first use, the optional
+    warm-up creates them here instead of in the first requests.
+    """
+    if WARM_UP_ON_STARTUP:
+        warm_up()
+    invalidation_bus.start()
+    account_purge_worker.start()
+    activity_log.start()
+    settled_version_publisher.start()
+    yield
+    settled_version_publisher.stop()
+    account_purge_worker.stop()
+    # Writes the entries of the last requests before the pool is closed
+    activity_log.stop()
+    invalidation_bus.stop()
+    slow_query_log.stop()
+    dispose_engine()
 
 
 def create_app(is_gui: bool = False) -> FastAPI:
@@ -15,7 +82,7 @@ def create_app(is_gui: bool = False) -> FastAPI:
     returns:
     FastAPI: Configured FastAPI application with routes and middleware
     """
-    app = FastAPI(title="FlapTask", log_level="debug")
+    app = FastAPI(title="FlapTask", log_level="debug", lifespan=lifespan)
     app.mount("/static", StaticFiles(directory="static"), name="static")
     app.state.is_gui = is_gui
 
@@ -55,6 +122,114 @@ def create_app(is_gui: bool = False) -> FastAPI:
 
         return response
 
+    @app.middleware("http")
+    async def sliding_session(request: Request, call_next):
+        """
+        Middleware for renewing the user session on activity.
+
+        Re-signs an access token that has used up half of its lifetime and
+        replaces an expired one through the refresh token, so the user
+        does not have to sign in with a password again while active.
+        The new access token is visible to the request handlers
+        through request.state. Static files and requests without session
+        cookies are passed through, the renewal may query the database and
+        runs in the thread pool
+        """
+        access_token = request.cookies.get("access_token")
+        refresh_token = request.cookies.get("refresh_token")
+        if request.url.path.startswith(STATIC_PREFIX) or not (
+            access_token or refresh_token
+        ):
+            return await call_next(request)
+
+        try:
+            renewed = await run_in_threadpool(
+                renew_session, access_token, refresh_token
+            )
+            session_expired = False
+        except ValueError:
+            renewed = None
+            session_expired = True
+
+        if renewed:
+            request.state.access_token = renewed.access_token
+
+        response = await call_next(request)
+
+        cookies_set = any(
+            cookie.startswith(("access_token=", "refresh_token="))
+            for cookie in response.headers.getlist("set-cookie")
+        )
+        if not cookies_set:
+            if renewed:
+                set_session_cookies(response, renewed)
+            elif session_expired:
+                clear_session_cookies(response)
+
+        return response
+
+    @app.middleware("http")
+    async def read_your_writes(request: Request, call_next):
+        """
+        Middleware pinning the reads of a client that has just written to
+        the primary database.
+
+        A successful write request sets a short-lived cookie, while it is
+        present get_read_db() hands out primary sessions instead of
+        replica ones. Without replicas there is nothing to pin
+        """
+        if not get_replica_engines():
+            return await call_next(request)
+
+        request.state.read_from_primary = PRIMARY_COOKIE in request.cookies
+        response = await call_next(request)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                key=PRIMARY_COOKIE,
+                value="1",
+                max_age=REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite="lax",
+            )
+        return response
+
+    if PROFILING_ENABLED:
+
+        @app.middleware("http")
+        async def profile_request(request: Request, call_next):
+            """
+            Middleware profiling the requests asked for by an administrator
+            or sampled, see app.web.profiling.
+
+            Added last, so the profile also covers the other middlewares.
+            A flagged request is profiled before its user is known, the
+            profile is discarded unless the request was made by an
+            administrator. The name of the written file is returned in the
+            X-Profile-File header
+            """
+            flagged = is_profile_flagged(request)
+            if not flagged and not is_profile_sampled():
+                return await call_next(request)
+            profile = RequestProfile()
+            if not profile.start():
+                return await call_next(request)
+
+            started = time.perf_counter()
+            try:
+                response = await call_next(request)
+            finally:
+                profile.stop()
+            if flagged and not is_profile_allowed(request):
+                return response
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            try:
+                name = await run_in_threadpool(profile.save, request, elapsed_ms)
+            except OSError:
+                logger.exception("Request profile not written")
+            else:
+                response.headers["X-Profile-File"] = name
+            return response
+
     @app.get("/gui-launch")
     async def gui_launch(request: Request):
         """
@@ -91,4 +266,5 @@ def create_app(is_gui: bool = False) -> FastAPI:
         return resp
 
     app.include_router(routes.router)
+    app.include_router(api.router)
     return app
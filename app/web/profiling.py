@@ -0,0 +1,172 @@
+"""
+On-demand profiling of single requests.
+
+A profiled request is run under cProfile and its profile is written to
+PROFILE_DIR in the pstats format, readable by `python -m pstats` or
+snakeviz. Requests are profiled when they carry the `X-Profile: 1`
+header or the `profile=1` query flag and turn out to be made by an
+administrator, and at random with the probability PROFILE_SAMPLE_RATE.
+Only the newest PROFILE_KEEP files are kept.
+
+A request has one profiler. Async handlers run on the event loop thread,
+which is profiled by the middleware. Since Python 3.12 cProfile sees
+every thread, so that profiler also covers sync handlers running in the
+thread pool, and a second profiler could not even be started. Before
+3.12 ProfiledRoute profiles sync handlers inside their thread and the
+parts are merged into one file. While one request of a worker is
+profiled, other requests of the worker are not, and the profile also
+includes the time the worker spent on them.
+"""
+
+import cProfile
+import functools
+import inspect
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from fastapi import Request
+from fastapi.routing import APIRoute
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", "profiles"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY_FLAG = "profile"
+# cProfile is built on sys.monitoring, which is process-wide
+PROFILER_SEES_ALL_THREADS = sys.version_info >= (3, 12)
+
+_thread_profiles: ContextVar[Optional[List[cProfile.Profile]]] = ContextVar(
+    "thread_profiles", default=None
+)
+_loop_profile_lock = threading.Lock()
+
+
+def is_profile_flagged(request: Request) -> bool:
+    """Tells whether the request asks to be profiled"""
+    return (
+        request.headers.get(PROFILE_HEADER) == "1"
+        or request.query_params.get(PROFILE_QUERY_FLAG) == "1"
+    )
+
+
+def is_profile_sampled() -> bool:
+    """Draws whether an unflagged request is profiled at random"""
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def is_profile_allowed(request: Request) -> bool:
+    """
+    Tells whether a flagged request was made by an administrator, known
+    once the authentication dependency put the user into request.state
+    """
+    current_user = getattr(request.state, "current_user", None)
+    return current_user is not None and current_user.is_admin
+
+
+class RequestProfile:
+    """
+    Profile of one request: the event loop part and the parts recorded in
+    the thread pool.
+
+    Only one request per worker can hold the event loop profiler, start()
+    returns False while another one does.
+    """
+
+    def __init__(self):
+        self._loop_profile = cProfile.Profile()
+        self._thread_profiles: List[cProfile.Profile] = []
+        self._token = None
+
+    def start(self) -> bool:
+        if not _loop_profile_lock.acquire(blocking=False):
+            return False
+        self._token = _thread_profiles.set(self._thread_profiles)
+        self._loop_profile.enable()
+        return True
+
+    def stop(self) -> None:
+        self._loop_profile.disable()
+        _thread_profiles.reset(self._token)
+        _loop_profile_lock.release()
+
+    def save(self, request: Request, elapsed_ms: float) -> str:
+        """
+        Writes the merged profile and removes the oldest files over the
+        PROFILE_KEEP limit.
+
+        returns:
+        str: Name of the written file
+        """
+        stats = pstats.Stats(self._loop_profile)
+        for profile in self._thread_profiles:
+            stats.add(profile)
+
+        path_slug = re.sub(r"[^A-Za-z0-9]+", "_", request.url.path).strip("_")
+        name = (
+            f"{datetime.now():%Y%m%d-%H%M%S-%f}-{request.method}-"
+            f"{path_slug or 'root'}-{elapsed_ms:.0f}ms-{os.getpid()}.prof"
+        )
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        stats.dump_stats(PROFILE_DIR / name)
+        prune_profiles()
+        return name
+
+
+def prune_profiles(keep: Optional[int] = None) -> int:
+    """
+    Removes the oldest profiles, keeping the newest `keep` files.
+
+    returns:
+    int: Number of removed files
+    """
+    keep = PROFILE_KEEP if keep is None else keep
+    files = sorted(PROFILE_DIR.glob("*.prof"), key=lambda path: path.name)
+    removed = 0
+    for path in files[: max(len(files) - keep, 0)]:
+        try:
+            path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            # Removed by another worker at the same time
+            pass
+    return removed
+
+
+def profile_in_thread(endpoint: Callable) -> Callable:
+    """
+    Wraps a sync endpoint, which runs in the thread pool, so that it is
+    profiled in its own thread when its request is profiled
+    """
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        profiles = _thread_profiles.get()
+        if profiles is None:
+            return endpoint(*args, **kwargs)
+        profile = cProfile.Profile()
+        profiles.append(profile)
+        return profile.runcall(endpoint, *args, **kwargs)
+
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """Route whose sync endpoint is included in the profile of its request"""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if (
+            PROFILING_ENABLED
+            and not PROFILER_SEES_ALL_THREADS
+            and not inspect.iscoroutinefunction(endpoint)
+        ):
+            endpoint = profile_in_thread(endpoint)
+        super().__init__(path, endpoint, **kwargs)
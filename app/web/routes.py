@@ -1,31 +1,98 @@
+from datetime import date, datetime, timedelta
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, Form, Request
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi import APIRouter, Depends, Form, HTTPException, Request
+from fastapi.responses import (
+    HTMLResponse,
+    JSONResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
 from pydantic import ValidationError
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 from starlette.status import HTTP_302_FOUND
 
-from app.crud.auth import get_current_user_from_cookie, login_user
-from app.crud.constants import ALLOWED_PRIORITIES, ALLOWED_STATUSES
-from app.db.models import User
-from app.dependencies import get_db, get_template_user
-from app.schemas.tasks import TaskCreateData, TaskUpdateData
+from app.crud.auth import (
+    clear_session_cookies,
+    get_current_user_from_cookie,
+    login_user,
+    revoke_refresh_token,
+    set_session_cookies,
+)
+from app.crud.constants import (
+    ALLOWED_PRIORITIES,
+    ALLOWED_RECURRENCES,
+    ALLOWED_STATUSES,
+)
+from app.db.activity import activity_log
+from app.db.slow_queries import slow_query_log
+from app.dependencies import get_db, get_read_db, get_template_user
+from app.schemas.tasks import OccurrenceUpdateData, TaskCreateData, TaskUpdateData
+from app.schemas.users import CurrentUser
+from app.services.activity_service import ActivityService
+from app.services.archive_service import ArchiveService
+from app.services.calendar_service import CalendarService
 from app.services.category_service import CategoryService
+from app.services.recurrence_service import RecurrenceService
+from app.services.sync_service import SyncService
 from app.services.task_service import TaskService
 from app.services.user_service import UserService
-
-templates = Jinja2Templates(directory="templates")
+from app.web.task_events import task_event_hub, task_event_stream
+from app.web.templating import get_templates
+from app.web.throttling import (
+    client_ip,
+    login_email_limiter,
+    login_ip_limiter,
+    register_email_limiter,
+    register_ip_limiter,
+    throttling_stats,
+)
 
 router = APIRouter()
 
+ARCHIVE_PAGE_SIZE = 50
+CALENDAR_VIEWS = ("month", "week")
+MONTH_NAMES = (
+    "Январь",
+    "Февраль",
+    "Март",
+    "Апрель",
+    "Май",
+    "Июнь",
+    "Июль",
+    "Август",
+    "Сентябрь",
+    "Октябрь",
+    "Ноябрь",
+    "Декабрь",
+)
+HISTORY_PAGE_SIZE = 50
+ACTIVITY_ACTIONS = {
+    "created": "Задача создана",
+    "updated": "Задача изменена",
+    "deleted": "Задача удалена",
+    "archived": "Задача перенесена в архив",
+    "occurrence_updated": "Изменено повторение",
+}
+ACTIVITY_FIELDS = {
+    "title": "Название",
+    "description": "Комментарии",
+    "deadline": "Срок",
+    "status": "Статус",
+    "priority": "Приоритет",
+    "recurrence": "Повторение",
+    "recurrence_interval": "Интервал повторения",
+    "recurrence_until": "Повторять до",
+    "categories": "Категории",
+    "occurs_at": "Повторение от",
+}
+
 
 @router.get("/", response_class=HTMLResponse)
 async def reed_root(request: Request, current_user=Depends(get_template_user)):
     """The application's home page"""
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "home.html",
         {"request": request, "current_user": current_user},
     )
@@ -35,7 +102,7 @@ async def reed_root(request: Request, current_user=Depends(get_template_user)):
 async def register_form(
     request: Request,
     message: str = None,
-    current_user: User = Depends(get_template_user),
+    current_user: CurrentUser = Depends(get_template_user),
 ):
     """
     New user registration page.
@@ -45,7 +112,7 @@ async def register_form(
     """
     if current_user:
         return RedirectResponse(url="/")
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "register.html",
         {"request": request, "current_user": current_user, "message": message},
     )
@@ -66,26 +133,43 @@ async def register_form_submit(
     RedirectResponse: Redirect to the login page on success
     TemplateResponse: Registration page with an error on failure
     """
+    if not register_ip_limiter.allow(
+        client_ip(request)
+    ) or not register_email_limiter.allow(email.strip().lower()):
+        return get_templates().TemplateResponse(
+            "register.html",
+            {
+                "request": request,
+                "error": "Слишком много попыток регистрации, попробуйте позже",
+            },
+            status_code=429,
+        )
+
+    # A plain def runs in the threadpool, the replica sign-in and bcrypt block
     try:
-        UserService.create_user(db, name, email, password)
+        replica = getattr(request.app.state, "replica", None)
+        if replica is not None:
+            replica.register(name, email, password)
+        else:
+            UserService.create_user(db, name, email, password)
 
         return RedirectResponse(url="/login", status_code=HTTP_302_FOUND)
 
     except ValidationError as e:
         error_msgs = [f"{err['loc'][0]}: {err['msg']}" for err in e.errors()]
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "register.html",
             {"request": request, "error": " | ".join(error_msgs)},
             status_code=400,
         )
 
     except ValueError as e:
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "register.html", {"request": request, "error": str(e)}
         )
 
     except SQLAlchemyError:
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "register.html",
             {"request": request, "error": "Ошибка при работе с базой данных"},
             status_code=500,
@@ -93,7 +177,9 @@ async def register_form_submit(
 
 
 @router.get("/login", response_class=HTMLResponse)
-async def login_form(request: Request, current_user: User = Depends(get_template_user)):
+async def login_form(
+    request: Request, current_user: CurrentUser = Depends(get_template_user)
+):
     """
     Login page.
 
@@ -102,7 +188,7 @@ async def login_form(request: Request, current_user: User = Depends(get_template
     """
     if current_user:
         return RedirectResponse(url="/")
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "login.html",
         {
             "request": request,
@@ -112,7 +198,7 @@ async def login_form(request: Request, current_user: User = Depends(get_template
 
 
 @router.post("/login", response_class=HTMLResponse)
-async def login_form_submit(
+def login_form_submit(
     request: Request, email: str = Form(...), password: str = Form(...)
 ):
     """
@@ -122,27 +208,114 @@ async def login_form_submit(
     RedirectResponse: Redirect to your account with an access token installed
     TemplateResponse: Login page with an error message if authentication failed
     """
+    if not login_ip_limiter.allow(client_ip(request)) or not login_email_limiter.allow(
+        email.strip().lower()
+    ):
+        return get_templates().TemplateResponse(
+            "login.html",
+            {
+                "request": request,
+                "error": "Слишком много попыток входа, попробуйте позже",
+            },
+            status_code=429,
+        )
+
     try:
-        access_token = login_user(email, password)
+        replica = getattr(request.app.state, "replica", None)
+        if replica is not None:
+            replica.sign_in(email, password)
+        tokens = login_user(email, password)
 
         response = RedirectResponse(url="/dashboard", status_code=302)
-        response.set_cookie(key="access_token", value=access_token, httponly=True)
+        set_session_cookies(response, tokens)
         return response
     except ValueError as e:
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "login.html", {"request": request, "error": str(e)}, status_code=400
         )
     except SQLAlchemyError:
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "login.html",
             {"request": request, "error": "Ошибка при работе с базой данных"},
             status_code=500,
         )
 
 
+@router.get("/throttling-stats", response_class=JSONResponse)
+async def get_throttling_stats(
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
+):
+    """
+    Counters of the login and registration rate limiters and of the task
+    event streams (for administrators only).
+
+    returns:
+    JSONResponse: Allowed, rejected and evicted counters of every limiter
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Доступ запрещен")
+    return {**throttling_stats(), "task_events": task_event_hub.stats()}
+
+
+@router.get("/activity-log-stats", response_class=JSONResponse)
+async def get_activity_log_stats(
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
+):
+    """
+    Counters of the activity log writer (for administrators only).
+
+    returns:
+    JSONResponse: Queued, written, dropped, failed and pending entries
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Доступ запрещен")
+    return activity_log.stats()
+
+
+@router.get("/slow-queries", response_class=JSONResponse)
+async def get_slow_queries(
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
+):
+    """
+    Slow statements of the worker by fingerprint with their parameter
+    shapes, timings and captured plans (for administrators only).
+
+    returns:
+    JSONResponse: Statements ordered by their total time
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Доступ запрещен")
+    return slow_query_log.entries()
+
+
+@router.get("/account-deletions", response_class=JSONResponse)
+async def get_account_deletions(
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
+    db: Session = Depends(get_db),
+):
+    """
+    Progress of the account deletions that are still being purged
+    (for administrators only).
+
+    returns:
+    JSONResponse: Purged task and link counters of every pending deletion
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Доступ запрещен")
+    return [
+        {
+            "user_id": deletion.user_id,
+            "requested_at": deletion.requested_at.isoformat(),
+            "tasks_purged": deletion.tasks_purged,
+            "links_purged": deletion.links_purged,
+        }
+        for deletion in UserService.get_pending_deletions(db)
+    ]
+
+
 @router.get("/dashboard", response_class=HTMLResponse)
 async def get_user_account(
-    request: Request, current_user: User = Depends(get_current_user_from_cookie)
+    request: Request, current_user: CurrentUser = Depends(get_current_user_from_cookie)
 ):
     """
     User's personal account.
@@ -150,7 +323,7 @@ async def get_user_account(
     returns:
     TemplateResponse: Personal account page with user information
     """
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "dashboard.html",
         {
             "request": request,
@@ -164,7 +337,7 @@ async def get_user_account(
 @router.post("/dashboard", response_class=HTMLResponse)
 async def post_del_user(
     request: Request,
-    current_user: User = Depends(get_current_user_from_cookie),
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
     db: Session = Depends(get_db),
 ):
     """
@@ -179,10 +352,10 @@ async def post_del_user(
         response = RedirectResponse(
             url="/delete-account-success", status_code=HTTP_302_FOUND
         )
-        response.delete_cookie("access_token")
+        clear_session_cookies(response)
         return response
     except ValueError as e:
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "dashboard.html",
             {
                 "request": request,
@@ -194,21 +367,27 @@ async def post_del_user(
 
 
 @router.get("/logout")
-async def logout_user():
+async def logout_user(request: Request):
     """
     Logging the user out.
 
     returns:
-    RedirectResponse: Redirect to the main page with the access token removed
-    """
+    RedirectResponse: Redirect to the main page with the session tokens removed
+    """
+    refresh_token = request.cookies.get("refresh_token")
+    if refresh_token:
+        revoke_refresh_token(refresh_token)
+    replica = getattr(request.app.state, "replica", None)
+    if replica is not None:
+        replica.sign_out()
     response = RedirectResponse(url="/", status_code=302)
-    response.delete_cookie("access_token")
+    clear_session_cookies(response)
     return response
 
 
 @router.get("/delete-account-success", response_class=HTMLResponse)
 async def delete_account(
-    request: Request, current_user: User = Depends(get_template_user)
+    request: Request, current_user: CurrentUser = Depends(get_template_user)
 ):
     """
     Account deletion confirmation page.
@@ -216,7 +395,7 @@ async def delete_account(
     returns:
     TemplateResponse: Account deletion confirmation page
     """
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "delete-account-success.html",
         {"request": request, "current_user": current_user},
     )
@@ -225,21 +404,22 @@ async def delete_account(
 @router.get("/create-task", response_class=HTMLResponse)
 async def get_create_task(
     request: Request,
-    current_user: User = Depends(get_current_user_from_cookie),
-    categories=None,
-    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
 ):
     """
-    New task creation page.
+    New task creation page, categories are picked with the typeahead.
 
     returns:
-    TemplateResponse: Task creation page with a list of categories
+    TemplateResponse: Task creation page
     """
-    if categories is None:
-        categories = CategoryService.get_all_categories(db)
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "create-task.html",
-        {"request": request, "categories": categories, "current_user": current_user},
+        {
+            "request": request,
+            "categories": [],
+            "allowed_recurrences": ALLOWED_RECURRENCES,
+            "current_user": current_user,
+        },
     )
 
 
@@ -252,8 +432,11 @@ async def post_create_task(
     categories: Optional[List[int]] = Form(None),
     status: str = Form("не выполнена"),
     priority: str = Form("средний"),
+    recurrence: Optional[str] = Form(None),
+    recurrence_interval: int = Form(1),
+    recurrence_until: Optional[str] = Form(None),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user_from_cookie),
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
 ):
     """
     Processing the new task creation form.
@@ -270,6 +453,9 @@ async def post_create_task(
             categories=categories,
             status=status,
             priority=priority,
+            recurrence=recurrence,
+            recurrence_interval=recurrence_interval,
+            recurrence_until=recurrence_until,
         )
 
         if task_data.deadline:
@@ -282,12 +468,15 @@ async def post_create_task(
         )
 
     except ValueError as e:
-        categories_list = CategoryService.get_all_categories(db)
-        return templates.TemplateResponse(
+        selected_categories = CategoryService.get_categories_by_ids(
+            db, categories or []
+        )
+        return get_templates().TemplateResponse(
             "create-task.html",
             {
                 "request": request,
-                "categories": categories_list,
+                "categories": selected_categories,
+                "allowed_recurrences": ALLOWED_RECURRENCES,
                 "error": str(e),
                 "current_user": current_user,
             },
@@ -296,7 +485,7 @@ async def post_create_task(
 
 @router.get("/task-creation-success", response_class=HTMLResponse)
 async def get_success(
-    request: Request, current_user: User = Depends(get_current_user_from_cookie)
+    request: Request, current_user: CurrentUser = Depends(get_current_user_from_cookie)
 ):
     """
     Confirmation page for successful task creation.
@@ -304,7 +493,7 @@ async def get_success(
     returns:
     TemplateResponse: Successful task creation page
     """
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "task-creation-success.html", {"request": request, "current_user": current_user}
     )
 
@@ -312,8 +501,8 @@ async def get_success(
 @router.get("/tasks", response_class=HTMLResponse)
 async def get_all_tasks_user(
     request: Request,
-    current_user: User = Depends(get_current_user_from_cookie),
-    db: Session = Depends(get_db),
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
+    db: Session = Depends(get_read_db),
 ):
     """
     A page with a list of all user tasks.
@@ -321,23 +510,226 @@ async def get_all_tasks_user(
     returns:
     TemplateResponse: A page with a list of user tasks
     """
+    version = SyncService.page_version(db)
     tasks = TaskService.get_all_user_tasks(db, current_user.id)
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "tasks.html",
         {
             "request": request,
             "tasks": tasks,
+            "version": version,
             "user_name": current_user.name,
             "current_user": current_user,
         },
     )
 
 
+@router.get("/archive", response_class=HTMLResponse)
+async def get_archive(
+    request: Request,
+    q: str = "",
+    page: int = 1,
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Archived tasks of the user with a search by title.
+
+    returns:
+    TemplateResponse: One page of the archive
+    """
+    page = max(page, 1)
+    tasks, total = ArchiveService.search_archived_tasks(
+        db, current_user.id, q, ARCHIVE_PAGE_SIZE, (page - 1) * ARCHIVE_PAGE_SIZE
+    )
+    return get_templates().TemplateResponse(
+        "archive.html",
+        {
+            "request": request,
+            "tasks": tasks,
+            "total": total,
+            "query": q,
+            "page": page,
+            "pages": max((total + ARCHIVE_PAGE_SIZE - 1) // ARCHIVE_PAGE_SIZE, 1),
+            "current_user": current_user,
+        },
+    )
+
+
+@router.get("/calendar", response_class=HTMLResponse)
+async def get_calendar(
+    request: Request,
+    view: str = "month",
+    day: Optional[date] = None,
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Calendar of the user's tasks by deadline.
+
+    The month view counts the tasks of every visible day and lists the
+    tasks of the selected day only, the week view lists the tasks of its
+    seven days.
+
+    returns:
+    TemplateResponse: Calendar page
+    """
+    if view not in CALENDAR_VIEWS:
+        view = "month"
+    day = day or date.today()
+    if view == "month":
+        start, end = CalendarService.month_window(day)
+        counts = CalendarService.count_by_day(db, current_user.id, start, end)
+        entries = CalendarService.get_entries(
+            db, current_user.id, day, day + timedelta(days=1)
+        )
+        previous_day = (day.replace(day=1) - timedelta(days=1)).replace(day=1)
+        next_day = (day.replace(day=1) + timedelta(days=31)).replace(day=1)
+    else:
+        start, end = CalendarService.week_window(day)
+        entries = CalendarService.get_entries(db, current_user.id, start, end)
+        counts = {entry_day: len(items) for entry_day, items in entries.items()}
+        previous_day, next_day = day - timedelta(days=7), day + timedelta(days=7)
+
+    days = [start + timedelta(days=offset) for offset in range((end - start).days)]
+    return get_templates().TemplateResponse(
+        "calendar.html",
+        {
+            "request": request,
+            "view": view,
+            "day": day,
+            "today": date.today(),
+            "month_name": MONTH_NAMES[day.month - 1],
+            "weeks": [days[index : index + 7] for index in range(0, len(days), 7)],
+            "counts": counts,
+            "entries": entries,
+            "previous_day": previous_day,
+            "next_day": next_day,
+            "current_user": current_user,
+        },
+    )
+
+
+@router.post("/calendar/occurrences", response_class=HTMLResponse)
+async def post_calendar_occurrence(
+    task_id: int = Form(...),
+    occurs_at: datetime = Form(...),
+    status: str = Form(...),
+    view: str = Form("month"),
+    day: date = Form(...),
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
+    db: Session = Depends(get_db),
+):
+    """
+    Changes the status of one occurrence of a recurring task.
+
+    returns:
+    RedirectResponse: Redirect back to the calendar
+    """
+    try:
+        RecurrenceService.update_occurrence(
+            db,
+            current_user.id,
+            task_id,
+            occurs_at,
+            OccurrenceUpdateData(status=status),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if view not in CALENDAR_VIEWS:
+        view = "month"
+    return RedirectResponse(
+        url=f"/calendar?view={view}&day={day.isoformat()}", status_code=HTTP_302_FOUND
+    )
+
+
+@router.get("/tasks/events")
+async def stream_task_events(
+    request: Request,
+    since: Optional[int] = None,
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
+):
+    """
+    Server-Sent Events with the changes of the user's tasks.
+
+    args:
+    since: Version the page was rendered at, the Last-Event-ID header of
+    a reconnecting browser takes precedence
+
+    returns:
+    StreamingResponse: text/event-stream with "changed" and "deleted" events
+    """
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+    return StreamingResponse(
+        task_event_stream(request, current_user.id, since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/tasks/{task_id}/card", response_class=HTMLResponse)
+async def get_task_card(
+    request: Request,
+    task_id: int,
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
+    db: Session = Depends(get_db),
+):
+    """
+    Rendered card of one task, used to patch the task list in place.
+
+    returns:
+    TemplateResponse: Task card fragment
+    """
+    try:
+        task = TaskService.get_user_task_by_id(db, current_user.id, task_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return get_templates().TemplateResponse(
+        "_task_card.html", {"request": request, "task": task}
+    )
+
+
+@router.get("/tasks/{task_id}/history", response_class=HTMLResponse)
+async def get_task_history(
+    request: Request,
+    task_id: int,
+    before: Optional[int] = None,
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Change history of a task, newest changes first. The history of a
+    deleted or archived task stays available.
+
+    returns:
+    TemplateResponse: History page
+    """
+    entries = ActivityService.get_task_history(
+        db, current_user.id, task_id, HISTORY_PAGE_SIZE, before
+    )
+    return get_templates().TemplateResponse(
+        "task-history.html",
+        {
+            "request": request,
+            "task_id": task_id,
+            "entries": entries,
+            "action_names": ACTIVITY_ACTIONS,
+            "field_names": ACTIVITY_FIELDS,
+            "next_before": (
+                entries[-1].id if len(entries) == HISTORY_PAGE_SIZE else None
+            ),
+            "current_user": current_user,
+        },
+    )
+
+
 @router.post("/tasks/{task_id}", response_class=HTMLResponse)
 async def delete_task(
     request: Request,
     task_id: int,
-    current_user: User = Depends(get_current_user_from_cookie),
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
     db: Session = Depends(get_db),
 ):
     """
@@ -348,24 +740,28 @@ async def delete_task(
     """
     try:
         TaskService.delete_task(db, current_user.id, task_id)
+        version = SyncService.page_version(db)
         tasks = TaskService.get_all_user_tasks(db=db, user_id=current_user.id)
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "tasks.html",
             {
                 "request": request,
                 "tasks": tasks,
+                "version": version,
                 "user_name": current_user.name,
                 "success": True,
                 "current_user": current_user,
             },
         )
     except ValueError as e:
+        version = SyncService.page_version(db)
         tasks = TaskService.get_all_user_tasks(db=db, user_id=current_user.id)
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "tasks.html",
             {
                 "request": request,
                 "tasks": tasks,
+                "version": version,
                 "user_name": current_user.name,
                 "error": str(e),
                 "current_user": current_user,
@@ -377,9 +773,8 @@ async def delete_task(
 async def get_task_by_id(
     request: Request,
     task_id: int,
-    current_user: User = Depends(get_current_user_from_cookie),
-    db: Session = Depends(get_db),
-    categories=None,
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
+    db: Session = Depends(get_read_db),
 ):
     """
     Edit page for a specific task.
@@ -387,19 +782,17 @@ async def get_task_by_id(
     Returns:
     TemplateResponse: Task edit page with pre-populated data
     """
-    if categories is None:
-        categories = CategoryService.get_all_categories(db)
     task_by_id = TaskService.get_user_task_by_id(
         db=db, user_id=current_user.id, task_id=task_id
     )
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "edit-task.html",
         {
             "request": request,
             "task": task_by_id,
-            "categories": categories,
             "allowed_statuses": ALLOWED_STATUSES,
             "allowed_priorities": ALLOWED_PRIORITIES,
+            "allowed_recurrences": ALLOWED_RECURRENCES,
             "current_user": current_user,
         },
     )
@@ -415,8 +808,11 @@ async def post_edit_task(
     categories: Optional[List[int]] = Form(None),
     status: str = Form(None),
     priority: str = Form(None),
+    recurrence: Optional[str] = Form(None),
+    recurrence_interval: Optional[int] = Form(None),
+    recurrence_until: Optional[str] = Form(None),
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user_from_cookie),
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
 ):
     """
     Processing the task edit form.
@@ -432,6 +828,9 @@ async def post_edit_task(
             categories=categories,
             status=status,
             priority=priority,
+            recurrence=recurrence,
+            recurrence_interval=recurrence_interval,
+            recurrence_until=recurrence_until,
         )
 
         if update_data.deadline:
@@ -441,33 +840,31 @@ async def post_edit_task(
             db=db, user_id=current_user.id, task_id=task_id, update_data=update_data
         )
 
-        all_categories = CategoryService.get_all_categories(db)
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "edit-task.html",
             {
                 "request": request,
                 "task": updated_task,
-                "categories": all_categories,
                 "allowed_statuses": ALLOWED_STATUSES,
                 "allowed_priorities": ALLOWED_PRIORITIES,
+                "allowed_recurrences": ALLOWED_RECURRENCES,
                 "success": True,
                 "current_user": current_user,
             },
         )
 
     except ValueError as e:
-        all_categories = CategoryService.get_all_categories(db)
         task = TaskService.get_user_task_by_id(
             db=db, user_id=current_user.id, task_id=task_id
         )
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "edit-task.html",
             {
                 "request": request,
                 "task": task,
-                "categories": all_categories,
                 "allowed_statuses": ALLOWED_STATUSES,
                 "allowed_priorities": ALLOWED_PRIORITIES,
+                "allowed_recurrences": ALLOWED_RECURRENCES,
                 "error": str(e),
                 "current_user": current_user,
             },
@@ -477,10 +874,10 @@ async def post_edit_task(
 @router.get("/edit-categories", response_class=HTMLResponse)
 async def get_edit_categories(
     request: Request,
-    current_user: User = Depends(get_current_user_from_cookie),
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
     error: Optional[str] = None,
     success: Optional[str] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     """
     Category management page (available only to administrators).
@@ -489,7 +886,7 @@ async def get_edit_categories(
     TemplateResponse: Category management page
     """
     all_categories = CategoryService.get_all_categories(db)
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "edit-categories.html",
         {
             "request": request,
@@ -506,11 +903,11 @@ async def get_edit_categories(
 async def post_add_category(
     request: Request,
     title: str = Form(...),
-    current_user: User = Depends(get_current_user_from_cookie),
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
     db: Session = Depends(get_db),
 ):
     """
-    Adding a new category (for administrators only).
+    Adding new categories, one title per line (for administrators only).
 
     returns:
     RedirectResponse: Redirect to the category management page with the result
@@ -518,7 +915,9 @@ async def post_add_category(
     try:
         if not current_user.is_admin:
             raise ValueError("Доступ запрещен")
-        CategoryService.create_category(db=db, title=title)
+        _, existing = CategoryService.create_categories(db, title.splitlines())
+        if existing:
+            raise ValueError(f"Такие категории уже существуют: {', '.join(existing)}")
 
         return RedirectResponse("/edit-categories?success=True", status_code=302)
     except ValueError as e:
@@ -529,7 +928,7 @@ async def post_add_category(
 async def post_del_category(
     request: Request,
     categories: list[int] = Form(...),
-    current_user: User = Depends(get_current_user_from_cookie),
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
     db: Session = Depends(get_db),
 ):
     """
@@ -541,7 +940,34 @@ async def post_del_category(
     try:
         if not current_user.is_admin:
             raise ValueError("Доступ запрещен")
-        CategoryService.delete_categories_list(db, categories)
+        _, missing = CategoryService.delete_categories_list(db, categories)
+        if missing:
+            raise ValueError(
+                f"Категории с ID {', '.join(map(str, missing))} не найдены"
+            )
+        return RedirectResponse("/edit-categories?success=True", status_code=302)
+    except ValueError as e:
+        return RedirectResponse(f"/edit-categories?error={str(e)}", status_code=400)
+
+
+@router.post("/merge-categories", response_class=HTMLResponse)
+async def post_merge_categories(
+    request: Request,
+    categories: list[int] = Form(...),
+    target: int = Form(...),
+    current_user: CurrentUser = Depends(get_current_user_from_cookie),
+    db: Session = Depends(get_db),
+):
+    """
+    Merging the selected categories into the target one (for administrators only).
+
+    returns:
+    RedirectResponse: Redirect to the category management page with the result
+    """
+    try:
+        if not current_user.is_admin:
+            raise ValueError("Доступ запрещен")
+        CategoryService.merge_categories(db, categories, target)
         return RedirectResponse("/edit-categories?success=True", status_code=302)
     except ValueError as e:
         return RedirectResponse(f"/edit-categories?error={str(e)}", status_code=400)
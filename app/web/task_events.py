@@ -0,0 +1,206 @@
+import asyncio
+import json
+import os
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from threading import Lock
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+
+from app.crud.auth import ACCESS_TOKEN_EXPIRE_MINUTES
+from app.db.database import SessionLocal
+from app.db.invalidation import ALL_KEYS, invalidation_bus
+from app.services.sync_service import SyncService
+
+TOPIC = "tasks"
+HEARTBEAT_SECONDS = 20
+QUEUE_SIZE = 100
+RETRY_MILLISECONDS = 5000
+REPLAY_LIMIT = 200
+# Streams are closed before the access token expires, the browser
+# reconnects with fresh cookies and Last-Event-ID
+STREAM_LIFETIME_SECONDS = ACCESS_TOKEN_EXPIRE_MINUTES * 60 // 2
+
+
+@dataclass(frozen=True)
+class TaskEvent:
+    kind: str
+    task_id: Optional[int] = None
+    version: Optional[int] = None
+
+
+RELOAD = TaskEvent("reload")
+
+
+class TaskEventHub:
+    """
+    Fans task changes out to the open event streams of their owners.
+
+    Every stream is a bounded asyncio queue, an idle stream costs one
+    queue and one suspended coroutine. Changes arrive from the
+    invalidation bus on any thread and are handed to the event loop.
+    A stream that falls behind gets a single reload event instead of
+    an ever growing queue.
+    """
+
+    def __init__(self, max_streams: int, max_streams_per_user: int):
+        self.max_streams = max_streams
+        self.max_streams_per_user = max_streams_per_user
+        self._streams: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self._count = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = Lock()
+        self.rejected = 0
+        self.overflowed = 0
+
+    def subscribe(self, user_id: int) -> Optional[asyncio.Queue]:
+        """
+        Opens a stream of the user, must be called from the event loop.
+
+        returns:
+        Optional[asyncio.Queue]: Queue of the stream or None if a
+        connection limit is reached
+        """
+        with self._lock:
+            streams = self._streams[user_id]
+            if (
+                self._count >= self.max_streams
+                or len(streams) >= self.max_streams_per_user
+            ):
+                if not streams:
+                    del self._streams[user_id]
+                self.rejected += 1
+                return None
+            self._loop = asyncio.get_running_loop()
+            queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+            streams.add(queue)
+            self._count += 1
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue) -> None:
+        with self._lock:
+            streams = self._streams.get(user_id)
+            if streams is None or queue not in streams:
+                return
+            streams.discard(queue)
+            if not streams:
+                del self._streams[user_id]
+            self._count -= 1
+
+    def handle(self, key: str) -> None:
+        """
+        Bus subscriber, delivers a change to the streams of its owner.
+
+        args:
+        key: "user_id:task_id:kind:version" as published by TaskService
+        """
+        if key == ALL_KEYS:
+            with self._lock:
+                queues = [
+                    queue for streams in self._streams.values() for queue in streams
+                ]
+            self._deliver(queues, RELOAD)
+            return
+
+        user_id, task_id, kind, version = key.split(":")
+        with self._lock:
+            queues = list(self._streams.get(int(user_id), ()))
+        self._deliver(queues, TaskEvent(kind, int(task_id), int(version)))
+
+    def _deliver(self, queues, event: TaskEvent) -> None:
+        if not queues or self._loop is None:
+            return
+        for queue in queues:
+            self._loop.call_soon_threadsafe(self._put, queue, event)
+
+    def _put(self, queue: asyncio.Queue, event: TaskEvent) -> None:
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed += 1
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RELOAD)
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the stream counters for monitoring"""
+        with self._lock:
+            return {
+                "streams": self._count,
+                "users": len(self._streams),
+                "rejected": self.rejected,
+                "overflowed": self.overflowed,
+            }
+
+
+task_event_hub = TaskEventHub(
+    max_streams=int(os.getenv("SSE_MAX_STREAMS", "1000")),
+    max_streams_per_user=int(os.getenv("SSE_MAX_STREAMS_PER_USER", "5")),
+)
+invalidation_bus.subscribe(TOPIC, task_event_hub.handle)
+
+
+def format_event(event: TaskEvent) -> str:
+    lines = []
+    if event.version is not None:
+        lines.append(f"id: {event.version}")
+    lines.append(f"event: {event.kind}")
+    lines.append(f"data: {json.dumps({'id': event.task_id})}")
+    return "\n".join(lines) + "\n\n"
+
+
+def replay_events(user_id: int, since: int) -> List[TaskEvent]:
+    """Events of the changes a reconnecting page missed since its version"""
+    db = SessionLocal()
+    try:
+        changes = SyncService.get_changes(db, user_id, since, REPLAY_LIMIT)
+    finally:
+        db.close()
+    if changes.has_more:
+        return [RELOAD]
+    events = [
+        TaskEvent("deleted", task_id, changes.version)
+        for task_id in changes.deleted_tasks
+    ]
+    events.extend(
+        TaskEvent("changed", task.id, changes.version) for task in changes.tasks
+    )
+    events.append(TaskEvent("ready", version=changes.version))
+    return events
+
+
+async def task_event_stream(
+    request: Request, user_id: int, since: Optional[int]
+) -> AsyncIterator[str]:
+    """
+    Server-Sent Events stream of the user's task changes.
+
+    The stream subscribes before replaying the missed changes, so nothing
+    falls in between, a change may only arrive twice.
+    """
+    queue = task_event_hub.subscribe(user_id)
+    if queue is None:
+        yield format_event(TaskEvent("limit"))
+        return
+
+    try:
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        if since is not None:
+            for event in await run_in_threadpool(replay_events, user_id, since):
+                yield format_event(event)
+
+        closes_at = time.monotonic() + STREAM_LIFETIME_SECONDS
+        while time.monotonic() < closes_at:
+            try:
+                event = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": ping\n\n"
+                continue
+            yield format_event(event)
+    finally:
+        task_event_hub.unsubscribe(user_id, queue)
@@ -0,0 +1,34 @@
+from threading import Lock
+from typing import Optional
+
+from fastapi.templating import Jinja2Templates
+
+TEMPLATES_DIRECTORY = "templates"
+
+_templates: Optional[Jinja2Templates] = None
+_templates_lock = Lock()
+
+
+def get_templates() -> Jinja2Templates:
+    """Returns the page templates, the Jinja environment is built on first use"""
+    global _templates
+    if _templates is None:
+        with _templates_lock:
+            if _templates is None:
+                _templates = Jinja2Templates(directory=TEMPLATES_DIRECTORY)
+    return _templates
+
+
+def warm_up_templates() -> int:
+    """
+    Compiles every template into the environment's cache, so the first
+    render of a page does not pay for parsing it
+
+    returns:
+    int: Number of compiled templates
+    """
+    environment = get_templates().env
+    names = environment.list_templates(extensions=["html"])
+    for name in names:
+        environment.get_template(name)
+    return len(names)
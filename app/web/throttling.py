@@ -0,0 +1,84 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Tuple
+
+from fastapi import Request
+
+
+class TokenBucketLimiter:
+    """
+    In-memory token bucket rate limiter.
+
+    Every key owns a bucket of `capacity` tokens refilled at `rate` tokens
+    per second. Buckets are kept in LRU order and the least recently used
+    ones are evicted once `max_keys` is exceeded, so memory stays bounded.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: int, max_keys: int = 10000):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = Lock()
+        self.allowed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def allow(self, key: str) -> bool:
+        """Takes a token from the key's bucket, returns False if it is empty"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                tokens = float(self.capacity)
+            else:
+                tokens, updated_at = bucket
+                tokens = min(self.capacity, tokens + (now - updated_at) * self.rate)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+                self.allowed += 1
+            else:
+                self.rejected += 1
+
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evicted += 1
+        return allowed
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the limiter counters for monitoring"""
+        with self._lock:
+            return {
+                "allowed": self.allowed,
+                "rejected": self.rejected,
+                "evicted": self.evicted,
+                "tracked_keys": len(self._buckets),
+            }
+
+
+login_ip_limiter = TokenBucketLimiter("login_ip", rate=10 / 60, capacity=20)
+login_email_limiter = TokenBucketLimiter("login_email", rate=5 / 60, capacity=5)
+register_ip_limiter = TokenBucketLimiter("register_ip", rate=5 / 600, capacity=5)
+register_email_limiter = TokenBucketLimiter("register_email", rate=1 / 60, capacity=3)
+
+LIMITERS = (
+    login_ip_limiter,
+    login_email_limiter,
+    register_ip_limiter,
+    register_email_limiter,
+)
+
+
+def client_ip(request: Request) -> str:
+    """Returns the client address of the request"""
+    return request.client.host if request.client else "unknown"
+
+
+def throttling_stats() -> Dict[str, Dict[str, int]]:
+    """Returns the counters of all limiters"""
+    return {limiter.name: limiter.stats() for limiter in LIMITERS}
@@ -0,0 +1,52 @@
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+load_dotenv()  # noqa: E402
+
+from app.db.database import SessionLocal
+from app.services.archive_service import ArchiveService
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Moves completed tasks into the archive tables in batches"
+    )
+    parser.add_argument(
+        "--older-than-days",
+        type=int,
+        default=int(os.getenv("ARCHIVE_AFTER_DAYS", 30)),
+        help="Archive completed tasks not changed for this many days",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=int(os.getenv("ARCHIVE_BATCH_SIZE", 500))
+    )
+    parser.add_argument(
+        "--pause", type=float, default=0.05, help="Seconds between the batches"
+    )
+    args = parser.parse_args()
+
+    completed_before = datetime.now() - timedelta(days=args.older_than_days)
+    total = 0
+    while True:
+        db = SessionLocal()
+        try:
+            moved = ArchiveService.archive_completed_batch(
+                db, completed_before, args.batch_size
+            )
+        finally:
+            db.close()
+        if not moved:
+            break
+        total += moved
+        print(f"Archived {total} tasks")
+        # Leaves room for the application's queries between batches
+        time.sleep(args.pause)
+    print(f"Done, {total} tasks completed before {completed_before:%Y-%m-%d} archived")
+
+
+if __name__ == "__main__":
+    main()
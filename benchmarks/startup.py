@@ -0,0 +1,143 @@
+"""
+Measures the time from starting the server process to its first
+successful response.
+
+    python benchmarks/startup.py --runs 5
+    python benchmarks/startup.py --email user@example.com --path /tasks
+
+Every run starts a fresh uvicorn process with the same environment as
+this script, polls the page until it answers with 2xx and stops the
+process. Runs are made without and with WARM_UP_ON_STARTUP, unless
+--mode picks one of them. With --email the requests carry an access
+token of that user, so pages that need the database can be measured.
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+POLL_INTERVAL = 0.01
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def user_cookie(email: str) -> str:
+    """Signs an access token of the user the same way the server does"""
+    sys.path.insert(0, str(BASE_DIR))
+    from app.crud.auth import create_access_token, user_token_claims
+    from app.db.database import SessionLocal
+    from app.db.models import User
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter_by(email=email).first()
+        if user is None:
+            raise SystemExit(f"User {email} not found")
+        return f"access_token={create_access_token(user_token_claims(user))}"
+    finally:
+        db.close()
+
+
+def first_response(url: str, cookie: Optional[str], timeout: float) -> float:
+    """
+    Polls the URL until it answers with 2xx.
+
+    returns:
+    float: Duration of the first successful request in seconds
+    """
+    started = time.perf_counter()
+    request = urllib.request.Request(url)
+    if cookie:
+        request.add_header("Cookie", cookie)
+    while time.perf_counter() - started < timeout:
+        sent = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                response.read()
+            return time.perf_counter() - sent
+        except urllib.error.HTTPError as exc:
+            raise SystemExit(f"{url} answered {exc.code}")
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(POLL_INTERVAL)
+    raise SystemExit(f"No response from {url} in {timeout} s")
+
+
+def run_once(
+    path: str, cookie: Optional[str], warm_up: bool, timeout: float
+) -> Dict[str, float]:
+    port = free_port()
+    environment = dict(os.environ, WARM_UP_ON_STARTUP="1" if warm_up else "0")
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=BASE_DIR,
+        env=environment,
+    )
+    try:
+        request = first_response(f"http://127.0.0.1:{port}{path}", cookie, timeout)
+        return {"total": time.perf_counter() - started, "request": request}
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def report(mode: str, results: List[Dict[str, float]]) -> None:
+    for key in ("total", "request"):
+        values = [result[key] * 1000 for result in results]
+        print(
+            f"{mode:<8} {key:<8} median={statistics.median(values):8.1f} ms "
+            f"min={min(values):8.1f} ms max={max(values):8.1f} ms"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Time from process start to the first successful response"
+    )
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default=None, help="Page to request")
+    parser.add_argument("--email", default=None, help="Request as this user")
+    parser.add_argument("--mode", choices=("lazy", "warm-up", "both"), default="both")
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    load_dotenv(BASE_DIR / ".env")
+    cookie = user_cookie(args.email) if args.email else None
+    path = args.path or ("/tasks" if args.email else "/")
+
+    modes = {"lazy": [False], "warm-up": [True], "both": [False, True]}[args.mode]
+    for warm_up in modes:
+        results = [
+            run_once(path, cookie, warm_up, args.timeout) for _ in range(args.runs)
+        ]
+        report("warm-up" if warm_up else "lazy", results)
+
+
+if __name__ == "__main__":
+    main()
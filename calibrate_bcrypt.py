@@ -0,0 +1,61 @@
+import argparse
+import re
+from pathlib import Path
+
+from app.crud.security import (
+    MAX_BCRYPT_ROUNDS,
+    MIN_BCRYPT_ROUNDS,
+    calibrate_bcrypt_rounds,
+)
+
+
+def write_env_value(env_file: Path, key: str, value: str) -> None:
+    """Sets KEY=value in the env file, replacing an existing line if present"""
+    line = f"{key}={value}"
+    content = env_file.read_text(encoding="utf-8") if env_file.exists() else ""
+    pattern = re.compile(rf"^{re.escape(key)}=.*$", re.MULTILINE)
+    if pattern.search(content):
+        content = pattern.sub(line, content)
+    else:
+        if content and not content.endswith("\n"):
+            content += "\n"
+        content += line + "\n"
+    env_file.write_text(content, encoding="utf-8")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks bcrypt costs and stores the chosen BCRYPT_ROUNDS"
+    )
+    parser.add_argument(
+        "--target-ms",
+        type=float,
+        default=250,
+        help="Target password verification latency in milliseconds",
+    )
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--min-rounds", type=int, default=MIN_BCRYPT_ROUNDS)
+    parser.add_argument("--max-rounds", type=int, default=MAX_BCRYPT_ROUNDS)
+    parser.add_argument("--env-file", type=Path, default=Path(".env"))
+    parser.add_argument(
+        "--dry-run", action="store_true", help="Only print the chosen cost"
+    )
+    args = parser.parse_args()
+
+    rounds, timings = calibrate_bcrypt_rounds(
+        args.target_ms / 1000,
+        samples=args.samples,
+        min_rounds=args.min_rounds,
+        max_rounds=args.max_rounds,
+    )
+    for cost, seconds in timings.items():
+        print(f"rounds={cost:<3} verify={seconds * 1000:8.1f} ms")
+    print(f"BCRYPT_ROUNDS={rounds}")
+
+    if not args.dry_run:
+        write_env_value(args.env_file, "BCRYPT_ROUNDS", str(rounds))
+        print(f"Saved to {args.env_file}")
+
+
+if __name__ == "__main__":
+    main()
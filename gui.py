@@ -1,3 +1,12 @@
+import argparse
+import os
+import secrets
+import socket
+import sys
+import threading
+import time
+from pathlib import Path
+
 import webview
 from dotenv import load_dotenv
 
@@ -5,13 +14,90 @@ load_dotenv()  # noqa: E402
 
 
 SERVER_URL = "http://194.39.101.101:8000"
+DATA_DIR = Path(os.getenv("FLAPTASK_DATA_DIR", Path.home() / ".flaptask"))
+BASE_DIR = Path(getattr(sys, "_MEIPASS", Path(__file__).resolve().parent))
+
+
+def prepare_offline_environment() -> None:
+    """
+    Points the application at the local SQLite replica.
+
+    Must run before the first database access, the engine reads
+    DATABASE_URL when it is created.
+    """
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    secret_file = DATA_DIR / "secret.key"
+    if not secret_file.exists():
+        secret_file.write_text(secrets.token_hex(64))
+
+    os.environ["DATABASE_URL"] = f"sqlite:///{DATA_DIR / 'replica.db'}"
+    os.environ["SECRET_KEY"] = secret_file.read_text().strip()
+    os.environ["INVALIDATION_BACKEND"] = "memory"
+    os.chdir(BASE_DIR)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_local_server():
+    """
+    Serves the UI from a local FastAPI instance backed by the replica.
+
+    returns:
+    Tuple[str, DesktopReplica, uvicorn.Server]: Local URL, replica and server
+    """
+    import uvicorn
+
+    from app.desktop.replica import init_replica, install_change_tracking
+    from app.desktop.sync import DesktopReplica
+    from app.web.main import create_app
+
+    init_replica()
+    replica = DesktopReplica(os.getenv("SERVER_URL", SERVER_URL))
+    install_change_tracking(on_local_commit=replica.worker.trigger)
+
+    app = create_app(is_gui=True)
+    app.state.replica = replica
+
+    port = free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    threading.Thread(target=server.run, name="local-server", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    replica.start()
+    return f"http://127.0.0.1:{port}", replica, server
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="FlapTask desktop client")
+    parser.add_argument(
+        "--remote",
+        action="store_true",
+        help="Open the remote site instead of the offline replica",
+    )
+    args = parser.parse_args()
+
+    if args.remote:
+        url, replica, server = SERVER_URL, None, None
+    else:
+        prepare_offline_environment()
+        url, replica, server = start_local_server()
+
     window = webview.create_window(
         "Планировщик задач",
-        f"{SERVER_URL}/?gui=1",
+        f"{url}/?gui=1",
         width=1500,
         height=900,
         min_size=(800, 600),
     )
     webview.start()
+
+    if replica is not None:
+        replica.stop()
+        server.should_exit = True
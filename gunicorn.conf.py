@@ -0,0 +1,58 @@
+"""
+Production server settings for FlapTask.
+
+Runs the ASGI app under gunicorn with uvicorn workers:
+
+    gunicorn -c gunicorn.conf.py
+
+The app is imported once in the master process and the workers are
+forked from it. Every worker drops the connection pool inherited from
+the master, so connections are never shared between processes.
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _cpu_count() -> int:
+    """Returns the number of CPUs available to this process"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+wsgi_app = "main:app"
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', 8000)}"
+
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", _cpu_count()))
+preload_app = True
+
+backlog = int(os.getenv("BACKLOG", 2048))
+keepalive = int(os.getenv("KEEPALIVE", 5))
+timeout = int(os.getenv("WORKER_TIMEOUT", 60))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+
+max_requests = int(os.getenv("MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", 0))
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    """Drops the connection pool inherited from the master process"""
+    from app.db.database import dispose_engine
+
+    dispose_engine(close=False)
+
+
+def worker_exit(server, worker):
+    """Closes the worker's pooled connections after its requests are drained"""
+    from app.db.database import dispose_engine
+
+    dispose_engine()
@@ -0,0 +1,95 @@
+// Typeahead for the task forms: only the picked categories are rendered,
+// the rest is looked up on the server while typing.
+(function () {
+    const search = document.querySelector(".category-search");
+    if (!search) {
+        return;
+    }
+    const suggestions = document.querySelector(".category-suggestions");
+    const selected = document.querySelector(".right-section .categories");
+    const DEBOUNCE_MILLISECONDS = 150;
+    let timer = null;
+    let controller = null;
+
+    function isSelected(categoryId) {
+        return selected.querySelector('input[value="' + categoryId + '"]') !== null;
+    }
+
+    function pick(category) {
+        if (!isSelected(category.id)) {
+            const label = document.createElement("label");
+            const checkbox = document.createElement("input");
+            checkbox.type = "checkbox";
+            checkbox.name = "categories";
+            checkbox.value = category.id;
+            checkbox.checked = true;
+            label.append(checkbox, " " + category.title);
+            selected.appendChild(label);
+        }
+        search.value = "";
+        suggestions.hidden = true;
+        search.focus();
+    }
+
+    function show(categories) {
+        suggestions.replaceChildren();
+        for (const category of categories) {
+            if (isSelected(category.id)) {
+                continue;
+            }
+            const item = document.createElement("li");
+            item.textContent = category.title;
+            item.addEventListener("mousedown", function (event) {
+                event.preventDefault();
+                pick(category);
+            });
+            suggestions.appendChild(item);
+        }
+        suggestions.hidden = suggestions.children.length === 0;
+    }
+
+    async function lookup(query) {
+        if (controller) {
+            controller.abort();
+        }
+        controller = new AbortController();
+        try {
+            const response = await fetch(
+                "/api/v1/categories/search?q=" + encodeURIComponent(query),
+                { credentials: "same-origin", signal: controller.signal }
+            );
+            if (response.ok) {
+                show((await response.json()).items);
+            }
+        } catch (error) {
+            if (error.name !== "AbortError") {
+                throw error;
+            }
+        }
+    }
+
+    search.addEventListener("input", function () {
+        clearTimeout(timer);
+        const query = search.value.trim();
+        if (!query) {
+            suggestions.hidden = true;
+            return;
+        }
+        timer = setTimeout(function () {
+            lookup(query);
+        }, DEBOUNCE_MILLISECONDS);
+    });
+    search.addEventListener("keydown", function (event) {
+        // Enter picks the first suggestion instead of submitting the form
+        if (event.key === "Enter") {
+            event.preventDefault();
+            const first = suggestions.firstElementChild;
+            if (first && !suggestions.hidden) {
+                first.dispatchEvent(new MouseEvent("mousedown"));
+            }
+        }
+    });
+    search.addEventListener("blur", function () {
+        suggestions.hidden = true;
+    });
+})();
@@ -0,0 +1,57 @@
+// Keeps the task list in step with changes made in other tabs and in the
+// desktop client. Only the changed cards are fetched and replaced.
+(function () {
+    const list = document.getElementById("task-list");
+    if (!list || !window.EventSource) {
+        return;
+    }
+    const empty = document.querySelector(".no-task");
+    const source = new EventSource("/tasks/events?since=" + list.dataset.version);
+
+    function findCard(taskId) {
+        return list.querySelector('[data-task-id="' + taskId + '"]');
+    }
+
+    function removeCard(taskId) {
+        const card = findCard(taskId);
+        if (card) {
+            card.remove();
+        }
+        empty.hidden = list.children.length > 0;
+    }
+
+    async function refreshCard(taskId) {
+        const response = await fetch("/tasks/" + taskId + "/card", {
+            credentials: "same-origin",
+        });
+        if (response.status === 404) {
+            removeCard(taskId);
+            return;
+        }
+        if (!response.ok) {
+            return;
+        }
+        const template = document.createElement("template");
+        template.innerHTML = (await response.text()).trim();
+        const card = findCard(taskId);
+        if (card) {
+            card.replaceWith(template.content.firstElementChild);
+        } else {
+            list.appendChild(template.content.firstElementChild);
+        }
+        empty.hidden = true;
+    }
+
+    source.addEventListener("changed", function (event) {
+        refreshCard(JSON.parse(event.data).id);
+    });
+    source.addEventListener("deleted", function (event) {
+        removeCard(JSON.parse(event.data).id);
+    });
+    source.addEventListener("reload", function () {
+        window.location.reload();
+    });
+    source.addEventListener("limit", function () {
+        source.close();
+    });
+})();
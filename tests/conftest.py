@@ -0,0 +1,53 @@
+import os
+import tempfile
+
+# The settings are read on first use, so they are set before anything
+# touches the database or hashes a password
+_database_dir = tempfile.mkdtemp(prefix="flaptask-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_database_dir, "test.db")
+os.environ["INVALIDATION_BACKEND"] = "memory"
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import pytest  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+import app.db.models  # noqa: E402,F401
+from app.crud.auth import create_access_token, user_token_claims  # noqa: E402
+from app.db.database import Base, SessionLocal, get_engine  # noqa: E402
+from app.services.user_service import UserService  # noqa: E402
+from app.web.main import create_app  # noqa: E402
+
+PASSWORD = "password1"
+
+
+@pytest.fixture
+def db():
+    """Session of an empty database, the tables are recreated for every test"""
+    engine = get_engine()
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def user(db):
+    return UserService.create_user(db, "Pete", "pete@example.com", PASSWORD)
+
+
+@pytest.fixture
+def other_user(db):
+    return UserService.create_user(db, "Olga", "olga@example.com", PASSWORD)
+
+
+@pytest.fixture
+def api_client(user):
+    """Client of the application authenticated as `user` with a Bearer token"""
+    client = TestClient(create_app())
+    token = create_access_token(data=user_token_claims(user))
+    client.headers["Authorization"] = f"Bearer {token}"
+    return client
@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.crud.auth import login_user
+from app.db.models import (
+    AccountDeletion,
+    ActivityLog,
+    ArchivedTask,
+    RefreshToken,
+    SyncTombstone,
+    Task,
+    User,
+)
+from app.schemas.tasks import TaskCreateData
+from app.services.archive_service import ArchiveService
+from app.services.category_service import CategoryService
+from app.services.task_service import TaskService
+from app.services.user_service import UserService
+from tests.conftest import PASSWORD
+
+
+def fill_account(db, user):
+    """Gives the user tasks, an archived task, a tombstone, a log entry and a session"""
+    category = CategoryService.create_category(db, f"Category {user.id}")
+    for number in range(3):
+        TaskService.create_task(
+            db,
+            user.id,
+            TaskCreateData(title=f"Task {number}", categories=[category.id]),
+        )
+    TaskService.create_task(
+        db, user.id, TaskCreateData(title="Done", status="выполнена")
+    )
+    ArchiveService.archive_completed_batch(db, datetime.now() + timedelta(days=1), 10)
+    removed = TaskService.create_task(db, user.id, TaskCreateData(title="Removed"))
+    TaskService.delete_task(db, user.id, removed.id)
+    db.add(
+        ActivityLog(
+            user_id=user.id,
+            entity="task",
+            entity_id=removed.id,
+            action="deleted",
+            created_at=datetime.now(),
+        )
+    )
+    db.commit()
+    login_user(user.email, PASSWORD)
+
+
+def rows_of(db, user_id):
+    db.expire_all()
+    return {
+        model.__name__: db.query(model).filter_by(user_id=user_id).count()
+        for model in (Task, ArchivedTask, SyncTombstone, ActivityLog, RefreshToken)
+    }
+
+
+def purge_all(db, batch_size):
+    batches = 0
+    while UserService.purge_deleted_user_batch(db, batch_size):
+        batches += 1
+    return batches
+
+
+def test_deleted_account_is_hidden_at_once(db, user):
+    email = user.email
+
+    UserService.delete_user(db, user.id)
+    db.commit()
+
+    assert user.deleted_at is not None
+    assert user.email != email
+    assert [deletion.user_id for deletion in UserService.get_pending_deletions(db)] == [
+        user.id
+    ]
+    with pytest.raises(ValueError):
+        UserService.delete_user(db, user.id)
+
+
+def test_purge_removes_everything_of_the_account(db, user, other_user):
+    user_id = user.id
+    fill_account(db, user)
+    fill_account(db, other_user)
+    kept = rows_of(db, other_user.id)
+
+    UserService.delete_user(db, user_id)
+    db.commit()
+    purge_all(db, batch_size=2)
+
+    assert rows_of(db, user_id) == dict.fromkeys(kept, 0)
+    assert db.get(User, user_id) is None
+    assert rows_of(db, other_user.id) == kept
+
+
+def test_purge_works_in_batches_and_records_progress(db, user):
+    user_id = user.id
+    fill_account(db, user)
+    UserService.delete_user(db, user_id)
+    db.commit()
+
+    assert UserService.purge_deleted_user_batch(db, batch_size=2)
+    deletion = db.get(AccountDeletion, user_id)
+    assert deletion.tasks_purged == 2
+    assert deletion.links_purged == 2
+    assert deletion.finished_at is None
+
+    purge_all(db, batch_size=2)
+    db.expire_all()
+    deletion = db.get(AccountDeletion, user_id)
+    # Three active tasks and the archived one
+    assert deletion.tasks_purged == 4
+    assert deletion.finished_at is not None
+    assert UserService.get_pending_deletions(db) == []
+    assert not UserService.purge_deleted_user_batch(db, batch_size=2)
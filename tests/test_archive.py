@@ -0,0 +1,113 @@
+import csv
+import io
+from datetime import datetime, timedelta
+
+from app.db.models import ArchivedTask, Task
+from app.schemas.tasks import TaskCreateData
+from app.services import archive_service
+from app.services.archive_service import ArchiveService
+from app.services.category_service import CategoryService
+from app.services.sync_service import SyncService
+from app.services.task_service import TaskService
+
+COMPLETED = "выполнена"
+
+
+def create_task(db, user, title, status=COMPLETED, **fields):
+    return TaskService.create_task(
+        db, user.id, TaskCreateData(title=title, status=status, **fields)
+    )
+
+
+def archive_all(db, batch_size=100):
+    return ArchiveService.archive_completed_batch(
+        db, datetime.now() + timedelta(days=1), batch_size
+    )
+
+
+def test_only_old_completed_tasks_are_archived(db, user):
+    done = create_task(db, user, "Done")
+    create_task(db, user, "Open", status="не выполнена")
+
+    assert ArchiveService.archive_completed_batch(db, done.updated_at, 100) == 0
+    assert archive_all(db) == 1
+
+    db.expire_all()
+    assert [task.title for task in db.query(Task)] == ["Open"]
+    assert [task.title for task in db.query(ArchivedTask)] == ["Done"]
+
+
+def test_archived_task_keeps_its_fields_and_categories(db, user):
+    category = CategoryService.create_category(db, "Work")
+    done = create_task(
+        db, user, "Done", description="Details", categories=[category.id]
+    )
+    task_id, updated_at = done.id, done.updated_at
+
+    archive_all(db)
+
+    db.expire_all()
+    archived = db.get(ArchivedTask, task_id)
+    assert archived.user_id == user.id
+    assert archived.description == "Details"
+    assert archived.updated_at == updated_at
+    assert [item.title for item in archived.categories] == ["work"]
+
+
+def test_archiving_goes_in_batches(db, user):
+    for number in range(3):
+        create_task(db, user, f"Done {number}")
+
+    assert archive_all(db, batch_size=2) == 2
+    assert archive_all(db, batch_size=2) == 1
+    assert archive_all(db, batch_size=2) == 0
+
+
+def test_archived_task_leaves_delta_sync_as_deleted(db, user):
+    done = create_task(db, user, "Done")
+    since, task_id = done.version, done.id
+
+    archive_all(db)
+    changes = SyncService.get_changes(db, user.id, since, 100)
+
+    assert changes.deleted_tasks == [task_id]
+
+
+def test_archive_search_is_per_user_and_case_insensitive(db, user, other_user):
+    create_task(db, user, "Quarterly Report")
+    create_task(db, user, "Groceries")
+    create_task(db, other_user, "Report of Olga")
+    archive_all(db)
+
+    tasks, total = ArchiveService.search_archived_tasks(db, user.id, "report")
+    everything, everything_total = ArchiveService.search_archived_tasks(db, user.id)
+
+    assert [task.title for task in tasks] == ["Quarterly Report"]
+    assert total == 1
+    assert everything_total == 2
+    assert [task.title for task in everything] == ["Groceries", "Quarterly Report"]
+
+
+def test_archive_is_iterated_in_chunks(db, user, monkeypatch):
+    monkeypatch.setattr(archive_service, "EXPORT_CHUNK_SIZE", 2)
+    titles = [f"Done {number}" for number in range(5)]
+    for title in titles:
+        create_task(db, user, title)
+    archive_all(db)
+
+    exported = ArchiveService.iter_archived_tasks(db, user.id)
+
+    assert [task.title for task in exported] == titles
+
+
+def test_archive_export_api_returns_csv(db, user, api_client):
+    create_task(db, user, "Quarterly Report")
+    create_task(db, user, "Groceries")
+    archive_all(db)
+
+    response = api_client.get("/api/v1/archive/tasks/export", params={"q": "report"})
+    rows = list(csv.DictReader(io.StringIO(response.text.lstrip("\ufeff"))))
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert [row["title"] for row in rows] == ["Quarterly Report"]
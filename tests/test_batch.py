@@ -0,0 +1,71 @@
+from app.db.models import Task
+from app.schemas.tasks import TaskCreateData
+from app.services.task_service import TaskService
+
+
+def run_batch(api_client, operations, atomic=False):
+    response = api_client.post(
+        "/api/v1/tasks/batch", json={"operations": operations, "atomic": atomic}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def create(title):
+    return {"op": "create", "data": {"title": title}}
+
+
+def task_titles(db, user):
+    db.expire_all()
+    return sorted(task.title for task in db.query(Task).filter_by(user_id=user.id))
+
+
+def test_failed_operation_does_not_undo_the_others(db, user, api_client):
+    body = run_batch(
+        api_client,
+        [create("First"), {"op": "status", "id": 999999, "status": "выполнена"}],
+    )
+
+    assert [result["status"] for result in body["results"]] == [201, 404]
+    assert [result["index"] for result in body["results"]] == [0, 1]
+    assert body["committed"] is True
+    assert task_titles(db, user) == ["First"]
+
+
+def test_atomic_batch_commits_nothing_on_failure(db, user, api_client):
+    body = run_batch(
+        api_client,
+        [create("First"), {"op": "delete", "id": 999999}, create("Second")],
+        atomic=True,
+    )
+
+    assert [result["status"] for result in body["results"]] == [201, 404, 201]
+    assert body["committed"] is False
+    assert task_titles(db, user) == []
+
+
+def test_operations_see_earlier_operations_of_the_batch(db, user, api_client):
+    created = run_batch(api_client, [create("First")])["results"][0]["task"]
+
+    body = run_batch(
+        api_client,
+        [
+            {"op": "status", "id": created["id"], "status": "выполнена"},
+            {"op": "delete", "id": created["id"]},
+        ],
+    )
+
+    assert [result["status"] for result in body["results"]] == [200, 204]
+    assert task_titles(db, user) == []
+
+
+def test_version_of_failed_operation_is_not_reused(db, user, api_client):
+    existing = TaskService.create_task(db, user.id, TaskCreateData(title="Taken"))
+
+    # The duplicate takes a version in its savepoint, which is rolled back
+    body = run_batch(api_client, [create("Taken"), create("Fresh")])
+    later = TaskService.create_task(db, user.id, TaskCreateData(title="Later"))
+
+    assert body["results"][0]["status"] >= 400
+    fresh = body["results"][1]["task"]
+    assert existing.version < fresh["version"] < later.version
@@ -0,0 +1,89 @@
+import pytest
+
+from app.db.models import Category, Task
+from app.schemas.tasks import TaskCreateData
+from app.services.category_service import CategoryService
+from app.services.sync_service import SyncService
+from app.services.task_service import TaskService
+
+
+def task_category_ids(db, task_id):
+    db.expire_all()
+    return sorted(category.id for category in db.get(Task, task_id).categories)
+
+
+def test_bulk_create_skips_existing_and_repeated_titles(db):
+    CategoryService.create_category(db, "Work")
+
+    created, existing = CategoryService.create_categories(
+        db, ["Home", "Work", "Home", " "]
+    )
+
+    assert [category.title for category in created] == ["home"]
+    assert existing == ["work"]
+    assert db.query(Category).count() == 2
+
+
+def test_bulk_create_requires_a_title(db):
+    with pytest.raises(ValueError):
+        CategoryService.create_categories(db, ["", "  "])
+
+
+def test_bulk_delete_reports_missing_ids(db, user):
+    created, _ = CategoryService.create_categories(db, ["Work", "Home"])
+    work, home = created
+
+    deleted, missing = CategoryService.delete_categories_list(
+        db, [work.id, 999999, work.id]
+    )
+
+    assert deleted == [work.id]
+    assert missing == [999999]
+    assert [category.id for category in db.query(Category)] == [home.id]
+
+
+def test_bulk_delete_resends_linked_tasks(db, user):
+    created, _ = CategoryService.create_categories(db, ["Work", "Home"])
+    work, home = created
+    task = TaskService.create_task(
+        db, user.id, TaskCreateData(title="Report", categories=[work.id, home.id])
+    )
+    since = task.version
+
+    CategoryService.delete_categories_list(db, [work.id])
+    changes = SyncService.get_changes(db, user.id, since, 100)
+
+    assert changes.deleted_categories == [work.id]
+    assert [changed.id for changed in changes.tasks] == [task.id]
+    assert task_category_ids(db, task.id) == [home.id]
+
+
+def test_merge_moves_links_without_duplicates(db, user):
+    created, _ = CategoryService.create_categories(db, ["Work", "Job", "Home"])
+    work, job, home = created
+    both = TaskService.create_task(
+        db, user.id, TaskCreateData(title="Both", categories=[work.id, job.id])
+    )
+    source_only = TaskService.create_task(
+        db, user.id, TaskCreateData(title="Source", categories=[job.id])
+    )
+    since = source_only.version
+
+    moved = CategoryService.merge_categories(db, [job.id], work.id)
+    changes = SyncService.get_changes(db, user.id, since, 100)
+
+    assert moved == 1
+    assert task_category_ids(db, both.id) == [work.id]
+    assert task_category_ids(db, source_only.id) == [work.id]
+    assert db.get(Category, job.id) is None
+    assert changes.deleted_categories == [job.id]
+    assert sorted(task.id for task in changes.tasks) == [both.id, source_only.id]
+    assert db.get(Category, home.id) is not None
+
+
+@pytest.mark.parametrize("sources", [[1], [999999]])
+def test_merge_rejects_invalid_categories(db, sources):
+    CategoryService.create_category(db, "Work")
+
+    with pytest.raises(ValueError):
+        CategoryService.merge_categories(db, sources, 1)
@@ -0,0 +1,85 @@
+import pytest
+from sqlalchemy.orm import Session
+
+from app.db import invalidation
+from app.db.database import EXTERNAL_TRANSACTION_KEY, get_engine
+from app.db.invalidation import ALL_KEYS, InMemoryBackend, InvalidationBus
+from app.schemas.tasks import TaskCreateData
+from app.services.task_service import TaskService
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    """Bus of the test with no subscribers left over from other tests"""
+    bus = InvalidationBus(InMemoryBackend())
+    monkeypatch.setattr(invalidation, "invalidation_bus", bus)
+    return bus
+
+
+@pytest.fixture
+def events(bus):
+    received = []
+    bus.subscribe("tasks", received.append)
+    return received
+
+
+def test_events_are_dispatched_after_commit(db, bus, events):
+    bus.publish(db, "tasks", 7)
+    assert events == []
+
+    db.commit()
+    assert events == ["7"]
+
+
+def test_events_of_rolled_back_transaction_are_dropped(db, bus, events):
+    bus.publish(db, "tasks", 7)
+    db.rollback()
+    db.commit()
+
+    assert events == []
+
+
+def test_service_write_publishes_task_change(db, user, events):
+    task = TaskService.create_task(db, user.id, TaskCreateData(title="Report"))
+
+    assert events == [f"{user.id}:{task.id}:changed:{task.version}"]
+
+
+def test_external_transaction_defers_events_to_owner(db, bus, events):
+    with get_engine().connect() as connection:
+        transaction = connection.begin()
+        session = Session(
+            bind=connection,
+            join_transaction_mode="create_savepoint",
+            info={EXTERNAL_TRANSACTION_KEY: True},
+        )
+        bus.publish(session, "tasks", 7)
+        session.commit()
+        assert events == []
+
+        transaction.commit()
+        bus.dispatch_deferred(session)
+        session.close()
+
+    assert events == ["7"]
+
+
+def test_failing_subscriber_does_not_stop_the_others(bus, events):
+    def fail(key):
+        raise RuntimeError(key)
+
+    bus.subscribe("categories", fail)
+    bus.subscribe("categories", events.append)
+
+    bus.dispatch("categories", "3")
+    assert events == ["3"]
+
+
+def test_dispatch_all_invalidates_every_topic(bus, events):
+    categories = []
+    bus.subscribe("categories", categories.append)
+
+    bus.dispatch_all()
+
+    assert events == [ALL_KEYS]
+    assert categories == [ALL_KEYS]
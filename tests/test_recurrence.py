@@ -0,0 +1,155 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.db.models import TaskOccurrence
+from app.schemas.tasks import OccurrenceUpdateData, TaskCreateData
+from app.services.recurrence_service import (
+    RecurrenceService,
+    is_occurrence,
+    occurrence_dates,
+)
+from app.services.task_service import TaskService
+
+START = datetime(2030, 1, 31, 9, 0)
+
+
+def dates(rule, interval, window_start, window_end, until=None):
+    return list(
+        occurrence_dates(START, rule, interval, window_start, window_end, until)
+    )
+
+
+def test_daily_occurrences_with_interval():
+    assert dates("ежедневно", 2, START, START + timedelta(days=6)) == [
+        START,
+        START + timedelta(days=2),
+        START + timedelta(days=4),
+    ]
+
+
+def test_window_far_from_start_begins_at_first_occurrence_in_it():
+    window_start = START + timedelta(weeks=520, hours=1)
+
+    assert dates("еженедельно", 1, window_start, window_start + timedelta(weeks=2)) == [
+        START + timedelta(weeks=521),
+        START + timedelta(weeks=522),
+    ]
+
+
+def test_monthly_occurrences_are_clamped_to_month_length():
+    assert dates("ежемесячно", 1, START, datetime(2030, 5, 1)) == [
+        START,
+        datetime(2030, 2, 28, 9, 0),
+        datetime(2030, 3, 31, 9, 0),
+        datetime(2030, 4, 30, 9, 0),
+    ]
+
+
+def test_occurrences_stop_after_until():
+    until = START + timedelta(days=2, hours=1)
+
+    assert dates("ежедневно", 1, START, START + timedelta(days=10), until) == [
+        START,
+        START + timedelta(days=1),
+        START + timedelta(days=2),
+    ]
+
+
+def test_occurrences_before_start_are_not_produced():
+    assert dates("ежедневно", 1, START - timedelta(days=5), START) == []
+
+
+@pytest.mark.parametrize(
+    "recurrence, interval, until",
+    [
+        ("каждый час", 1, None),
+        ("ежедневно", 366, None),
+        ("ежедневно", 1, "2029-01-01"),
+        ("ежедневно", 1, "01.01.2031"),
+    ],
+)
+def test_invalid_rules_are_rejected(recurrence, interval, until):
+    with pytest.raises(ValueError):
+        RecurrenceService.validate_rule(recurrence, interval, until, START)
+
+
+@pytest.fixture
+def weekly_task(db, user):
+    return TaskService.create_task(
+        db,
+        user.id,
+        TaskCreateData(title="Review", deadline=START, recurrence="еженедельно"),
+    )
+
+
+def test_occurrences_of_user_tasks_in_window(db, user, other_user, weekly_task):
+    window_end = START + timedelta(weeks=3)
+
+    occurrences = RecurrenceService.get_occurrences(db, user.id, START, window_end)
+    foreign = RecurrenceService.get_occurrences(db, other_user.id, START, window_end)
+
+    assert [occurrence.deadline for occurrence in occurrences] == [
+        START,
+        START + timedelta(weeks=1),
+        START + timedelta(weeks=2),
+    ]
+    assert not any(occurrence.stored for occurrence in occurrences)
+    assert foreign == []
+
+
+def test_updated_occurrence_is_stored_until_changed_back(db, user, weekly_task):
+    moment = START + timedelta(weeks=1)
+    window_end = START + timedelta(weeks=3)
+
+    RecurrenceService.update_occurrence(
+        db, user.id, weekly_task.id, moment, OccurrenceUpdateData(status="выполнена")
+    )
+    occurrences = RecurrenceService.get_occurrences(db, user.id, START, window_end)
+
+    assert [occurrence.status for occurrence in occurrences] == [
+        "не выполнена",
+        "выполнена",
+        "не выполнена",
+    ]
+    assert db.query(TaskOccurrence).count() == 1
+
+    RecurrenceService.update_occurrence(
+        db,
+        user.id,
+        weekly_task.id,
+        moment,
+        OccurrenceUpdateData(status="не выполнена"),
+    )
+    assert db.query(TaskOccurrence).count() == 0
+
+
+def test_occurrence_moved_into_window_is_returned(db, user, weekly_task):
+    moment = START + timedelta(weeks=4)
+    moved_to = START + timedelta(days=1)
+
+    RecurrenceService.update_occurrence(
+        db, user.id, weekly_task.id, moment, OccurrenceUpdateData(deadline=moved_to)
+    )
+    occurrences = RecurrenceService.get_occurrences(
+        db, user.id, START, START + timedelta(days=2)
+    )
+
+    assert [(item.occurs_at, item.deadline) for item in occurrences] == [
+        (START, START),
+        (moment, moved_to),
+    ]
+
+
+def test_moment_off_the_rule_is_not_an_occurrence(db, user, weekly_task):
+    moment = START + timedelta(days=3)
+    assert not is_occurrence(weekly_task, moment)
+
+    with pytest.raises(ValueError):
+        RecurrenceService.update_occurrence(
+            db,
+            user.id,
+            weekly_task.id,
+            moment,
+            OccurrenceUpdateData(status="выполнена"),
+        )
@@ -0,0 +1,58 @@
+from passlib.context import CryptContext
+
+from app.crud.auth import login_user
+from app.crud.security import (
+    BCRYPT_ROUNDS,
+    hash_password,
+    verify_and_update_password,
+)
+from app.db.models import User
+from tests.conftest import PASSWORD
+
+
+def bcrypt_rounds(hashed: str) -> int:
+    return int(hashed.split("$")[2])
+
+
+def hash_with_rounds(password: str, rounds: int) -> str:
+    return CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=rounds).hash(
+        password
+    )
+
+
+def test_hash_uses_configured_rounds():
+    assert bcrypt_rounds(hash_password(PASSWORD)) == BCRYPT_ROUNDS
+
+
+def test_current_hash_is_not_rehashed():
+    verified, new_hash = verify_and_update_password(PASSWORD, hash_password(PASSWORD))
+
+    assert verified
+    assert new_hash is None
+
+
+def test_hash_with_other_rounds_is_rehashed():
+    old_hash = hash_with_rounds(PASSWORD, BCRYPT_ROUNDS + 1)
+
+    verified, new_hash = verify_and_update_password(PASSWORD, old_hash)
+
+    assert verified
+    assert bcrypt_rounds(new_hash) == BCRYPT_ROUNDS
+
+
+def test_wrong_password_is_not_rehashed():
+    old_hash = hash_with_rounds(PASSWORD, BCRYPT_ROUNDS + 1)
+
+    assert verify_and_update_password("wrong-password", old_hash) == (False, None)
+
+
+def test_login_stores_rehashed_password(db, user):
+    user.password = hash_with_rounds(PASSWORD, BCRYPT_ROUNDS + 1)
+    db.commit()
+
+    login_user(user.email, PASSWORD)
+
+    db.expire_all()
+    stored = db.get(User, user.id).password
+    assert bcrypt_rounds(stored) == BCRYPT_ROUNDS
+    assert verify_and_update_password(PASSWORD, stored) == (True, None)
@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy import text
+
+from app.db import slow_queries
+from app.db.database import get_engine
+from app.db.slow_queries import SlowQueryLog, fingerprint, parameter_shapes
+from app.services.task_service import TaskService
+
+STATEMENT = "SELECT tasks.id FROM tasks WHERE tasks.user_id = ? AND tasks.id IN (?, ?)"
+
+
+@pytest.fixture
+def log(monkeypatch):
+    """Log of the test that captures plans at once instead of in the background"""
+    log = SlowQueryLog(threshold_ms=200)
+    monkeypatch.setattr(log, "_submit", lambda function, *args: function(*args))
+    return log
+
+
+def test_fingerprint_hides_literals_and_list_lengths():
+    short = "SELECT * FROM tasks WHERE title = 'a' AND id IN (?, ?)"
+    long = "SELECT * FROM tasks WHERE title = 'b' AND id IN (?, ?, ?, ?)"
+
+    assert fingerprint(short) == fingerprint(long)
+    assert (
+        fingerprint(short) == "SELECT * FROM tasks WHERE title = ? AND id IN (?, ...)"
+    )
+    assert fingerprint("SELECT 1 LIMIT 10") == "SELECT ? LIMIT ?"
+
+
+def test_parameter_shapes_never_contain_values():
+    shapes = parameter_shapes({"title": "secret", "id": 7})
+    many = parameter_shapes([("secret", 1), ("other", 2)], executemany=True)
+
+    assert shapes == {"title": "str[6]", "id": "int"}
+    assert many == {"rows": 2, "first": ["str[6]", "int"]}
+
+
+def test_statements_are_aggregated_by_fingerprint(db, log):
+    engine = get_engine()
+    log.record(engine, STATEMENT, (1, 2, 3), False, 300)
+    log.record(engine, STATEMENT.replace("?, ?", "?, ?, ?"), (1, 2, 3, 4), False, 500)
+
+    [entry] = log.entries()
+    assert entry["count"] == 2
+    assert entry["total_ms"] == 800
+    assert entry["max_ms"] == 500
+    assert "SCAN" in entry["plan"] or "SEARCH" in entry["plan"]
+
+
+def test_least_recently_seen_statements_are_forgotten(db, log):
+    log.max_fingerprints = 2
+    engine = get_engine()
+    for table in ("tasks", "categories", "users"):
+        log.record(engine, f"SELECT id FROM {table}", (), False, 300)
+
+    assert sorted(entry["statement"] for entry in log.entries()) == [
+        "SELECT id FROM categories",
+        "SELECT id FROM users",
+    ]
+
+
+def test_explained_write_changes_nothing(db, user, log):
+    log.record(get_engine(), "DELETE FROM users WHERE id > ?", (0,), False, 300)
+
+    assert log.entries()[0]["plan"]
+    assert db.execute(text("SELECT count(*) FROM users")).scalar() == 1
+
+
+def test_slow_statement_is_recorded_with_its_service(db, user, log, monkeypatch):
+    log.threshold_ms = 0.000001
+    log.explain = "off"
+    monkeypatch.setattr(slow_queries, "slow_query_log", log)
+
+    TaskService.get_all_user_tasks(db, user.id)
+
+    sources = {entry["source"] for entry in log.entries()}
+    assert "services/task_service.py:get_all_user_tasks" in sources
@@ -0,0 +1,94 @@
+from app.schemas.tasks import TaskCreateData
+from app.services.category_service import CategoryService
+from app.services.sync_service import SyncService
+from app.services.task_service import TaskService
+
+
+def create_task(db, user, title, **fields):
+    return TaskService.create_task(db, user.id, TaskCreateData(title=title, **fields))
+
+
+def test_full_sync_returns_only_own_tasks(db, user, other_user):
+    first = create_task(db, user, "First")
+    second = create_task(db, user, "Second")
+    create_task(db, other_user, "Foreign")
+
+    changes = SyncService.get_changes(db, user.id, 0, 100)
+
+    assert [task.id for task in changes.tasks] == [first.id, second.id]
+    assert changes.version == second.version
+    assert not changes.has_more
+
+
+def test_sync_since_version_returns_only_later_changes(db, user):
+    first = create_task(db, user, "First")
+    second = create_task(db, user, "Second")
+    since = second.version
+
+    TaskService.update_task_description(db, user.id, first.id, "Changed")
+    changes = SyncService.get_changes(db, user.id, since, 100)
+
+    assert [task.id for task in changes.tasks] == [first.id]
+    assert changes.version > since
+
+
+def test_sync_without_changes_keeps_version(db, user):
+    task = create_task(db, user, "First")
+
+    changes = SyncService.get_changes(db, user.id, task.version, 100)
+
+    assert changes.version == task.version
+    assert changes.tasks == []
+
+
+def test_deleted_task_is_synced_as_tombstone(db, user, other_user):
+    task = create_task(db, user, "First")
+    since = task.version
+    task_id = task.id
+
+    TaskService.delete_task(db, user.id, task_id)
+    changes = SyncService.get_changes(db, user.id, since, 100)
+    foreign = SyncService.get_changes(db, other_user.id, since, 100)
+
+    assert changes.deleted_tasks == [task_id]
+    assert changes.tasks == []
+    assert foreign.deleted_tasks == []
+
+
+def test_removed_category_link_is_synced_as_tombstone(db, user):
+    category = CategoryService.create_category(db, "Work")
+    task = create_task(db, user, "First", categories=[category.id])
+    since = task.version
+
+    changes = SyncService.get_changes(db, user.id, 0, 100)
+    assert changes.links == [(task.id, category.id)]
+
+    TaskService.update_task_categories(db, user.id, task.id, [])
+    changes = SyncService.get_changes(db, user.id, since, 100)
+
+    assert changes.deleted_links == [(task.id, category.id)]
+    assert [changed.id for changed in changes.tasks] == [task.id]
+
+
+def test_changes_are_paged_by_version(db, user):
+    tasks = [create_task(db, user, f"Task {number}") for number in range(3)]
+
+    first_page = SyncService.get_changes(db, user.id, 0, 2)
+    second_page = SyncService.get_changes(db, user.id, first_page.version, 2)
+
+    assert [task.id for task in first_page.tasks] == [tasks[0].id, tasks[1].id]
+    assert first_page.has_more
+    assert [task.id for task in second_page.tasks] == [tasks[2].id]
+    assert not second_page.has_more
+
+
+def test_sync_api_serializes_changes(db, user, api_client):
+    task = create_task(db, user, "First")
+    since = task.version
+    TaskService.delete_task(db, user.id, task.id)
+
+    body = api_client.get("/api/v1/sync/changes", params={"since": since}).json()
+
+    assert body["deleted"]["tasks"] == [task.id]
+    assert body["version"] > since
+    assert body["has_more"] is False
@@ -0,0 +1,62 @@
+import pytest
+
+from app.web import throttling
+from app.web.throttling import TokenBucketLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic clock of the limiters that only moves when the test says so"""
+    now = [1000.0]
+    monkeypatch.setattr(throttling.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_bucket_allows_up_to_capacity(clock):
+    limiter = TokenBucketLimiter("test", rate=1, capacity=3)
+
+    assert [limiter.allow("key") for _ in range(4)] == [True, True, True, False]
+    assert limiter.stats()["allowed"] == 3
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_bucket_refills_with_time(clock):
+    limiter = TokenBucketLimiter("test", rate=0.5, capacity=2)
+    limiter.allow("key")
+    limiter.allow("key")
+
+    clock[0] += 1
+    assert not limiter.allow("key")
+    clock[0] += 1
+    assert limiter.allow("key")
+
+
+def test_bucket_never_exceeds_capacity(clock):
+    limiter = TokenBucketLimiter("test", rate=1, capacity=2)
+    limiter.allow("key")
+
+    clock[0] += 3600
+    assert [limiter.allow("key") for _ in range(3)] == [True, True, False]
+
+
+def test_keys_have_separate_buckets(clock):
+    limiter = TokenBucketLimiter("test", rate=1, capacity=1)
+
+    assert limiter.allow("first")
+    assert not limiter.allow("first")
+    assert limiter.allow("second")
+
+
+def test_least_recently_used_keys_are_evicted(clock):
+    limiter = TokenBucketLimiter("test", rate=1, capacity=1, max_keys=2)
+    limiter.allow("first")
+    limiter.allow("second")
+    limiter.allow("first")
+    limiter.allow("third")
+
+    stats = limiter.stats()
+    assert stats["evicted"] == 1
+    assert stats["tracked_keys"] == 2
+    # The evicted key starts over with a full bucket
+    assert limiter.allow("second")
+    assert not limiter.allow("third")
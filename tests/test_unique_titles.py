@@ -0,0 +1,51 @@
+import pytest
+
+from app.db.models import Task
+from app.schemas.tasks import TaskCreateData
+from app.services.task_service import TaskService
+
+
+def create_task(db, user, title):
+    return TaskService.create_task(db, user.id, TaskCreateData(title=title))
+
+
+def test_duplicate_title_is_rejected(db, user):
+    create_task(db, user, "Report")
+
+    with pytest.raises(ValueError, match="уже существует"):
+        create_task(db, user, "  Report ")
+    assert db.query(Task).count() == 1
+
+
+def test_rejected_duplicate_leaves_session_usable(db, user):
+    create_task(db, user, "Report")
+    with pytest.raises(ValueError):
+        create_task(db, user, "Report")
+
+    assert create_task(db, user, "Summary").title == "Summary"
+
+
+def test_users_may_share_a_title(db, user, other_user):
+    create_task(db, user, "Report")
+
+    assert create_task(db, other_user, "Report").user_id == other_user.id
+
+
+def test_renaming_to_taken_title_is_rejected(db, user, api_client):
+    create_task(db, user, "Report")
+    task = create_task(db, user, "Summary")
+
+    response = api_client.patch(f"/api/v1/tasks/{task.id}", json={"title": "Report"})
+
+    assert response.status_code == 400
+    assert "уже существует" in response.json()["detail"]
+    db.expire_all()
+    assert db.get(Task, task.id).title == "Summary"
+
+
+def test_api_create_of_duplicate_is_rejected(db, user, api_client):
+    create_task(db, user, "Report")
+
+    response = api_client.post("/api/v1/tasks", json={"title": "Report"})
+
+    assert response.status_code == 400